@@ -0,0 +1,251 @@
+"""Benchmark the GSI poll path against the software scanner simulator.
+
+Each call to UnidenScanner.update_scanner_state("pull") is split into the
+stages below and timed separately, so you can see where a dashboard refresh
+spends its time:
+
+    send_command  writing the GSI command to the port
+    read          _read_response_frame() and _read_frame() calls
+    xml_parse     parse_response(), splitting and parsing the xml blocks
+    state_copy    new_scan_state() template copies
+    merge         merging the parsed response into scan_state
+    total         the whole update_scanner_state() call
+
+Usage:
+    Run from the repository root::
+
+        python -m benchmarks.gsi_poll --polls 1000
+        python -m benchmarks.gsi_poll --baudrate 115200 --json bench.json
+        python -m benchmarks.gsi_poll --baseline bench.json --tolerance 0.25
+
+Notes:
+    - baudrate 0 (the default) delivers simulator replies instantly so the
+        numbers are pure CPU cost; use 115200 to include wire time.
+    - allocations are measured in a second pass with tracemalloc running,
+        because tracing slows everything else down.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+import scanner.uniden as uniden
+from scanner.simulator import SimulatedSerial
+
+STAGES = ("send_command", "read", "xml_parse", "state_copy", "merge", "total")
+
+
+class StageTimer:
+    """Collects exclusive time per stage for every poll.
+
+    Wrapped functions that call other wrapped functions only get charged for
+    their own time, e.g. xml_parse doesn't include the reads made
+    from inside get_gsi_response.
+    """
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+        self._poll = None
+        self._child_time = []
+
+    def start_poll(self):
+        self._poll = dict.fromkeys(STAGES, 0.0)
+
+    def end_poll(self):
+        for stage, elapsed in self._poll.items():
+            self.samples[stage].append(elapsed)
+        self._poll = None
+
+    def wrap(self, stage, func, inclusive=False):
+        """Return func wrapped so its run time is charged to stage.
+
+        Args:
+            stage (str): name of the stage to charge
+            func (callable): function to time
+            inclusive (bool): charge the time of wrapped callees as well
+        """
+
+        def timed(*args, **kwargs):
+            self._child_time.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self._child_time.pop()
+                if self._child_time:
+                    self._child_time[-1] += elapsed
+                if inclusive:
+                    children = 0.0
+                if self._poll is not None:
+                    self._poll[stage] += elapsed - children
+
+        return timed
+
+
+def percentile(samples, pct):
+    """Percentile of a list of samples (nearest rank)."""
+
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def build_scanner(args):
+    """Scanner instance connected to a fresh simulator."""
+
+    sim = SimulatedSerial(
+        baudrate=args.baudrate,
+        timeout=3.1,
+        latency=args.latency,
+        jitter=args.jitter,
+        seed=args.seed,
+    )
+    return uniden.UnidenScanner(serial_port=sim)
+
+
+def time_polls(args):
+    """Timed pass. Returns {stage: {"p50": ms, "p99": ms, "mean": ms}}."""
+
+    s = build_scanner(args)
+    timer = StageTimer()
+
+    # instance attributes shadow the methods, so only this scanner is affected
+    s.send_command = timer.wrap("send_command", s.send_command)
+    s._read_response_frame = timer.wrap("read", s._read_response_frame)
+    s._read_frame = timer.wrap("read", s._read_frame)
+    s.merge_scan_state = timer.wrap("merge", s.merge_scan_state)
+    update_scanner_state = timer.wrap("total", s.update_scanner_state, True)
+
+    # module functions are looked up at call time
+    parse_response = uniden.parse_response
+    uniden.parse_response = timer.wrap("xml_parse", parse_response)
+    new_scan_state = uniden.new_scan_state
+    uniden.new_scan_state = timer.wrap("state_copy", new_scan_state)
+
+    try:
+        for _ in range(args.warmup):
+            s.update_scanner_state("pull")
+
+        for _ in range(args.polls):
+            timer.start_poll()
+            if update_scanner_state("pull") is False:
+                raise RuntimeError("update_scanner_state() failed")
+            timer.end_poll()
+    finally:
+        uniden.new_scan_state = new_scan_state
+        uniden.parse_response = parse_response
+        s.close()
+
+    results = {}
+    for stage, samples in timer.samples.items():
+        results[stage] = {
+            "p50": percentile(samples, 50) * 1000,
+            "p99": percentile(samples, 99) * 1000,
+            "mean": statistics.fmean(samples) * 1000,
+        }
+
+    return results
+
+
+def measure_allocations(args):
+    """Allocation pass. Returns peak traced KiB and retained blocks per poll."""
+
+    s = build_scanner(args)
+    polls = max(args.polls // 10, 10)
+
+    for _ in range(args.warmup):
+        s.update_scanner_state("pull")
+
+    peaks = []
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for _ in range(polls):
+            tracemalloc.reset_peak()
+            current, peak = tracemalloc.get_traced_memory()
+            s.update_scanner_state("pull")
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+        s.close()
+    blocks_after = sys.getallocatedblocks()
+
+    return {
+        "peak_kib": statistics.fmean(peaks) / 1024,
+        "retained_blocks": (blocks_after - blocks_before) / polls,
+    }
+
+
+def check_regressions(results, baseline, tolerance):
+    """List stages whose p99 got slower than baseline by more than tolerance."""
+
+    regressions = []
+    for stage, numbers in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or old["p99"] <= 0:
+            continue
+        if numbers["p99"] > old["p99"] * (1 + tolerance):
+            regressions.append(
+                f"{stage}: p99 {numbers['p99']:.3f} ms vs baseline {old['p99']:.3f} ms"
+            )
+
+    return regressions
+
+
+def print_report(results):
+    print(f"{'stage':<14}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    print("-" * 44)
+    for stage, numbers in results["stages"].items():
+        print(
+            f"{stage:<14}{numbers['p50']:>10.3f}"
+            f"{numbers['p99']:>10.3f}{numbers['mean']:>10.3f}"
+        )
+    allocs = results["allocations"]
+    print("-" * 44)
+    print(f"peak allocation per poll: {allocs['peak_kib']:.1f} KiB")
+    print(f"retained blocks per poll: {allocs['retained_blocks']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--baudrate", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=str, help="write results to this file")
+    parser.add_argument("--baseline", type=str, help="results file to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = {
+        "polls": args.polls,
+        "baudrate": args.baudrate,
+        "stages": time_polls(args),
+        "allocations": measure_allocations(args),
+    }
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = check_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -139,6 +139,9 @@ class UpdateScreen:
         Logger.info("clearing the buffer")
         scanner.reset_port()
 
+        # have the scanner push its state instead of polling with GSI
+        scanner.start_push_updates(interval=int(refresh_time * 1000))
+
         # start the screen update process
         Clock.schedule_interval(self.update_screen, refresh_time)
 
@@ -149,6 +152,8 @@ class UpdateScreen:
         # stop updating screen with clock
         Clock.unschedule(self.update_screen)
 
+        scanner.stop_push_updates()
+
     def update_screen(self, dt):
         """When called this method updates the internal scanner state and then
         dispatches data to the appropriate window handler.
@@ -163,8 +168,8 @@ class UpdateScreen:
             dt: kivy passes interval data through this variable
         """
 
-        # update the scanner state variable first
-        wav_meta = scanner.update_scanner_state()
+        # update the scanner state variable first, from the latest pushed state
+        wav_meta = scanner.update_scanner_state("push")
 
         # check to ensure data is present
         if isinstance(wav_meta, bool):
@@ -173,6 +178,10 @@ class UpdateScreen:
             # note: returning false will kill the auto screen update
             return False
 
+        # nothing to redraw if the scanner state hasn't changed
+        if not scanner.state_changes:
+            return True
+
         # determine if screen is a menu or scan screen
         scanner_info = wav_meta.get("ScannerInfo")
         mode = scanner_info.get("Mode")
@@ -1,8 +1,46 @@
+import asyncio
+import errno
+import json
+import os
 import pytest
+import shutil
+import struct
+import time
+import wave
 
+from copy import deepcopy
 from pathlib import Path
+from xml.etree import ElementTree
 from scanner.scanner_utility_functions import *
 from scanner.uniden import *
+from scanner.uniden_async import AsyncUnidenScanner
+from scanner.transmission_events import TransmissionDetector
+from scanner.uniden_db import (
+    INTERNED_FIELDS,
+    ScanStateRecorder,
+    migrate_to_normalized,
+    scan_hits_is_normalized,
+    scan_state_to_row,
+)
+from scanner.podcast import PodcastPublisher
+from scanner.recording_index import RecordingIndex
+from scanner.transcode import (
+    transcode_command,
+    transcode_recording,
+    transcode_recordings,
+    transcoded_path,
+)
+from scanner.sd_sync import copy_verified, sync_recordings
+from scanner.simulator import (
+    SimulatedSerial,
+    SimulatedProgramMemory,
+    DEFAULT_RESPONSES,
+    list_reply,
+    favorites_list_items,
+    SAMPLE_UNID_LINES,
+    SAMPLE_WAV_INFO,
+    write_simulated_recording,
+)
 
 
 def test_get_wav_meta():
@@ -372,5 +410,971 @@ def test_set_unit_id_name():
     assert db.get_unit_id_name("05") == "tara"
 
 
+def test_simulated_scanner_replies():
+    """Scanner methods should work against the software simulator."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+
+    s.serial.write(b"MDL\r")
+    assert s._read_and_decode_line() == "MDL,SDS100\n"
+
+    state = s.update_scanner_state("pull")
+    assert state["ScannerInfo"]["Site"]["Name"] == "98 HOU PubSafety NW Simulcast"
+    assert state["ScannerInfo"]["TGID"]["Name"] == "01 HPD-N"
+
+    # unknown commands are answered with an error
+    s.serial.write(b"POO\r")
+    assert s.get_response() == "ERR"
+
+    s.close()
+
+
+def test_simulated_program_memory_walk():
+    """The system tree walkers should follow the simulated linked lists."""
+
+    sim = SimulatedSerial(timeout=0.01, baudrate=0)
+    sim.add_program_memory(SimulatedProgramMemory(systems=2, groups=2, channels=3))
+    s = UnidenScanner(serial_port=sim)
+
+    assert s.get_scan_settings() == 1
+    assert len(s.systems) == 2
+
+    for system in s.systems.values():
+        assert len(system.groups) == 2
+        for group in system.groups.values():
+            assert len(group.channels) == 3
+
+    assert sim.commands_received[-1] == "EPG"
+
+    # second read pipelines the known channel indices
+    assert s.get_scan_settings() == 1
+    for system in s.systems.values():
+        for group in system.groups.values():
+            assert len(group.channels) == 3
+
+
+def test_multi_block_xml_response():
+    """Lists sent in several xml blocks should parse as one list."""
+
+    responses = dict(DEFAULT_RESPONSES)
+    responses["GLT"] = list_reply(
+        "GLT", "GLT", "FL", favorites_list_items(25), block_size=4
+    )
+    sim = SimulatedSerial(responses=responses, timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+
+    s.send_command("GLT,FL")
+    res = s.get_response()
+    names = [fl["Name"] for fl in res["GLT"]["FL"]]
+    assert names == [f"Favorites {i:04}" for i in range(25)]
+
+    # nothing from the list should be left over for the next command
+    s.send_command("MDL")
+    assert s.get_response()["data"] == ["SDS100"]
+
+    s.close()
+
+
+
+def test_raw_returns_without_timeout():
+    """raw() should return once the reply is complete, not when the port
+    times out."""
+
+    sim = SimulatedSerial(timeout=3.1)
+    s = UnidenScanner(serial_port=sim)
+
+    start = time.perf_counter()
+    assert s.raw("MDL") == "MDL,SDS100"
+    assert s.raw("GSI").endswith("</ScannerInfo>")
+    assert time.perf_counter() - start < 3.1
+
+    s.close()
+
+
+
+def test_pipeline():
+    """Pipelined replies come back in order and errors keep the port in sync."""
+
+    sim = SimulatedSerial(timeout=0.05, latency=0.01)
+    s = UnidenScanner(serial_port=sim)
+
+    assert s.pipeline(["MDL", "VOL", "MDL"], depth=2) == [
+        "MDL,SDS100",
+        s.raw("VOL"),
+        "MDL,SDS100",
+    ]
+
+    with pytest.raises(CommandError):
+        s.pipeline(["MDL", "POO", "MDL"])
+    assert s.raw("MDL") == "MDL,SDS100"
+
+    s.close()
+
+
+
+def test_async_scanner():
+    """Concurrent commands on the async client get their own replies."""
+
+    async def run():
+        sim = SimulatedSerial(timeout=0.5, latency=0.01)
+        async with AsyncUnidenScanner(serial_port=sim) as s:
+            mdl, state, key, err = await asyncio.gather(
+                s.command("MDL"),
+                s.update_scanner_state(),
+                s.push_key("press", "menu"),
+                s.command("POO"),
+            )
+            assert mdl["data"] == ["SDS100"]
+            assert state["ScannerInfo"]["TGID"]["Name"] == "01 HPD-N"
+            assert key["cmd"] == "KEY"
+            assert err == "ERR"
+
+            # pushed updates nobody asked for are queued separately
+            await s.command("PSI,100")
+            push = await asyncio.wait_for(s.unsolicited.get(), 1)
+            assert push.startswith(b"PSI,<XML>,")
+
+    asyncio.run(run())
+
+
+def test_async_scanner_lost_reply():
+    """A reply that never came doesn't shift the replies after it."""
+
+    async def run():
+        sim = SimulatedSerial(timeout=0.5)
+        sim.responses["MDL"] = [None, "MDL,SDS100"]
+        async with AsyncUnidenScanner(serial_port=sim, timeout=0.2) as s:
+            assert await s.command("MDL") is None
+            assert (await s.command("MDL"))["data"] == ["SDS100"]
+
+        # the reader stops at the end of a stream instead of spinning
+        s = AsyncUnidenScanner(serial_port=sim)
+        s._stream_reader = asyncio.StreamReader()
+        s._stream_reader.feed_eof()
+        waiting = asyncio.get_running_loop().create_future()
+        s._waiting.append(("MDL", waiting))
+        await asyncio.wait_for(s._read_loop(), 1)
+        with pytest.raises(CommandError):
+            waiting.result()
+
+    asyncio.run(run())
+
+
+
+def test_push_updates():
+    """Pushed states are parsed in the background while commands still work."""
+
+    sim = SimulatedSerial(timeout=0.5)
+    s = UnidenScanner(serial_port=sim)
+    pushed = []
+
+    assert s.start_push_updates(100, callback=pushed.append)
+    state = s.update_scanner_state("push")
+    assert state["ScannerInfo"]["TGID"]["Name"] == "01 HPD-N"
+
+    assert s.raw("MDL") == "MDL,SDS100"
+
+    # the reader thread owns the port, these go through it as well
+    assert s.reset_port()
+    assert s.raw("MDL", framed=False) == "MDL,SDS100"
+
+    states = s.push_states(timeout=1)
+    assert next(states)["cmd"] == "PSI"
+    states.close()
+
+    assert s.stop_push_updates()
+    assert pushed[-1] is None
+    assert "GSI" not in sim.commands_received
+
+    s.close()
+
+
+
+def test_parse_gsi_blocks():
+    """List tags are collected in order and the template is left untouched."""
+
+    template = deepcopy(GSI_OUTPUT)
+    blocks = [
+        b'<ScannerInfo Mode="Menu tree" V_Screen="plain_text">\r'
+        b"<ViewDescription>\r"
+        b'<PlainText Text="line 1" />\r'
+        b'<PlainText Text="line 2" />\r'
+        b'<PopupScreen Text="Save?">\r'
+        b'<Button KeyCode="E" Text="Yes" />\r'
+        b"</PopupScreen>\r"
+        b"</ViewDescription>\r"
+        b'<System Name="Houston TxWARN" />\r'
+        b"</ScannerInfo>\r"
+    ]
+
+    info = parse_gsi_blocks(blocks)["ScannerInfo"]
+    view = info["ViewDescription"]
+    assert info["Mode"] == "Menu tree"
+    assert [line["Text"] for line in view["PlainText"]] == ["line 1", "line 2"]
+    assert view["PopupScreen"]["Button"] == [{"KeyCode": "E", "Text": "Yes"}]
+    assert info["System"] == {"Name": "Houston TxWARN"}
+
+    s = UnidenScanner(serial_port=SimulatedSerial(timeout=0.05))
+    s.update_scanner_state("pull")
+    assert GSI_OUTPUT == template
+
+
+
+def test_state_changes():
+    """Only paths that changed since the last poll are reported."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    unit_ids = []
+    subscription = s.subscribe("UnitID", unit_ids.append)
+
+    s.update_scanner_state()
+    assert s.state_changes["System.Name"] == "Houston TxWARN"
+    assert unit_ids == [{"UnitID.Name": "", "UnitID.U_Id": "UID:1204417"}]
+
+    s.update_scanner_state()
+    assert s.state_changes == {}
+
+    sim.responses["GSI"] = sim.responses["GSI"].replace('Rssi="-78"', 'Rssi="-90"')
+    s.update_scanner_state()
+    assert s.state_changes == {"Property.Rssi": "-90"}
+    assert len(unit_ids) == 1
+
+    s.unsubscribe(subscription)
+    s.close()
+
+
+def test_transmission_detector():
+    """One record per transmission, not one per poll."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    records = []
+    detector = TransmissionDetector(callback=records.append)
+    detector.watch(s)
+    gsi = sim.responses["GSI"]
+
+    s.update_scanner_state()
+    s.update_scanner_state()
+    sim.responses["GSI"] = gsi.replace('Rssi="-78"', 'Rssi="-61"')
+    s.update_scanner_state()
+    assert records == []
+
+    idle = gsi.replace('Mute="Unmute"', 'Mute="Mute"')
+    idle = idle.replace('TGID="TGID:12501"', 'TGID=""').replace("UID:1204417", "")
+    sim.responses["GSI"] = idle
+    s.update_scanner_state()
+    s.update_scanner_state()
+
+    assert len(records) == 1
+    record = records[0]
+    assert record["system"] == "Houston TxWARN"
+    assert record["department"] == "Houston Police"
+    assert record["tgid"] == "TGID:12501"
+    assert record["unit_id"] == "UID:1204417"
+    assert record["peak_rssi"] == -61
+    assert record["updates"] == 2
+    assert record["start"] <= record["end"]
+    assert detector.flush() == []
+
+    s.close()
+
+
+def test_scan_state_recorder(tmp_path):
+    """States are written as complete rows in batches over one connection."""
+
+    db_path = tmp_path / "uniden.sqlite"
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    gsi = sim.responses["GSI"]
+
+    with ScanStateRecorder(db_path, batch_size=2, flush_interval=0.05) as recorder:
+        recorder.watch(s)
+        for rssi in ("-78", "-80", "-82"):
+            sim.responses["GSI"] = gsi.replace('Rssi="-78"', f'Rssi="{rssi}"')
+            s.update_scanner_state()
+        recorder.flush()
+        assert recorder.rows_written == 3
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    rows = conn.execute(
+        'SELECT "System:Name", "UnitID:U_Id", "Property:Rssi" FROM scan_hits'
+    ).fetchall()
+    assert rows == [
+        ("Houston TxWARN", "UID:1204417", "-78"),
+        ("Houston TxWARN", "UID:1204417", "-80"),
+        ("Houston TxWARN", "UID:1204417", "-82"),
+    ]
+
+    # flattened states still go through save_state_to_db()
+    flat = {"date_code": "2020-01-01T00:00:00", "System:Name": "Flat"}
+    assert save_state_to_db(flat, db_path=db_path)
+    row = conn.execute(
+        'SELECT "System:Name" FROM scan_hits WHERE date_code = ?', (flat["date_code"],)
+    ).fetchone()
+    assert row == ("Flat",)
+
+    conn.close()
+    s.close()
+
+
+def test_normalized_storage(tmp_path):
+    """Migrated and normalized databases read back like the wide table."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    s.update_scanner_state()
+    rows = [scan_state_to_row(s.scan_state, f"2020-01-01T00:00:0{i}") for i in range(5)]
+    s.close()
+
+    db_path = tmp_path / "uniden.sqlite"
+    with ScanStateRecorder(db_path) as recorder:
+        for row in rows:
+            recorder.record(s.scan_state, row[0])
+
+    assert migrate_to_normalized(db_path) == 5
+    assert migrate_to_normalized(db_path) == 0
+
+    conn = sqlite3.connect(db_path)
+    assert scan_hits_is_normalized(conn)
+    assert conn.execute("SELECT * FROM scan_hits ORDER BY date_code").fetchall() == rows
+    assert conn.execute('SELECT count(*) FROM "System"').fetchone() == (1,)
+    assert conn.execute('SELECT count(*) FROM "HitSettings"').fetchone() == (1,)
+    # the raw unit ids stay out of the alias table
+    assert conn.execute('SELECT count(*) FROM "UnitID"').fetchone() == (0,)
+    assert conn.execute('SELECT "U_Id" FROM "HitUnitID"').fetchall() == [
+        ("UID:1204417",)
+    ]
+    conn.close()
+
+    # new databases can start out normalized
+    db_path = tmp_path / "normalized.sqlite"
+    with ScanStateRecorder(db_path, normalized=True) as recorder:
+        recorder.record(s.scan_state, rows[0][0])
+
+    conn = sqlite3.connect(db_path)
+    assert scan_hits_is_normalized(conn)
+    assert conn.execute("SELECT * FROM scan_hits").fetchall() == rows[:1]
+    conn.close()
+
+
+def test_normalized_unit_id_upgrade(tmp_path, monkeypatch):
+    """Unit ids interned into the alias table move to HitUnitID."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    s.update_scanner_state()
+    s.close()
+    row = scan_state_to_row(s.scan_state, "2020-01-01T00:00:00")
+
+    # normalized the way it was done before HitUnitID
+    db_path = tmp_path / "uniden.sqlite"
+    with monkeypatch.context() as m:
+        m.setitem(INTERNED_FIELDS, "UnitID:U_Id", ("UnitID", "U_Id", "unit_id"))
+        with ScanStateRecorder(db_path, normalized=True) as recorder:
+            recorder.record(s.scan_state, row[0])
+    db = UnidenLocalDatabase(db_path)
+    db.set_unit_id_name(3750012, "Engine 1")
+    db.conn.close()
+
+    assert migrate_to_normalized(db_path) == 0
+
+    db = UnidenLocalDatabase(db_path)
+    assert list(db.export_unit_id_names()) == [("3750012", "Engine 1")]
+    assert db.conn.execute("SELECT * FROM scan_hits").fetchall() == [row]
+    db.conn.close()
+
+
+def test_hit_queries(tmp_path):
+    """Time range lookups and top-N aggregations, in both storage layouts."""
+
+    sim = SimulatedSerial(timeout=0.05)
+    s = UnidenScanner(serial_port=sim)
+    s.update_scanner_state()
+    s.close()
+
+    talkgroups = ["TGID:1", "TGID:1", "TGID:2", "TGID:1", "TGID:2", "TGID:2", "---"]
+    states = []
+    for i, tgid in enumerate(talkgroups):
+        state = deepcopy(s.scan_state)
+        state["ScannerInfo"]["TGID"]["TGID"] = tgid
+        states.append((state, f"2020-01-01T{i // 3:02d}:00:0{i}"))
+
+    for normalized in (False, True):
+        db_path = tmp_path / f"uniden_{normalized}.sqlite"
+        with ScanStateRecorder(db_path, normalized=normalized) as recorder:
+            for state, date_code in states:
+                recorder.record(state, date_code)
+
+        db = UnidenLocalDatabase(db_path)
+
+        hits = db.iter_hits(
+            start="2020-01-01T00", end="2020-01-01T01", columns=["TGID:TGID"]
+        )
+        assert list(hits) == [{"TGID:TGID": t} for t in talkgroups[:3]]
+
+        hits = db.iter_hits(tgid="TGID:2", system="Houston TxWARN")
+        assert [hit["date_code"][-2:] for hit in hits] == ["02", "04", "05"]
+
+        busiest = list(db.busiest_talkgroups(limit=1))
+        assert [(hit["hour"], hit["tgid"], hit["hits"]) for hit in busiest] == [
+            ("2020-01-01T00", "TGID:1", 2),
+            ("2020-01-01T01", "TGID:2", 2),
+        ]
+        assert busiest[0]["name"] == "01 HPD-N"
+
+        assert list(db.most_active_unit_ids()) == [
+            {"unit_id": "UID:1204417", "name": "", "hits": 7}
+        ]
+
+        db.conn.close()
+
+
+def test_unit_id_name_cache(tmp_path):
+    """Repeated lookups come from the cache, set_unit_id_name() writes through."""
+
+    db = UnidenLocalDatabase(tmp_path / "uniden.sqlite", unit_id_cache_size=2)
+    db.conn.execute(
+        'CREATE TABLE "UnitID" ("id" INTEGER PRIMARY KEY, "Name" TEXT, '
+        '"U_Id" TEXT UNIQUE, "time_stamp" TEXT)'
+    )
+
+    # unknown unit ids are cached too
+    assert db.get_unit_id_name(1001) == "-"
+    assert db.get_unit_id_name("1001") == "-"
+    assert db.unit_id_cache_info()["hits"] == 1
+
+    db.set_unit_id_name(1001, "Engine 1")
+    assert db.get_unit_id_name(1001) == "Engine 1"
+    db.set_unit_id_name(1001, "Engine 2")
+    assert db.get_unit_id_name(1001) == "Engine 2"
+
+    # least recently used entry is dropped
+    db.get_unit_id_name(1002)
+    db.get_unit_id_name(1001)
+    db.get_unit_id_name(1003)
+    assert db.unit_id_cache_info() == {
+        "hits": 4,
+        "misses": 3,
+        "size": 2,
+        "max_size": 2,
+    }
+    db.get_unit_id_name(1002)
+    assert db.unit_id_cache_info()["misses"] == 4
+
+    db.conn.close()
+
+
+def test_unit_id_alias_import_export(tmp_path):
+    """Alias files load in one transaction and stream back out."""
+
+    csv_path = tmp_path / "aliases.csv"
+    csv_path.write_text("U_Id,Name\n1001,Engine 1\n1002,Medic 2\n")
+    json_path = tmp_path / "aliases.json"
+    json_path.write_text('[{"unit_id": "1002", "name": "Medic 12"}]')
+
+    db = UnidenLocalDatabase(tmp_path / "uniden.sqlite")
+    assert db.import_unit_id_names(csv_path) == 2
+    assert db.get_unit_id_name(1002) == "Medic 2"
+
+    # re-importing replaces names, also the cached ones
+    assert db.import_unit_id_names(json_path) == 1
+    assert db.import_unit_id_names([(1003, "Tower")]) == 1
+
+    assert db.get_unit_id_name(1002) == "Medic 12"
+    assert list(db.export_unit_id_names()) == [
+        ("1001", "Engine 1"),
+        ("1002", "Medic 12"),
+        ("1003", "Tower"),
+    ]
+
+    export_path = tmp_path / "export.json"
+    assert db.export_unit_id_names(export_path) == 3
+    assert json.loads(export_path.read_text())["1003"] == "Tower"
+
+    db.conn.close()
+
+
+def test_parallel_wav_meta(tmp_path):
+    """Parallel metadata reads match reading the files one by one."""
+
+    for second in range(12):
+        write_simulated_recording(tmp_path / f"2019-08-06_15-12-{second:02d}.wav")
+
+    sd = UnidenMassStorage(directory=tmp_path)
+    wav_files = sd.get_wav_files(tmp_path)
+    progress = []
+
+    meta = sd.get_wav_files_meta(workers=3, progress=lambda *p: progress.append(p))
+    assert meta == [get_wav_meta(wav_file) for wav_file in wav_files]
+    assert progress[-1] == (12, 12)
+    assert meta[0]["Site:Name"] == "98 HOU PubSafety NW Simulcast"
+
+    streamed = dict(sd.iter_wav_files_meta(workers=2, processes=True))
+    assert streamed == dict(zip(wav_files, meta))
+
+
+def test_get_wav_meta_header_only(tmp_path):
+    """Metadata is read from the header without the chunk module."""
+
+    wav_file = tmp_path / "2019-08-06_15-12-00.wav"
+    write_simulated_recording(wav_file, samples=[0, 1] * 50000)
+
+    meta = get_wav_meta(wav_file)
+    assert meta["TransmissionStart"] == "20190806151200"
+    assert meta["FileSize"] == wav_file.stat().st_size
+    assert meta["TGID:Name"] == "01 HPD-N"
+    assert meta["Site:Name"] == "98 HOU PubSafety NW Simulcast"
+    assert [key for key in meta if key.startswith("line ")] == [
+        f"line {n}" for n in range(1, 8)
+    ]
+
+    # recordings with fewer unid lines only fill in what is there
+    short_file = tmp_path / "2019-08-06_15-12-01.wav"
+    write_simulated_recording(short_file, unid_lines=SAMPLE_UNID_LINES[:2])
+    short_meta = get_wav_meta(short_file)
+    assert "line 3" not in short_meta
+    assert short_meta["System:Name"] == meta["System:Name"]
+
+    not_wav = tmp_path / "notes.wav"
+    not_wav.write_bytes(b"not a wav file at all")
+    assert get_wav_meta(not_wav) is None
+
+
+def test_get_wav_meta_odd_length_info(tmp_path):
+    """Tags after an odd length INFO entry and its pad byte are still read."""
+
+    wav_file = tmp_path / "2019-08-06_15-12-00.wav"
+    info = {"ISBJ": "Fav 12", "IART": "Houston TxWARN", "INAM": "01 HPD-N"}
+    write_simulated_recording(wav_file, info=info)
+    # 7 bytes of text and null, then the pad byte the size doesn't count
+    assert b"ISBJ\x07\x00\x00\x00Fav 12\x00\x00IART" in wav_file.read_bytes()
+
+    meta = get_wav_meta(wav_file)
+    assert meta["MonitorList:Name:1"] == "Fav 12"
+    assert meta["System:Name:1"] == "Houston TxWARN"
+    assert meta["Channel:Name:1"] == "01 HPD-N"
+    assert meta["TGID:Name"] == "01 HPD-N"
+
+    samples = [100, -100] * 50
+    write_simulated_recording(wav_file, info=info, samples=samples)
+    with WavRecording(wav_file) as recording:
+        assert recording.meta() == get_wav_meta(wav_file)
+        assert recording.samples()[:, 0].tolist() == samples
+        assert bytes(recording.unid[:8]) == b"Houston\x00"
+
+
+def test_recording_index(tmp_path):
+    """Rescans only read new or changed files, queries don't read any."""
+
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    for second in range(5):
+        write_simulated_recording(audio / f"2019-08-06_15-12-{second:02d}.wav")
+
+    index = RecordingIndex(tmp_path / "recordings.sqlite")
+    assert len(index.scan(audio)) == 5
+    assert index.scan(audio) == []
+
+    # a changed and a deleted file
+    changed = audio / "2019-08-06_15-12-01.wav"
+    info = dict(SAMPLE_WAV_INFO, IGNR="Houston Fire")
+    write_simulated_recording(changed, info=info, samples=[0] * 100)
+    (audio / "2019-08-06_15-12-04.wav").unlink()
+    assert index.scan(audio) == [str(changed)]
+    assert len(index) == 4
+
+    police = list(index.iter_recordings(department="Houston Police"))
+    assert [r["start"] for r in police] == [
+        "20190806151200",
+        "20190806151202",
+        "20190806151203",
+    ]
+    assert police[0]["meta"] == get_wav_meta(audio / "2019-08-06_15-12-00.wav")
+    assert police[0]["end"] == police[0]["meta"]["TransmissionEnd"]
+
+    fire = list(index.iter_recordings(tgid="12501", meta=False, end="20190806151202"))
+    assert [r["department"] for r in fire] == ["Houston Police", "Houston Fire"]
+    assert "meta" not in fire[0]
+
+    sd = UnidenMassStorage(directory=tmp_path)
+    sd.get_wav_files(audio)
+    assert sd.get_wav_files_meta(index=index) == [
+        get_wav_meta(wav_file) for wav_file in sd.wav_files
+    ]
+    index.close()
+
+    # an index written by an older get_wav_meta() is read again
+    with sqlite3.connect(tmp_path / "recordings.sqlite") as conn:
+        conn.execute('UPDATE "recordings" SET "channel" = NULL')
+        conn.execute("PRAGMA user_version = 1")
+    conn.close()
+    with RecordingIndex(tmp_path / "recordings.sqlite") as index:
+        assert len(index) == 0
+        assert len(index.scan(audio)) == 4
+        assert index.scan(audio) == []
+        assert len(list(index.iter_recordings(channel="01 HPD-N"))) == 4
+
+
+def test_merge_wav_files(tmp_path, monkeypatch):
+    """Audio data is copied into the merged file without decoding it."""
+
+    wav_files = []
+    for second, samples in enumerate(([1] * 3000, [2] * 4001)):
+        wav_file = tmp_path / f"2019-08-06_15-12-{second:02d}.wav"
+        write_simulated_recording(wav_file, samples=samples)
+        wav_files.append(wav_file)
+
+    monkeypatch.chdir(tmp_path)
+    merged = merge_tagged_wav_files(wav_files)
+
+    with wave.open(str(merged)) as merged_wav:
+        assert merged_wav.getframerate() == 8000
+        audio = merged_wav.readframes(merged_wav.getnframes())
+    assert audio == b"\x01\x00" * 3000 + b"\x02\x00" * 4001
+    assert merged.stat().st_size == 44 + len(audio)
+
+    # a recording cut short in the middle of a sample
+    truncated = tmp_path / "2019-08-06_15-12-03.wav"
+    truncated.write_bytes(wav_files[0].read_bytes()[:-1])
+    merged = tmp_path / "merged_truncated.wav"
+    assert merge_wav_files([truncated, wav_files[1]], merged) == 2 * (2999 + 4001)
+    with wave.open(str(merged)) as merged_wav:
+        audio = merged_wav.readframes(merged_wav.getnframes())
+    assert audio == b"\x01\x00" * 2999 + b"\x02\x00" * 4001
+
+    other_rate = tmp_path / "2019-08-06_15-12-02.wav"
+    write_simulated_recording(other_rate, sample_rate=16000)
+    with pytest.raises(ValueError):
+        merge_wav_files(wav_files + [other_rate], tmp_path / "not_written.wav")
+    assert not (tmp_path / "not_written.wav").exists()
+
+
+def test_group_audio_by_department(tmp_path):
+    """Recordings are grouped in parallel and a rerun finishes the job."""
+
+    source = tmp_path / "user_rec"
+    save = tmp_path / "grouped"
+    save.mkdir()
+    for folder, second in (("00000001", 0), ("00000001", 1), ("00000002", 2)):
+        (source / folder).mkdir(parents=True, exist_ok=True)
+        write_simulated_recording(source / folder / f"2019-08-06_15-12-0{second}.wav")
+    untagged = source / "00000002" / "2019-08-06_15-12-03.wav"
+    write_simulated_recording(untagged, info={"ICRD": "20190806151241"})
+
+    plan = plan_audio_by_department(source, save)
+    assert [destination.parent.name for _, destination in plan] == ["01_HPD-N"] * 3
+
+    # interrupted after copying the first file, before removing the original
+    first, first_destination = plan[0]
+    first_destination.parent.mkdir()
+    shutil.copy(first, first_destination)
+
+    outcomes = group_audio_by_department(source, save, workers=2)
+    assert outcomes == {"moved": 2, "done": 1, "conflict": 0, "failed": 0}
+    assert sorted(p.name for p in (save / "01_HPD-N").iterdir()) == [
+        "2019-08-06_15-12-00.wav",
+        "2019-08-06_15-12-01.wav",
+        "2019-08-06_15-12-02.wav",
+    ]
+    # the untagged recording stays, and so does its directory
+    assert untagged.exists()
+    assert not (source / "00000001").exists()
+
+    assert group_audio_by_department(source, save)["moved"] == 0
+
+
+def test_group_audio_same_name(tmp_path):
+    """Recordings with the same name in two folders are both kept."""
+
+    source = tmp_path / "user_rec"
+    save = tmp_path / "grouped"
+    for folder, samples in (("a", [1] * 100), ("b", [2] * 100)):
+        (source / folder).mkdir(parents=True)
+        write_simulated_recording(
+            source / folder / "2019-08-06_15-12-35.wav", samples=samples
+        )
+    recordings = sorted(wav.read_bytes() for wav in source.rglob("*.wav"))
+
+    plan = plan_audio_by_department(source, save)
+    assert [destination.name for _, destination in plan] == [
+        "2019-08-06_15-12-35.wav",
+        "2019-08-06_15-12-35_b.wav",
+    ]
+
+    outcomes = group_audio_by_department(source, save, workers=2)
+    assert outcomes == {"moved": 2, "done": 0, "conflict": 0, "failed": 0}
+    grouped = sorted(wav.read_bytes() for wav in save.rglob("*.wav"))
+    assert grouped == recordings
+
+    # a different recording already at the destination is left alone
+    other = source / "c" / "2019-08-06_15-12-35.wav"
+    other.parent.mkdir()
+    write_simulated_recording(other, samples=[3] * 100)
+    assert group_audio_by_department(source, save)["conflict"] == 1
+    assert other.exists()
+    assert sorted(wav.read_bytes() for wav in save.rglob("*.wav")) == grouped
+
+
+def test_group_audio_interrupted_copy(tmp_path, monkeypatch):
+    """Copies cut short by an earlier run are finished on the next one."""
+
+    source = tmp_path / "user_rec"
+    save = tmp_path / "grouped"
+    (source / "00000001").mkdir(parents=True)
+    # the odd length ISBJ value is padded, INAM comes after the pad byte
+    info = {"ISBJ": "Fav 12", "IART": "Houston TxWARN", "INAM": "01 HPD-N"}
+    for second in range(2):
+        write_simulated_recording(
+            source / "00000001" / f"2019-08-06_15-12-0{second}.wav", info=info
+        )
+
+    plan = plan_audio_by_department(source, save)
+    assert [destination.parent.name for _, destination in plan] == ["01_HPD-N"] * 2
+
+    # copied straight to the destination by an older version, and a .part
+    # file from a copy to another file system
+    (first, first_destination), (second, second_destination) = plan
+    first_destination.parent.mkdir(parents=True)
+    first_destination.write_bytes(first.read_bytes()[:100])
+    stale = second_destination.with_name(second_destination.name + ".part")
+    stale.write_bytes(b"RIFF")
+    recordings = [first.read_bytes(), second.read_bytes()]
+
+    link = os.link
+
+    def cross_device(src, dst):
+        if not str(src).endswith(".part"):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        link(src, dst)
+
+    monkeypatch.setattr(os, "link", cross_device)
+    outcomes = execute_audio_plan(plan, workers=2)
+    assert outcomes == {"moved": 2, "done": 0, "conflict": 0, "failed": 0}
+    assert [first_destination.read_bytes(), second_destination.read_bytes()] == (
+        recordings
+    )
+    assert sorted(p.name for p in save.rglob("*")) == [
+        "01_HPD-N",
+        "2019-08-06_15-12-00.wav",
+        "2019-08-06_15-12-01.wav",
+    ]
+
+
+def test_podcast_publisher(tmp_path):
+    """Only new recordings are published, the feed comes from the manifest."""
+
+    audio = tmp_path / "0_HPD-NW"
+    posts = tmp_path / "_posts"
+    audio.mkdir()
+    posts.mkdir()
+    for second in range(3):
+        write_simulated_recording(audio / f"2019-08-06_15-12-{second:02d}.wav")
+
+    publisher = PodcastPublisher(audio, posts_path=posts)
+    assert len(publisher.publish()) == 3
+    assert publisher.publish() == []
+
+    post = (posts / "2019-08-06-15-12-00-01-HPD-N.md").read_text()
+    assert 'title: "20190806151200_01-HPD-N"' in post
+    assert "podcast_link: http://localhost:4000/scanner_audio/0_HPD-NW/" in post
+
+    write_simulated_recording(audio / "2019-08-06_15-13-00.wav")
+    assert [entry["file"] for entry in publisher.publish()] == [
+        "2019-08-06_15-13-00.wav"
+    ]
+
+    feed_path = tmp_path / "feed.xml"
+    assert publisher.write_feed(feed_path) == 4
+    items = ElementTree.parse(feed_path).getroot().findall("channel/item")
+    assert items[0].find("title").text == "20190806151300_01-HPD-N"
+    assert items[-1].find("enclosure").get("url").endswith("2019-08-06_15-12-00.wav")
+
+
+def test_transcode_skips_up_to_date(tmp_path):
+    """Only recordings without a current compressed version are encoded."""
+
+    wav_file = write_simulated_recording(tmp_path / "2019-08-06_15-12-00.wav")
+    output = transcoded_path(wav_file, tmp_path / "opus")
+    assert output.name == "2019-08-06_15-12-00.opus"
+
+    command = transcode_command(wav_file, output, meta=get_wav_meta(wav_file))
+    assert command[-3:] == ["-f", "ogg", str(output)]
+    assert "title=01 HPD-N" in command
+    uniden = next(arg for arg in command if arg.startswith("uniden="))
+    uniden = json.loads(uniden[len("uniden=") :])
+    assert uniden["Department:Latitude"] == "29.760427"
+    assert "line 1" not in uniden
+
+    output.parent.mkdir()
+    output.write_bytes(b"encoded before")
+    assert transcode_recordings([wav_file], output.parent, ffmpeg="missing") == {
+        wav_file: output
+    }
+
+    # the recording changed, the missing ffmpeg is logged and it is left out
+    os.utime(output, ns=(0, 0))
+    assert transcode_recordings([wav_file], output.parent, ffmpeg="missing") == {}
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_podcast_publisher_transcoded(tmp_path):
+    """The feed points at the compressed recordings."""
+
+    write_simulated_recording(tmp_path / "2019-08-06_15-12-00.wav")
+
+    publisher = PodcastPublisher(tmp_path, audio_format="opus")
+    (entry,) = publisher.publish()
+    assert entry["url"].endswith("2019-08-06_15-12-00.opus")
+    assert entry["type"] == "audio/ogg"
+    assert entry["length"] == (tmp_path / "2019-08-06_15-12-00.opus").stat().st_size
+
+
+def test_trim_silence(tmp_path):
+    """Squelch tails and dead air are left out, speech is kept."""
+
+    # 8000 samples per second: 1 s silence, 0.5 s tone, 2 s silence, 0.5 s tone,
+    # 0.2 s silence and a squelch tail of 1.5 s low noise
+    tone = [8000, -8000] * 2000
+    samples = [0] * 8000 + tone + [0] * 16000 + tone + [0] * 1600 + [3, -3] * 6000
+    wav_file = tmp_path / "2019-08-06_15-12-00.wav"
+    write_simulated_recording(wav_file, samples=samples)
+
+    fmt, ranges = wav_voiced_ranges(wav_file, padding_ms=0)
+    data_start = wav_file.stat().st_size - len(samples) * 2
+    assert [(offset - data_start) // 2 for offset, _ in ranges] == [8000, 28000]
+    assert [length // 2 for _, length in ranges] == [4000, 4000]
+
+    trimmed = trim_silence(wav_file, tmp_path / "trimmed.wav", padding_ms=0)
+    with wave.open(str(trimmed[0])) as trimmed_wav:
+        assert trimmed_wav.readframes(trimmed_wav.getnframes()) == struct.pack(
+            "<8000h", *tone * 2
+        )
+
+    parts = trim_silence(wav_file, tmp_path / "part.wav", split=True)
+    assert [part.name for part in parts] == ["part_001.wav", "part_002.wav"]
+    with wave.open(str(parts[0])) as part_wav:
+        # 100 ms padding on both sides
+        assert part_wav.getnframes() == 4000 + 1600
+
+    # a short pause is kept
+    _, ranges = wav_voiced_ranges(wav_file, min_silence_ms=2500, padding_ms=0)
+    assert len(ranges) == 1
+
+    silent = write_simulated_recording(tmp_path / "silent.wav")
+    assert trim_silence(silent, tmp_path / "silent_part.wav", split=True) == []
+
+    merged = tmp_path / "merged.wav"
+    merge_wav_files([wav_file, wav_file], merged, trim_silence=True)
+    with wave.open(str(merged)) as merged_wav:
+        assert merged_wav.getnframes() == 4 * (4000 + 1600)
+
+    # cut short in the middle of a sample, the last range ends on a whole one
+    truncated = tmp_path / "truncated.wav"
+    truncated.write_bytes(wav_file.read_bytes()[:-1])
+    _, ranges = wav_voiced_ranges(truncated, min_silence_ms=2500)
+    assert all(length % 2 == 0 for _, length in ranges)
+
+
+def test_trim_silence_failures(tmp_path, monkeypatch):
+    """Missing NumPy is caught up front, failed trims leave no files behind."""
+
+    wav_file = write_simulated_recording(tmp_path / "2019-08-06_15-12-00.wav")
+
+    def failing_trim(wav_file, output):
+        Path(output).write_bytes(b"half a recording")
+        raise ValueError("trim failed")
+
+    monkeypatch.setattr("scanner.transcode.trim", failing_trim)
+    output = tmp_path / "out" / "2019-08-06_15-12-00.opus"
+    output.parent.mkdir()
+    with pytest.raises(ValueError):
+        transcode_recording(wav_file, output, trim_silence=True)
+    assert list(output.parent.iterdir()) == []
+
+    monkeypatch.setattr("scanner.transcode.np", None)
+    monkeypatch.setattr("scanner.podcast.np", None)
+    with pytest.raises(ImportError):
+        transcode_recordings([wav_file], tmp_path / "out", trim_silence=True)
+    with pytest.raises(ImportError):
+        PodcastPublisher(tmp_path, audio_format="opus", trim_silence=True)
+
+
+def test_wav_recording_views(tmp_path):
+    """Header fields, unid block and samples come from one mapping."""
+
+    wav_file = tmp_path / "2019-08-06_15-12-00.wav"
+    write_simulated_recording(wav_file, samples=[0, 100, -100, 32767])
+
+    with WavRecording(wav_file) as recording:
+        assert recording.meta() == get_wav_meta(wav_file)
+        assert recording.fmt == (1, 1, 8000, 16000, 2, 16)
+        assert bytes(recording.unid[:9]) == b"Houston\x00f"
+        assert recording.samples()[:, 0].tolist() == [0, 100, -100, 32767]
+
+        data_start = recording.chunks[b"data"][0]
+        assert recording.string_at(0, 4) == "RIFF"
+        assert recording.string_at(data_start - 8, 8) == "data\\x08|||"
+        assert get_string_at_offset(40, 24, wav_file) == recording.string_at(40, 24)
+
+    unid_start = recording.chunks[b"unid"][0]
+    binary_tail = unid_start + 7 * UNID_LINE_LENGTH
+    assert get_string_at_offset(binary_tail, 1, wav_file) == (
+        f"«{binary_tail - 7} b'\\x80'»"
+    )
+
+    not_wav = tmp_path / "notes.wav"
+    not_wav.write_bytes(b"not a wav file at all")
+    with pytest.raises(ValueError):
+        WavRecording(not_wav)
+
+
+def test_sd_card_sync(tmp_path):
+    """Only new or changed recordings are copied, copies resume and verify."""
+
+    card = tmp_path / "SDS100"
+    user_rec = card / SCANNER_AUDIO_PATH / "00000001"
+    user_rec.mkdir(parents=True)
+    for second in range(3):
+        write_simulated_recording(user_rec / f"2019-08-06_15-12-{second:02d}.wav")
+    archive = tmp_path / "archive"
+    index = RecordingIndex(tmp_path / "recordings.sqlite")
+
+    outcomes = sync_recordings(card, archive, index)
+    assert outcomes["copied"] == 3
+    copy = archive / "00000001" / "2019-08-06_15-12-00.wav"
+    assert copy.read_bytes() == (user_rec / copy.name).read_bytes()
+    assert len(index) == 3
+
+    # the card mounted in another time zone, and one recording changed
+    os.utime(copy, ns=(0, 0))
+    write_simulated_recording(user_rec / "2019-08-06_15-12-01.wav", samples=[1] * 10)
+    outcomes = sync_recordings(card, archive, index)
+    assert (outcomes["copied"], outcomes["retimed"], outcomes["unchanged"]) == (1, 1, 1)
+    assert index.get_meta(archive / "00000001" / "2019-08-06_15-12-01.wav")
+
+    # an interrupted copy carries on, one of another recording starts over
+    recording = write_simulated_recording(user_rec / "2019-08-06_15-13-00.wav")
+    destination = archive / "00000001" / recording.name
+    partial = destination.with_name(destination.name + ".part")
+    partial.write_bytes(recording.read_bytes()[:5000])
+    assert copy_verified(recording, destination) == recording.stat().st_size - 5000
+    assert destination.read_bytes() == recording.read_bytes()
+
+    partial.write_bytes(b"not the same recording")
+    assert copy_verified(recording, destination) == recording.stat().st_size
+    assert not partial.exists()
+
+    # all of the interrupted copy is compared, not just its start
+    damaged = bytearray(recording.read_bytes()[:5000])
+    damaged[4500] ^= 0xFF
+    partial.write_bytes(damaged)
+    assert copy_verified(recording, destination) == recording.stat().st_size
+    assert destination.read_bytes() == recording.read_bytes()
+    index.close()
+
+
 # if __name__ == "__main__":
 #     test_get_wav_meta()
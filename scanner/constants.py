@@ -986,6 +986,45 @@ WAV_METADATA = OrderedDict(
 # dict that defines what each of the tuples in XML_TAGS describes
 HUMAN_TAG_HANDLER = {"root_tag": 0, "max_depth": 1, "unique_tag_names": 2}
 
+# key names accepted by UnidenScanner.push_key() and their KEY command codes
+PUSH_KEY_CODES = {
+    "menu": "M",
+    "func": "F",
+    "avoid": "L",
+    "1": "1",
+    "2": "2",
+    "3": "3",
+    "4": "4",
+    "5": "5",
+    "6": "6",
+    "7": "7",
+    "8": "8",
+    "9": "9",
+    "0": "0",
+    "dot": ".",
+    "no": ".",
+    "pri": ".",
+    "E": "E",
+    "yes": "E",
+    "vright": ">",
+    "vleft": "<",
+    "vpush": "^",
+    "backlight": "V",
+    "sq": "Q",  # acts like 0
+    "replay": "Y",
+    "system": "A",
+    "dept": "B",
+    "chan": "C",
+    "zip": "Z",
+    "srev": "T",  # acts like 0
+    "rang": "R",  # acts like 0
+    "light": "P",
+    "pwr": "P",
+}
+
+# push_key() modes: press, long press, press and hold, release
+PUSH_KEY_MODES = {"press": "P", "long": "L", "hold": "H", "release": "R"}
+
 # convert quick key status to human readable explanation
 HUMAN_QK_STATUS = {
     "0": "QK does NOT exist",
@@ -1005,6 +1044,11 @@ GLT_COMMAND = {
     "user record file": ("GLT", "UREC_FILE", "folder_index"),
 }
 
+# first line of every xml block the scanner sends, and the footer attribute
+# that marks more blocks are coming
+XML_HEADER_LINE = b'<?xml version="1.0" encoding="utf-8"?>\r'
+XML_MORE_BLOCKS = b'EOT="0"'
+
 # max_depth: maximum number of branches from root
 XML_TAG_HANDLER = {
     "Footer": ("Footer", 0, True),
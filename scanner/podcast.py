@@ -0,0 +1,410 @@
+"""Publish a directory of scanner recordings as a podcast.
+
+PodcastPublisher keeps a manifest (one JSON line per published recording), so
+each run only reads the metadata of recordings that weren't published yet and
+only writes their Jekyll posts. The RSS feed is written directly from the
+manifest, one item at a time, without reading any wav files and without a
+Jekyll rebuild. With an audio_format the new recordings are compressed first
+(see scanner.transcode) and the posts and feed point at the compressed files.
+
+Example:
+    publisher = PodcastPublisher(
+        "/Volumes/iMac HDD/scanner_audio/0_HPD-NW",
+        href_base="http://localhost:4000/scanner_audio/",
+        posts_path="/Volumes/iMac HDD/uniden-scanner-podcast/_posts/",
+    )
+    publisher.publish()
+    publisher.write_feed("/Volumes/iMac HDD/uniden-scanner-podcast/feed.xml")
+
+Usage:
+    python -m scanner.podcast SOURCE_DIR --href-base URL --posts DIR --feed FILE
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from email.utils import format_datetime
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from scanner.scanner_utility_functions import iter_wav_meta, np, parse_time
+from scanner.transcode import TRANSCODE_FORMATS, transcode_recordings
+
+# name of the manifest kept in the source directory
+PODCAST_MANIFEST_NAME = "podcast_manifest.jsonl"
+
+RSS_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<rss version="2.0" '
+    'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">\n'
+    "<channel>\n"
+    "<title>{title}</title>\n"
+    "<link>{link}</link>\n"
+    "<description>{description}</description>\n"
+)
+
+RSS_ITEM = (
+    "<item>\n"
+    "<title>{title}</title>\n"
+    "<guid isPermaLink=\"false\">{guid}</guid>\n"
+    "<pubDate>{pub_date}</pubDate>\n"
+    "<enclosure url={url} length=\"{length}\" type=\"{type}\"/>\n"
+    "<itunes:duration>{duration}</itunes:duration>\n"
+    "</item>\n"
+)
+
+RSS_FOOTER = "</channel>\n</rss>\n"
+
+
+def _start_datetime(transmission_start):
+    """datetime of a TransmissionStart string (yyyymmddhhmmss)."""
+
+    return datetime.strptime(transmission_start, "%Y%m%d%H%M%S")
+
+
+def recording_entry(
+    wav_file, meta, audio_directory, href_base, audio_file=None, audio_format=None
+):
+    """Manifest entry for a recording.
+
+    Args:
+        wav_file (Path): the recording
+        meta (dict): get_wav_meta() result
+        audio_directory (str): name of the directory on the web server
+        href_base (str): url of the directory holding audio_directory
+        audio_file (Path): compressed version of wav_file that is served
+            instead, in audio_directory as well
+        audio_format (str): TRANSCODE_FORMATS key of audio_file
+
+    Returns:
+        dict: what the post and the feed item need, None if meta lacks
+            (valid) transmission times or the channel name
+    """
+
+    try:
+        rec_start = meta["TransmissionStart"]
+        rec_end = meta["TransmissionEnd"]
+        tgid_name = meta["TGID:Name"]
+        # function provides separate "time" and "date" objects for start and end
+        trans_datetime = parse_time(rec_start, rec_end)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    # replace characters that must be escaped in HTML
+    tgid_name = tgid_name.replace(".", "")
+    tgid_name = tgid_name.replace(" ", "-")
+
+    start_date = trans_datetime["TransmissionStart"]["date"]
+    start_time = trans_datetime["TransmissionStart"]["time"].replace(":", "-")
+
+    stat = wav_file.stat()
+
+    if audio_file is None:
+        audio_file = wav_file
+        audio_length = meta["FileSize"]
+        audio_type = "audio/wav"
+    else:
+        audio_length = audio_file.stat().st_size
+        audio_type = TRANSCODE_FORMATS[audio_format][2]
+
+    return {
+        "file": wav_file.name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "start": rec_start,
+        "end": rec_end,
+        "title": f"{rec_start}_{tgid_name}",
+        "date": start_date,
+        # there must be hyphens between the date items and title or it breaks
+        "post": f"{start_date}-{start_time}-{tgid_name}.md",
+        "permalink": f"/podcasts/{audio_directory}-{wav_file.stem}",
+        "url": f"{href_base}{audio_directory}/{audio_file.name}",
+        "length": audio_length,
+        "type": audio_type,
+        "duration": trans_datetime["PodcastDuration"],
+    }
+
+
+def podcast_post(entry):
+    """Jekyll post (markdown with front matter) for a manifest entry."""
+
+    return (
+        f"---\n"
+        f"layout: post\n"
+        f"title: \"{entry['title']}\"\n"
+        f"date: {entry['date']}\n"
+        f"categories: podcast\n"
+        f"tags: \n"
+        f"permalink: {entry['permalink']}\n"
+        f"podcast_link: {entry['url']}\n"
+        f"podcast_file_size: {entry['length'] // 1000} KB\n"
+        f"podcast_duration: \"{entry['duration']}\"\n"
+        f"podcast_length: {entry['length']}\n"
+        f"---\n\n"
+        f"{entry['post']}"
+    )
+
+
+def feed_item(entry):
+    """RSS <item> for a manifest entry."""
+
+    return RSS_ITEM.format(
+        title=escape(entry["title"]),
+        guid=escape(entry["permalink"]),
+        pub_date=format_datetime(_start_datetime(entry["start"])),
+        url=quoteattr(entry["url"]),
+        length=entry["length"],
+        type=entry.get("type", "audio/wav"),
+        duration=entry["duration"],
+    )
+
+
+class PodcastPublisher:
+    """Publishes the recordings in one directory, each recording only once."""
+
+    def __init__(
+        self,
+        source_path,
+        href_base="http://localhost:4000/scanner_audio/",
+        posts_path=None,
+        manifest_path=None,
+        audio_format=None,
+        trim_silence=False,
+    ):
+        """Initialization
+
+        Args:
+            source_path (str or Path): directory holding the wav files, its name
+                is the directory name on the web server
+            href_base (str): url of the directory holding source_path
+            posts_path (str or Path): Jekyll _posts directory, no posts are
+                written if None
+            manifest_path (str or Path): defaults to PODCAST_MANIFEST_NAME in
+                source_path
+            audio_format (str): serve recordings compressed to this
+                TRANSCODE_FORMATS format (stored next to the wav files)
+                instead of the wav files
+            trim_silence (bool): leave the silence out of the compressed files,
+                needs an audio_format and NumPy
+
+        Raises:
+            NotADirectoryError: if source_path isn't a directory
+            ValueError: if trim_silence is set without an audio_format
+            ImportError: if trim_silence is set and NumPy isn't installed
+        """
+
+        self.logger = logging.getLogger("uniden_api.PodcastPublisher")
+
+        self.source_path = Path(source_path)
+        if not self.source_path.is_dir():
+            raise NotADirectoryError(self.source_path)
+
+        self.href_base = href_base
+        self.posts_path = None if posts_path is None else Path(posts_path)
+        if manifest_path is None:
+            manifest_path = self.source_path / PODCAST_MANIFEST_NAME
+        self.manifest_path = Path(manifest_path)
+        self.audio_format = audio_format
+        if trim_silence and audio_format is None:
+            raise ValueError("trim_silence needs an audio_format")
+        if trim_silence and np is None:
+            raise ImportError("trim_silence needs numpy")
+        self.trim_silence = trim_silence
+
+    def published(self):
+        """Manifest entries by file name, the latest entry of each file.
+
+        Returns:
+            dict: {file name: manifest entry}
+        """
+
+        entries = {}
+        try:
+            with open(self.manifest_path) as manifest:
+                for line in manifest:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["file"]] = entry
+        except FileNotFoundError:
+            pass
+
+        return entries
+
+    def new_recordings(self, published=None):
+        """wav files that haven't been published, or changed since.
+
+        Returns:
+            list: Path of each recording, oldest first
+        """
+
+        if published is None:
+            published = self.published()
+
+        new = []
+        for wav_file in self.source_path.glob("*.wav"):
+            entry = published.get(wav_file.name)
+            if entry is not None:
+                stat = wav_file.stat()
+                if (entry["size"], entry["mtime_ns"]) == (
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ):
+                    continue
+            new.append(wav_file)
+
+        return sorted(new)
+
+    def publish(self, workers=None):
+        """Publish the new recordings, writing their posts if there is a
+        posts_path.
+
+        Args:
+            workers (int): number of files read (or encoded) at the same time
+
+        Returns:
+            list: manifest entries of the recordings published now
+        """
+
+        new = self.new_recordings()
+        audio_directory = self.source_path.name
+
+        audio_files = {}
+        if self.audio_format is not None:
+            audio_files = transcode_recordings(
+                new,
+                self.source_path,
+                self.audio_format,
+                workers,
+                trim_silence=self.trim_silence,
+            )
+
+        entries = []
+        for wav_file, meta in iter_wav_meta(new, workers):
+            if self.audio_format is not None and wav_file not in audio_files:
+                # not in the manifest, so it is tried again next time
+                self.logger.warning(f"{wav_file} wasn't encoded, skipped.")
+                continue
+            entry = recording_entry(
+                wav_file,
+                meta,
+                audio_directory,
+                self.href_base,
+                audio_files.get(wav_file),
+                self.audio_format,
+            )
+            if entry is None:
+                self.logger.warning(f"{wav_file} is missing metadata, skipped.")
+                continue
+            entries.append(entry)
+
+        entries.sort(key=lambda entry: (entry["start"], entry["file"]))
+
+        # posts first, so an interruption doesn't leave a recording without one
+        if self.posts_path is not None:
+            for entry in entries:
+                with open(self.posts_path / entry["post"], "w") as f:
+                    f.write(podcast_post(entry))
+
+        with open(self.manifest_path, "a") as manifest:
+            for entry in entries:
+                manifest.write(json.dumps(entry) + "\n")
+
+        self.logger.info(f"{len(entries)} recordings published.")
+
+        return entries
+
+    def write_feed(
+        self,
+        feed_path,
+        title="Scanner audio",
+        link="http://localhost:4000/",
+        description="Recordings from the scanner",
+        limit=None,
+    ):
+        """Write the RSS feed of the published recordings, newest first.
+
+        Args:
+            feed_path (str or Path): the feed file, replaced once complete
+            title (str): podcast title
+            link (str): podcast web site
+            description (str): podcast description
+            limit (int): only include the newest recordings
+
+        Returns:
+            int: number of items in the feed
+        """
+
+        entries = sorted(
+            self.published().values(),
+            key=lambda entry: (entry["start"], entry["file"]),
+            reverse=True,
+        )[:limit]
+
+        feed_path = Path(feed_path)
+        partial = feed_path.with_name(feed_path.name + ".part")
+        with open(partial, "w", encoding="utf-8") as feed:
+            feed.write(
+                RSS_HEADER.format(
+                    title=escape(title),
+                    link=escape(link),
+                    description=escape(description),
+                )
+            )
+            for entry in entries:
+                feed.write(feed_item(entry))
+            feed.write(RSS_FOOTER)
+        os.replace(partial, feed_path)
+
+        return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Publish scanner recordings as a podcast."
+    )
+    parser.add_argument("source_dir", type=str, help="directory holding wav files")
+    parser.add_argument(
+        "--href-base", type=str, default="http://localhost:4000/scanner_audio/"
+    )
+    parser.add_argument("--posts", type=str, default=None, help="Jekyll _posts")
+    parser.add_argument("--feed", type=str, default=None, help="RSS file to write")
+    parser.add_argument("--manifest", type=str, default=None)
+    parser.add_argument("--title", type=str, default="Scanner audio")
+    parser.add_argument(
+        "--format",
+        type=str,
+        default=None,
+        choices=sorted(TRANSCODE_FORMATS),
+        help="serve compressed copies instead of the wav files (needs ffmpeg)",
+    )
+    parser.add_argument(
+        "--trim-silence",
+        action="store_true",
+        help="leave squelch tails and dead air out of the compressed copies",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    publisher = PodcastPublisher(
+        args.source_dir,
+        args.href_base,
+        args.posts,
+        args.manifest,
+        args.format,
+        args.trim_silence,
+    )
+    entries = publisher.publish(workers=args.workers)
+    print(f"{len(entries)} recordings published.")
+
+    if args.feed is not None:
+        items = publisher.write_feed(args.feed, title=args.title)
+        print(f"{items} items in {args.feed}.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
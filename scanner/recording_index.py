@@ -0,0 +1,329 @@
+"""Index of the scanner recordings and their metadata in SQLite.
+
+Reading every WAV header on the SD card again for each run is slow, so
+RecordingIndex keeps the get_wav_meta() result of each recording keyed by
+path, together with the file size and modification time. A rescan only reads
+the headers of files that are new or have changed since they were indexed.
+Lookups by department, TGID, system or time range only touch the index.
+
+Example:
+    index = RecordingIndex("databases/recordings.sqlite")
+    index.scan("/Volumes/SDS100/BCDx36HP/audio/user_rec/")
+    for recording in index.iter_recordings(department="Houston Police"):
+        print(recording["path"], recording["meta"]["TGID:Name"])
+
+Usage:
+    Index (or re-index) a directory of recordings::
+
+        python -m scanner.recording_index databases/recordings.sqlite /Volumes/SDS100
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import scanner.scanner_utility_functions as suf
+
+# stored as the database user_version, bumped when get_wav_meta() reads the
+# same file differently, the rows of an older version are dropped and reread.
+# 2: tags after the pad byte of an odd length chunk
+RECORDING_INDEX_VERSION = 2
+
+# recordings columns, in table order
+RECORDING_FIELDS = (
+    "path",
+    "size",
+    "mtime_ns",
+    "start",
+    "end",
+    "system",
+    "department",
+    "channel",
+    "tgid",
+    "unit_id",
+    "meta",
+)
+
+# get_wav_meta() keys stored in their own (indexed) columns
+RECORDING_META_FIELDS = {
+    "start": "TransmissionStart",
+    "end": "TransmissionEnd",
+    "system": "System:Name:1",
+    "department": "Department:Name:1",
+    "channel": "TGID:Name",
+    "tgid": "TGID:TGID",
+    "unit_id": "UnitIds:UnitID",
+}
+
+RECORDINGS_CREATE = (
+    'CREATE TABLE IF NOT EXISTS "recordings" ('
+    '"path" TEXT PRIMARY KEY, "size" INTEGER, "mtime_ns" INTEGER, '
+    '"start" TEXT, "end" TEXT, "system" TEXT, "department" TEXT, '
+    '"channel" TEXT, "tgid" TEXT, "unit_id" TEXT, "meta" TEXT)'
+)
+
+RECORDINGS_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS "recordings_start" ON "recordings" ("start")',
+    'CREATE INDEX IF NOT EXISTS "recordings_department" '
+    'ON "recordings" ("department", "start")',
+    'CREATE INDEX IF NOT EXISTS "recordings_tgid" ON "recordings" ("tgid", "start")',
+    'CREATE INDEX IF NOT EXISTS "recordings_system" '
+    'ON "recordings" ("system", "start")',
+)
+
+RECORDINGS_UPSERT = (
+    f'INSERT OR REPLACE INTO "recordings" '
+    f"({', '.join(RECORDING_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(RECORDING_FIELDS))})"
+)
+
+# keyword arguments of iter_recordings() that filter on a column
+RECORDING_FILTERS = ("system", "department", "channel", "tgid", "unit_id")
+
+
+def _time_code(value):
+    """TransmissionStart style string (yyyymmddhhmmss) for a datetime."""
+
+    if isinstance(value, datetime):
+        return value.strftime("%Y%m%d%H%M%S")
+
+    return value
+
+
+def recording_to_row(path, stat, meta):
+    """recordings row for a wav file.
+
+    Args:
+        path (str): absolute path of the wav file
+        stat (os.stat_result): stat of the file when meta was read
+        meta (dict): get_wav_meta() result, None if the file was unreadable
+
+    Returns:
+        tuple: values in RECORDING_FIELDS order
+    """
+
+    if meta is None:
+        columns = [None] * len(RECORDING_META_FIELDS)
+        meta_json = None
+    else:
+        columns = [meta.get(key) for key in RECORDING_META_FIELDS.values()]
+        meta_json = json.dumps(meta)
+
+    return (path, stat.st_size, stat.st_mtime_ns, *columns, meta_json)
+
+
+class RecordingIndex:
+    """Keeps wav file metadata in SQLite so only changed files are reread."""
+
+    def __init__(self, db_path="recordings.sqlite", batch_size=500):
+        """Open (or create) the index.
+
+        Args:
+            db_path (str): path of the sqlite database
+            batch_size (int): rows written per transaction while scanning
+        """
+
+        self.logger = logging.getLogger("uniden_api.RecordingIndex")
+
+        self.db_path = db_path
+        self.batch_size = batch_size
+
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(RECORDINGS_CREATE)
+            for statement in RECORDINGS_INDEXES:
+                self.conn.execute(statement)
+
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < RECORDING_INDEX_VERSION:
+                dropped = self.conn.execute('DELETE FROM "recordings"').rowcount
+                if dropped:
+                    self.logger.info(
+                        f"index version {version} is out of date, "
+                        f"{dropped} recordings will be reread"
+                    )
+                self.conn.execute(f"PRAGMA user_version = {RECORDING_INDEX_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT count(*) FROM "recordings"').fetchone()[0]
+
+    def update(self, wav_files, workers=None, processes=False, progress=None):
+        """Read the metadata of the wav files that are new or changed.
+
+        Files are compared by size and modification time, the headers of
+        unchanged files aren't read at all.
+
+        Args:
+            wav_files (iterable): paths of wav files
+            workers (int): number of files read at the same time
+            processes (bool): use worker processes instead of threads
+            progress (callable): called with (files done, files to read)
+
+        Returns:
+            list: absolute paths of the files that were (re)read
+        """
+
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.conn.execute(
+                'SELECT path, size, mtime_ns FROM "recordings"'
+            )
+        }
+
+        stale = {}
+        for wav_file in wav_files:
+            path = os.path.abspath(wav_file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.logger.warning(f"{path} disappeared before it was indexed")
+                continue
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                stale[path] = stat
+
+        self.logger.info(f"{len(stale)} of {len(known)} indexed files to read")
+
+        batch = []
+        meta_stream = suf.iter_wav_meta(list(stale), workers, processes, progress)
+        for path, meta in meta_stream:
+            batch.append(recording_to_row(path, stale[path], meta))
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        self._write(batch)
+
+        return list(stale)
+
+    def scan(self, directory, workers=None, processes=False, progress=None):
+        """Index every wav file below directory, forget the ones that are gone.
+
+        Returns:
+            list: absolute paths of the files that were (re)read
+        """
+
+        directory = os.path.abspath(directory)
+        wav_files = [os.fspath(wav) for wav in Path(directory).rglob("*.wav")]
+
+        # rows of files that were deleted or moved away
+        present = set(wav_files)
+        gone = [
+            (path,)
+            for (path,) in self.conn.execute(
+                'SELECT path FROM "recordings" WHERE path >= ? AND path < ?',
+                (directory + os.sep, directory + chr(ord(os.sep) + 1)),
+            )
+            if path not in present
+        ]
+        with self.conn:
+            self.conn.executemany('DELETE FROM "recordings" WHERE path = ?', gone)
+        if gone:
+            self.logger.info(f"{len(gone)} missing files removed from the index")
+
+        return self.update(wav_files, workers, processes, progress)
+
+    def get_meta(self, wav_file):
+        """Indexed metadata of a wav file.
+
+        Returns:
+            dict: get_wav_meta() result as it was when the file was indexed
+            None: if the file isn't indexed or wasn't readable
+        """
+
+        row = self.conn.execute(
+            'SELECT meta FROM "recordings" WHERE path = ?',
+            (os.path.abspath(wav_file),),
+        ).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+
+        return json.loads(row[0])
+
+    def iter_recordings(self, start=None, end=None, meta=True, **filters):
+        """Stream indexed recordings, oldest first, without reading any files.
+
+        Args:
+            start (datetime or str): first TransmissionStart to include
+            end (datetime or str): first TransmissionStart to leave out
+            meta (bool): include the full metadata dict under "meta"
+            **filters: system, department, channel, tgid or unit_id to match
+
+        Returns:
+            iterator: dict per recording with RECORDING_FIELDS keys
+        """
+
+        unknown = set(filters) - set(RECORDING_FILTERS)
+        if unknown:
+            raise ValueError(f"can't filter on {', '.join(sorted(unknown))}")
+
+        # unreadable files are only kept to skip them on the next scan
+        conditions = ["meta IS NOT NULL"]
+        params = []
+        if start is not None:
+            conditions.append("start >= ?")
+            params.append(_time_code(start))
+        if end is not None:
+            conditions.append("start < ?")
+            params.append(_time_code(end))
+        for column, value in filters.items():
+            conditions.append(f'"{column}" = ?')
+            params.append(value)
+
+        fields = RECORDING_FIELDS if meta else RECORDING_FIELDS[:-1]
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(fields)} FROM \"recordings\" "
+            f"WHERE {' AND '.join(conditions)} ORDER BY start, path",
+            params,
+        )
+
+        try:
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    recording = dict(zip(fields, row))
+                    if meta:
+                        recording["meta"] = json.loads(recording["meta"])
+                    yield recording
+        finally:
+            cursor.close()
+
+    def _write(self, rows):
+        if not rows:
+            return
+
+        with self.conn:
+            self.conn.executemany(RECORDINGS_UPSERT, rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index scanner recordings.")
+    parser.add_argument("db_path", type=str)
+    parser.add_argument("directory", type=str, help="directory holding wav files")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with RecordingIndex(args.db_path) as index:
+        read = index.scan(args.directory, workers=args.workers)
+        print(f"{len(read)} files read, {len(index)} recordings indexed.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,17 +5,27 @@ Utility functions for use with Uniden SDS-100 and uniden-api code.
 
 from pathlib import Path
 import os
+import glob
+import errno
+import filecmp
 import subprocess as sb
 import shutil
 import logging
+import concurrent.futures as cf
 import pyperclip as cb
 from datetime import datetime, date, time, timedelta
 
 from collections import OrderedDict
-from tinytag import TinyTag
-import chunk
+import struct
+import mmap
 
 from pydub import AudioSegment
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from scanner.constants import *
 
 # import pandas as pd
@@ -48,6 +58,32 @@ def unique_path(directory, name_pattern):
             return path
 
 
+# where the scanner keeps its recordings, relative to the SD card root
+SCANNER_AUDIO_PATH = "BCDx36HP/audio/user_rec"
+
+# places the SD card is mounted (macOS, Linux desktops, manual mounts)
+SCANNER_VOLUME_PATTERNS = ("/Volumes/{}", "/media/*/{}", "/run/media/*/{}", "/mnt/{}")
+
+
+def find_scanner_volume(volume_name="SDS100"):
+    """Find the mount point of the scanner SD card.
+
+    Args:
+        volume_name (str): volume label of the card
+
+    Returns:
+        Path: first mount point holding the scanner recordings directory
+        None: if the card isn't mounted
+    """
+
+    for pattern in SCANNER_VOLUME_PATTERNS:
+        for mount_point in sorted(glob.glob(pattern.format(volume_name))):
+            if Path(mount_point, SCANNER_AUDIO_PATH).is_dir():
+                return Path(mount_point)
+
+    return None
+
+
 def get_directories(directory):
     """Return all directories contained within the passed wav_source. Doesn't
     scan recursively for subdirectories.
@@ -132,243 +168,739 @@ def files_with_matched_tags(working_dir, tags):
     return paths_to_tagged_files
 
 
-def merge_tagged_wav_files(wav_file_paths, merged_wav_name=r"merged_{:03d}.wav"):
+def merge_tagged_wav_files(
+    wav_file_paths, merged_wav_name=r"merged_{:03d}.wav", trim_silence=False
+):
     """ Simple function to combine multiple wav files into a single file.
 
     Args:
         wav_file_paths (list): list of Path objects for wav files you wish to
             combine
         merged_wav_name (str): optional file name and format string.
+        trim_silence (bool): leave out the silence (squelch tails, dead air) of
+            each file, see wav_voiced_ranges()
 
     Returns:
         False (bool): if no wave files are passed to the function
         (str): string containing path to newly created wav file
 
+    Notes:
+        The audio is copied straight into the new file by merge_wav_files(),
+        pydub is only used if the files don't all have the same format (and
+        then the silence isn't trimmed).
     """
     if wav_file_paths is None:
         print("No files contained specified tags.")
         return False
 
-    # container for wav files we wish to be merged
-    combined_sounds = AudioSegment.empty()
-
     # don't overwrite existing files
     merged_wav_path = unique_path(Path.cwd(), merged_wav_name)
 
-    for file in wav_file_paths:
-        combined_sounds = combined_sounds + AudioSegment.from_wav(str(file))
+    try:
+        merge_wav_files(wav_file_paths, merged_wav_path, trim_silence)
+    except ValueError as err:
+        suf_logger.info(f"{err}, merging with pydub instead.")
+
+        # container for wav files we wish to be merged
+        combined_sounds = AudioSegment.empty()
 
-    combined_sounds.export(merged_wav_path, format="wav")
+        for file in wav_file_paths:
+            combined_sounds = combined_sounds + AudioSegment.from_wav(str(file))
+
+        combined_sounds.export(merged_wav_path, format="wav")
 
     return merged_wav_path
 
 
-def get_wav_meta(wav_source, chunk_dict=None):
+# bytes copied at a time when merging wav files
+WAV_COPY_BUFFER_SIZE = 1 << 16
+
+# fmt chunk: format, channels, sample rate, byte rate, block align, bits
+WAV_FMT = struct.Struct("<HHIIHH")
+
+# chunk id and little endian length at the start of every chunk
+CHUNK_HEADER = struct.Struct("<4sI")
+
+
+def _iter_chunks(read, end, position=12):
+    """Walk the chunks of a RIFF file, or of a list chunk in it.
+
+    Args:
+        read (callable): read(size, offset), bytes of the file at offset
+        end (int): offset the chunks end at, the file size for the whole file
+        position (int): offset of the first chunk header
+
+    Yields:
+        tuple: (chunk id, data offset, data length), recordings cut short can
+            claim more data than the file holds, the length is what it holds
+    """
+    while position + 8 <= end:
+        chunk_id, chunk_length = CHUNK_HEADER.unpack(read(8, position))
+        offset = position + 8
+        chunk_length = min(chunk_length, end - offset)
+        yield chunk_id, offset, chunk_length
+        # chunks are padded to an even length, the length doesn't count the pad
+        position = offset + chunk_length + (chunk_length & 1)
+
+
+def _wav_audio_chunks(f, wav_source):
+    """fmt chunk data and the position and length of the audio data.
+
+    Args:
+        f (file): wav file opened in binary mode
+        wav_source (str or Path): path of the file, for error messages
+
+    Returns:
+        tuple: (fmt chunk bytes, data offset, data length)
+
+    Raises:
+        ValueError: if the file isn't a WAV file with fmt and data chunks
+    """
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+        raise ValueError(f"{wav_source} is not a WAV file")
+
+    def read(size, offset):
+        return _read_at(f, size, offset)
+
+    fmt = None
+    for chunk_id, offset, length in _iter_chunks(read, os.fstat(f.fileno()).st_size):
+        if chunk_id == b"fmt ":
+            fmt = read(length, offset)
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            # keep whole sample frames of recordings cut short, so the files
+            # merged after it line up
+            if len(fmt) >= WAV_FMT.size:
+                block_align = WAV_FMT.unpack_from(fmt)[4] or 1
+                length -= length % block_align
+            return fmt, offset, length
+
+    raise ValueError(f"{wav_source} has no audio data")
+
+
+def write_wav_data(wav_path, fmt, sources):
+    """Write a wav file from pieces of the audio data of other wav files.
+
+    Each piece is copied a buffer at a time, so memory use doesn't depend on
+    the length of the audio. The RIFF and data sizes are written once all the
+    audio has been copied.
+
+    Args:
+        wav_path (str or Path): path of the new wav file
+        fmt (bytes): fmt chunk data, the pieces must all have this format
+        sources (iterable): (wav file, offset, length) of each piece, in
+            playing order
+
+    Returns:
+        int: number of bytes of audio data written
+    """
+    data_length_total = 0
+    with open(wav_path, "wb") as wav:
+        # sizes are filled in at the end
+        wav.write(b"RIFF\x00\x00\x00\x00WAVE")
+        wav.write(CHUNK_HEADER.pack(b"fmt ", len(fmt)) + fmt)
+        if len(fmt) & 1:
+            wav.write(b"\x00")
+        data_header_position = wav.tell()
+        wav.write(CHUNK_HEADER.pack(b"data", 0))
+
+        buffer = bytearray(WAV_COPY_BUFFER_SIZE)
+        view = memoryview(buffer)
+        for wav_file, offset, length in sources:
+            with open(wav_file, "rb", buffering=0) as f:
+                f.seek(offset)
+                remaining = length
+                while remaining:
+                    read = f.readinto(view[: min(remaining, len(buffer))])
+                    if not read:
+                        break
+                    wav.write(view[:read])
+                    remaining -= read
+                    data_length_total += read
+
+        if data_length_total & 1:
+            wav.write(b"\x00")
+        riff_length = wav.tell() - 8
+
+        wav.seek(4)
+        wav.write(struct.pack("<I", riff_length))
+        wav.seek(data_header_position)
+        wav.write(CHUNK_HEADER.pack(b"data", data_length_total))
+
+    return data_length_total
+
+
+def merge_wav_files(wav_file_paths, merged_wav_path, trim_silence=False):
+    """Concatenate the audio of wav files that share the same format.
+
+    The audio data is copied into the new file without decoding it, see
+    write_wav_data().
+
+    Args:
+        wav_file_paths (list): paths of the wav files, in playing order
+        merged_wav_path (str or Path): path of the new wav file
+        trim_silence (bool): only copy the parts of each file that aren't
+            silence, see wav_voiced_ranges()
+
+    Returns:
+        int: number of bytes of audio data written
+
+    Raises:
+        ValueError: if a file isn't a WAV file or its format (channels, sample
+            rate, ...) differs from the first file, nothing is written then
+    """
+    # check all the files before creating the new one
+    sources = []
+    fmt = None
+    for wav_file in wav_file_paths:
+        if trim_silence:
+            file_fmt, ranges = wav_voiced_ranges(wav_file)
+        else:
+            with open(wav_file, "rb") as f:
+                file_fmt, data_start, data_length = _wav_audio_chunks(f, wav_file)
+            ranges = [(data_start, data_length)]
+        if fmt is None:
+            fmt = file_fmt
+        elif file_fmt != fmt:
+            raise ValueError(f"{wav_file} format differs from {wav_file_paths[0]}")
+        sources.extend((wav_file, offset, length) for offset, length in ranges)
+
+    if fmt is None:
+        raise ValueError("no wav files to merge")
+
+    return write_wav_data(merged_wav_path, fmt, sources)
+
+
+# silence detection defaults, see wav_voiced_ranges()
+SILENCE_THRESHOLD_DB = -45.0
+SILENCE_FRAME_MS = 20
+SILENCE_MIN_MS = 500
+SILENCE_PADDING_MS = 100
+
+
+def _voiced_runs(voiced, min_gap, padding):
+    """(start, end) frame ranges of the runs of voiced frames.
+
+    Args:
+        voiced (numpy.ndarray): bool per frame
+        min_gap (int): shorter gaps between runs are kept as part of the audio
+        padding (int): frames kept before and after each run
+
+    Returns:
+        list: (first frame, frame after the last) tuples
+    """
+
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) - padding
+    ends = np.flatnonzero(edges == -1) + padding
+    if not len(starts):
+        return []
+
+    # join runs that are separated by less than min_gap (or overlap)
+    keep = starts[1:] - ends[:-1] >= min_gap
+    starts = starts[np.concatenate(([True], keep))]
+    ends = ends[np.concatenate((keep, [True]))]
+
+    return list(
+        zip(np.maximum(starts, 0).tolist(), np.minimum(ends, len(voiced)).tolist())
+    )
+
+
+def wav_voiced_ranges(
+    wav_file,
+    threshold_db=SILENCE_THRESHOLD_DB,
+    min_silence_ms=SILENCE_MIN_MS,
+    padding_ms=SILENCE_PADDING_MS,
+    frame_ms=SILENCE_FRAME_MS,
+):
+    """Find the parts of a recording that aren't silence.
+
+    The audio is split into frame_ms frames and a frame is silent if its RMS
+    level is below threshold_db (dB relative to full scale). The samples are
+    read from the mapped file (WavRecording) and all frames are measured at
+    once.
+
+    Args:
+        wav_file (str or Path): 8 or 16 bit PCM wav file
+        threshold_db (float): level below which a frame is silent
+        min_silence_ms (int): shorter silences are kept
+        padding_ms (int): audio kept before and after each voiced part
+        frame_ms (int): length of the frames that are measured
+
+    Returns:
+        tuple: (fmt chunk bytes, list of (data offset, length) in bytes)
+
+    Raises:
+        ValueError: if the file isn't an 8 or 16 bit PCM wav file
+        ImportError: if NumPy isn't installed
+    """
+    if np is None:
+        raise ImportError("silence detection needs numpy")
+
+    with WavRecording(wav_file) as recording:
+        audio_format, channels, sample_rate, _, block_align, bits = recording.fmt
+        fmt = bytes(recording.chunk(b"fmt "))
+        data_start, data_length = recording.chunks[b"data"]
+        # whole sample frames only, recordings cut short can end mid sample
+        data_length -= data_length % (block_align or 1)
+
+        frame_length = max(1, sample_rate * frame_ms // 1000)
+        frame_bytes = frame_length * block_align
+        frame_count = data_length // frame_bytes
+        if frame_count == 0:
+            return fmt, [(data_start, data_length)]
+
+        # 8 bit samples are unsigned, 128 is silence
+        zero, full_scale = (0.0, 32768.0) if bits == 16 else (128.0, 128.0)
+        samples = recording.samples()[: frame_count * frame_length]
+        samples = samples.astype(np.float32)
+        samples -= zero
+
+    power = np.square(samples).reshape(frame_count, -1).mean(axis=1)
+    voiced = power > (full_scale * 10 ** (threshold_db / 20)) ** 2
+
+    runs = _voiced_runs(
+        voiced,
+        -(-min_silence_ms // frame_ms),
+        -(-padding_ms // frame_ms),
+    )
+
+    ranges = []
+    for start, end in runs:
+        # the last run also keeps the samples after the last whole frame
+        end_byte = data_length if end == frame_count else end * frame_bytes
+        start_byte = start * frame_bytes
+        ranges.append((data_start + start_byte, end_byte - start_byte))
+
+    return fmt, ranges
+
+
+def trim_silence(wav_file, output, split=False, **options):
+    """Write a recording without its silence, or split it at the silences.
+
+    The audio data is copied from wav_file without decoding it again.
+
+    Args:
+        wav_file (str or Path): 8 or 16 bit PCM wav file
+        output (str or Path): trimmed wav file, with split the parts are
+            numbered: name_001.wav, name_002.wav, ...
+        split (bool): write each voiced part to its own file
+        **options: see wav_voiced_ranges()
+
+    Returns:
+        list: paths of the files written, none with split if it is all silence
+    """
+    fmt, ranges = wav_voiced_ranges(wav_file, **options)
+    output = Path(output)
+
+    if not split:
+        write_wav_data(output, fmt, ((wav_file, *piece) for piece in ranges))
+        return [output]
+
+    outputs = []
+    for number, piece in enumerate(ranges, 1):
+        part = output.with_name(f"{output.stem}_{number:03d}{output.suffix}")
+        write_wav_data(part, fmt, [(wav_file, *piece)])
+        outputs.append(part)
+
+    return outputs
+
+
+# bytes read from the start of a wav file in one go, enough for the whole
+# scanner metadata header of a typical recording
+WAV_HEADER_READ_SIZE = 4096
+
+# the unid chunk stores 64 bytes of each line, then a null separator
+UNID_LINE_LENGTH = 65
+
+# WAV_METADATA entries for chunk ids as they appear in the file
+WAV_METADATA_CHUNK_IDS = {
+    key.encode(): value for key, value in WAV_METADATA.items() if len(key) == 4
+}
+
+# unid lines in the order they are recorded
+UNID_DATA_HEADINGS = (
+    UNID_FAVORITES_DATA,
+    UNID_SYSTEM_DATA,
+    UNID_DEPARTMENT_DATA,
+    UNID_CHANNEL_DATA,
+    UNID_SITE_DATA,
+    UNID_UNITID_DATA,
+    UNID_CONVENTIONAL_DATA,
+)
+
+
+def _parse_unid_chunk(data, chunk_dict):
+    """Add the unid chunk lines and their UNID_*_DATA fields to chunk_dict."""
+
+    delimited_lines = []
+
+    # record all UTF-8 lines and stop at the first non-UTF-8 line
+    for offset in range(0, len(data), UNID_LINE_LENGTH):
+        try:
+            chunk_line = data[offset : offset + UNID_LINE_LENGTH].decode()
+        except UnicodeDecodeError:
+            break
+
+        chunk_line = chunk_line.rstrip("\x00").replace("\x00", "\t").split("\t")
+        delimited_lines.append(chunk_line)
+
+        # create new entry in dict for raw lines (for debugging)
+        chunk_dict[f"line {len(delimited_lines)}"] = chunk_line
+
+    # grab key and value from each line and save to dict
+    for headings, line in zip(UNID_DATA_HEADINGS, delimited_lines):
+        chunk_dict.update(zip(headings, line))
+
+
+def _read_at(f, size, offset):
+    """size bytes of file f starting at offset, fewer at the end of the file."""
+
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+
+    f.seek(offset)
+    return f.read(size)
+
+
+def _iter_meta_chunks(read, end):
+    """_iter_chunks() with the tags of LIST INFO chunks in place of the list."""
+
+    for chunk_id, offset, length in _iter_chunks(read, end):
+        # other lists don't hold scanner metadata
+        if chunk_id == b"LIST" and read(4, offset) == b"INFO":
+            yield from _iter_chunks(read, offset + length, offset + 4)
+        else:
+            yield chunk_id, offset, length
+
+
+def get_wav_meta(wav_source):
     """Read the scanner generated metadata at the start of the file
 
     Args:
-        wav_source (str or Chunk): path string of wav file
-        chunk_dict (dict): this dictionary is used for recursive calls and allows us to
-            pass partially processed data back to function.
+        wav_source (str or Path): path of wav file
 
     Returns:
         (dict): RIFF tag name: string or bytes representing tag data
+        None: if the file is not a WAV file
 
     Notes:
         It looks like the scanner is only saving the first 64 bytes of data
         from any given formatting category, then space, then another 64 bytes.
 
+        Only the header is read (WAV_HEADER_READ_SIZE bytes, more if the
+        metadata chunks are longer). The chunks are walked in a loop until the
+        fmt chunk that precedes the audio.
     """
-    # scan_frame = pd.DataFrame(columns=["offset", "data"])
+    f_name = os.path.basename(os.fspath(wav_source))
 
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    with open(wav_source, "rb", buffering=0) as f:
+        return _wav_meta(_read_at(f, WAV_HEADER_READ_SIZE, 0), f_name, f)
 
-    # if the wav_source is not already a Chunk instance, treat it like file
-    # because this is the first pass through function
-    if not isinstance(wav_source, chunk.Chunk):
-        f_path = Path(wav_source)
-        f = open(f_path, "rb")
 
-        # The file name is the transmission start time,
-        # reformatting to match the transmission end time
-        # found in the WAV header.
-        transmission_start = f_path.stem.replace("-", "")
-        transmission_start = transmission_start.replace("_", "")
+def _wav_meta(header, f_name, f=None):
+    """get_wav_meta() of a file that starts with header.
 
-        # initializing dict containing chunk data
-        chunk_dict = {"TransmissionStart": transmission_start}
+    Args:
+        header (bytes or mmap.mmap): the start of the file, or all of it
+        f_name (str): file name, it is the transmission start time
+        f (file): the open file to read more of, None if header is all of it
 
-        # chunk will allow us to parse the byte data in the wav file
-        meta_chunk = chunk.Chunk(f, align=False, bigendian=False, inclheader=False)
-    else:
-        # use Chunk method to get the chunk name
-        chunk_name = wav_source.getname()
+    Returns:
+        see get_wav_meta()
+    """
+    # The file name is the transmission start time,
+    # reformatting to match the transmission end time
+    # found in the WAV header.
+    transmission_start = os.path.splitext(f_name)[0].replace("-", "")
+    transmission_start = transmission_start.replace("_", "")
 
-        # the file size is riff bytes plus the 8 bytes of chunk data just read
-        if chunk_name == b"RIFF" and chunk_dict.get("FileSize") is None:
-            chunk_dict["FileSize"] = wav_source.getsize() + 8
+    # initializing dict containing chunk data
+    chunk_dict = {"TransmissionStart": transmission_start}
 
-        try:
-            meta_chunk = chunk.Chunk(
-                wav_source, align=False, bigendian=False, inclheader=False
-            )
-        except EOFError:
-            logger.exception(f"Done parsing {chunk_name} chunk.", exc_info=False)
-            return chunk_dict
+    if len(header) < 12 or header[:4] != b"RIFF":
+        suf_logger.info(f"{f_name} appears to be corrupt or not WAV file.")
+        return None
+
+    # the file size is riff bytes plus the 8 bytes of chunk data just read
+    chunk_dict["FileSize"] = struct.unpack_from("<I", header, 4)[0] + 8
 
     # the first 4 bytes are the first chunk ID and should be "WAVE"
-    try:
-        if meta_chunk.getname() == b"RIFF":
-            try:
-                first_id = meta_chunk.read(4)
-                if first_id != b"WAVE":
-                    logger.info(f"First tag ID is {first_id}, not WAVE")
-                    return
-            except AssertionError:
-                logger.exception("The 4 bytes after RIFF are not a UTF8 tag.")
-                return
-
-            # create a new instance that is the child to RIFF chunk
-            # meta_chunk = get_wav_meta(meta_chunk, chunk_dict)
-            return get_wav_meta(meta_chunk, chunk_dict)
-    except AssertionError:
-        logger.exception("The file appears to be corrupt or not WAV file.")
-        return
+    if header[8:12] != b"WAVE":
+        suf_logger.info(f"First tag ID is {header[8:12]}, not WAVE")
+        return None
 
-    chunk_id = meta_chunk.getname()
-    chunk_length = meta_chunk.getsize()
-    current_location = meta_chunk.tell()
-
-    if chunk_id == b"LIST":
-        if current_location == 0:
-            list_chunk = meta_chunk.read(4)
-            if list_chunk == b"INFO":
-                logger.info("INFO sub-chunk of LIST chunk.")
-                return get_wav_meta(wav_source, chunk_dict)
-            else:
-                logger.info("LIST chunk does not contain INFO chunk.")
-                return
-        elif current_location == chunk_length:
-            return get_wav_meta(meta_chunk, chunk_dict)
-
-    if chunk_id == b"fmt ":
-        logger.info("Found fmt chunk.")
-        # don't return the chunk dict if it's just that first entry.
-        if len(chunk_dict.items()) <= 1:
-            logger.debug("Made it to fmt with no metadata tags.")
-            return chunk_dict
+    if f is None:
+        end = len(header)
+
+        def read(size, offset):
+            return header[offset : offset + size]
+
+    else:
+        end = os.fstat(f.fileno()).st_size
+
+        def read(size, offset):
+            nonlocal header
+            if offset + size > len(header):
+                # metadata runs past what has been read so far
+                missing = max(offset + size - len(header), WAV_HEADER_READ_SIZE)
+                header += _read_at(f, missing, len(header))
+            return header[offset : offset + size]
+
+    for chunk_id, data_start, chunk_length in _iter_meta_chunks(read, end):
+        # most chunks are the INFO tags
+        uniden_chunk_id = WAV_METADATA_CHUNK_IDS.get(chunk_id)
+        if uniden_chunk_id is None:
+            if chunk_id == b"fmt ":
+                # the metadata chunks all come before the audio format
+                break
+            if chunk_id == b"unid":
+                _parse_unid_chunk(read(chunk_length, data_start), chunk_dict)
+            continue
+
+        meta_chunk_data = read(chunk_length, data_start)
+        if uniden_chunk_id == "IKEY":
+            meta_chunk_data = meta_chunk_data.strip(b"\x00")
         else:
-            return chunk_dict
+            # text up to the first null
+            meta_chunk_data = meta_chunk_data.lstrip(b"\x00").partition(b"\x00")[0]
+        try:
+            chunk_dict[uniden_chunk_id] = meta_chunk_data.decode()
+        except UnicodeDecodeError:
+            suf_logger.debug(
+                f"Uniden Chunk ID {chunk_id} data "
+                f"{meta_chunk_data} doesn't contain valid UTF8."
+            )
 
-    if chunk_id == b"unid":
-        # I don't understand code starting after byte 1180 or so
+    return chunk_dict
 
-        # absolute starting byte position of current chunk
-        start_byte = meta_chunk.tell()
 
-        delimited_lines_bytes = []
-        # variable to contain decoded string
-        delimited_lines = []
+# printable stand-ins for the control characters in hex_dump_string()
+HEX_DUMP_REPLACEMENTS = {
+    0x00: "|",  # NUL
+    0x01: "\\x01",  # SOH
+    0x02: "\\x02",  # STX
+    0x03: "\\x03",  # ETX
+    0x04: "\\x04",  # EOT
+    0x08: "\\x08",  # BS
+}
 
-        # record all UTF-8 bytes and stop at the first non-UTF-8 byte
-        while meta_chunk.tell() - start_byte <= chunk_length:
-            # scanner records 64 bytes of format, then adds null separator
-            chunk_line_bytes = meta_chunk.read(65)
-            try:
-                chunk_line = chunk_line_bytes.decode()
-            # hop out of the loop once you hit a non-utf8 character
-            except UnicodeDecodeError:
-                # pos_in_chunk = meta_chunk.tell() - start_byte
-                logger.exception(
-                    "65 byte string contained non-UTF8 " "characters", exc_info=False
-                )
-                break
+# text of each ASCII byte, bytes from 0x80 up aren't UTF-8 on their own
+_HEX_DUMP_TEXT = [HEX_DUMP_REPLACEMENTS.get(code, chr(code)) for code in range(128)]
 
-            chunk_line = chunk_line.rstrip("\x00")
-            chunk_line = chunk_line.replace("\x00", "\t")
-            chunk_line = chunk_line.split("\t")
-
-            delimited_lines_bytes.append(chunk_line_bytes)
-            delimited_lines.append(chunk_line)
-
-            # create new entry in dict for raw lines (for debugging)
-            chunk_dict[f"line {len(delimited_lines)}"] = chunk_line
-
-        # todo: ensure lines go to correct definition list
-        data_heading_sources = (
-            UNID_FAVORITES_DATA,
-            UNID_SYSTEM_DATA,
-            UNID_DEPARTMENT_DATA,
-            UNID_CHANNEL_DATA,
-            UNID_SITE_DATA,
-            UNID_UNITID_DATA,
-            UNID_CONVENTIONAL_DATA,
-        )
 
-        # storage for unid data
-        unid_list = []
+def hex_dump_string(data, start=0):
+    """Readable text of raw header bytes, for working out the file layout.
 
-        # creates a list of all the items from unid header
-        for index, line in enumerate(data_heading_sources):
-            unid_list += list(zip(line, delimited_lines[index]))
+    Args:
+        data (bytes-like): bytes to show, e.g. a WavRecording.buffer slice
+        start (int): file offset of data
 
-        # grab key and value from each tuple and save to dict
-        for meta_item in unid_list:
-            chunk_dict[meta_item[0]] = meta_item[1]
+    Returns:
+        (str): text with NULs as "|", a few control characters escaped and
+            non-ASCII bytes labelled «position raw byte», where position is
+            the offset within the RIFF chunk data (file offset - 8) after it
+    """
+    text = _HEX_DUMP_TEXT
 
-        # skip the rest of this chunk, which moves all playheads
-        meta_chunk.skip()
+    return "".join(
+        text[code] if code < 128 else f"«{start + i - 7} {bytes((code,))}»"
+        for i, code in enumerate(bytes(data))
+    )
 
-        # return original chunk, not current chunk
-        return get_wav_meta(wav_source, chunk_dict)
 
-    try:
-        # useful data will be UTF8 and not non-text binary
-        decoded_chunk_id = chunk_id.decode()
-    except UnicodeDecodeError:
-        logger.exception(f"chunk ID: {chunk_id} is not valid UTF8.", exc_info=False)
-        # decoded_chunk_id = "invalid"
-        return get_wav_meta(meta_chunk, chunk_dict)
+class WavRecording:
+    """Memory mapped scanner recording.
 
-    try:
-        uniden_chunk_id = WAV_METADATA[decoded_chunk_id]
-    except KeyError:
-        logger.exception(
-            f"chunk {decoded_chunk_id} is not a vallid " f"UNIDEN metadata tag ID.",
-            exc_info=False,
+    The file is mapped once and the chunks are found by walking their
+    headers. The unid block, the audio data and the samples are views of the
+    mapping, nothing is read or copied until it is used.
+
+    Example:
+        with WavRecording(wav_file) as recording:
+            meta = recording.meta()
+            samples = recording.samples()  # NumPy view, (frames, channels)
+
+    Notes:
+        The mapping is closed by close() once no views of it are left.
+    """
+
+    def __init__(self, wav_source):
+        """Map a wav file.
+
+        Args:
+            wav_source (str or Path): path of wav file
+
+        Raises:
+            ValueError: if the file is empty or not a WAV file
+        """
+
+        self.path = Path(wav_source)
+        with open(wav_source, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+
+        if self.buffer[:4] != b"RIFF" or self.buffer[8:12] != b"WAVE":
+            self.close()
+            raise ValueError(f"{wav_source} is not a WAV file")
+
+        # {chunk id: (data offset, data length)}, first of each id
+        self.chunks = {}
+        for chunk_id, offset, length in _iter_chunks(self._read, len(self.buffer)):
+            self.chunks.setdefault(chunk_id, (offset, length))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.buffer.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views are still in use, the mapping goes away with the last one
+            pass
+
+    def _read(self, size, offset):
+        return self.buffer[offset : offset + size]
+
+    def chunk(self, chunk_id):
+        """View of the data of a chunk, None if the file doesn't have it.
+
+        Args:
+            chunk_id (bytes): 4 byte chunk id, e.g. b"unid"
+        """
+
+        if chunk_id not in self.chunks:
+            return None
+
+        offset, length = self.chunks[chunk_id]
+
+        return self.buffer[offset : offset + length]
+
+    @property
+    def fmt(self):
+        """(format, channels, sample rate, byte rate, block align, bits)
+
+        Raises:
+            ValueError: if the file has no fmt or data chunk
+        """
+
+        if b"fmt " not in self.chunks or b"data" not in self.chunks:
+            raise ValueError(f"{self.path} has no audio data")
+
+        return WAV_FMT.unpack_from(self.chunk(b"fmt "))
+
+    @property
+    def unid(self):
+        """View of the proprietary unid block."""
+
+        return self.chunk(b"unid")
+
+    @property
+    def data(self):
+        """View of the audio data."""
+
+        return self.chunk(b"data")
+
+    def samples(self):
+        """The audio as a read only NumPy array of shape (frames, channels).
+
+        Raises:
+            ValueError: if the audio isn't 8 or 16 bit PCM
+            ImportError: if NumPy isn't installed
+        """
+        if np is None:
+            raise ImportError("sample access needs numpy")
+
+        audio_format, channels, _, _, block_align, bits = self.fmt
+        if audio_format != 1 or bits not in (8, 16):
+            raise ValueError(f"{self.path} is not 8 or 16 bit PCM")
+
+        data = self.data
+        frame_count = len(data) // block_align
+        samples = np.frombuffer(
+            data, "<i2" if bits == 16 else "u1", frame_count * channels
         )
-        return get_wav_meta(meta_chunk, chunk_dict)
 
-    meta_chunk_data = meta_chunk.read()
-    meta_chunk_data = meta_chunk_data.strip(b"\x00")
+        return samples.reshape(frame_count, channels)
+
+    def meta(self):
+        """Scanner metadata, see get_wav_meta()."""
+
+        return _wav_meta(self._mmap, self.path.name)
+
+    def string_at(self, start, length):
+        """Readable text of length bytes at file offset start, see
+        hex_dump_string()."""
+
+        return hex_dump_string(self.buffer[start : start + length], start)
+
+
+def _wav_meta_or_none(wav_file):
+    """get_wav_meta() for pool workers, a broken file shouldn't stop the rest."""
 
-    if uniden_chunk_id != "IKEY":
-        meta_chunk_data = meta_chunk_data.split(b"\x00")[0]
     try:
-        decoded_meta_chunk_data = meta_chunk_data.decode()
-        chunk_dict[uniden_chunk_id] = decoded_meta_chunk_data
-    except UnicodeDecodeError:
-        logger.exception(
-            f"Uniden Chunk ID {decoded_chunk_id} data "
-            f"{meta_chunk_data} doesn't contain valid UTF8.",
-            exc_info=False,
-        )
+        return get_wav_meta(wav_file)
+    except Exception:
+        suf_logger.exception(f"could not read metadata from {wav_file}")
+        return None
 
-    return get_wav_meta(wav_source, chunk_dict)
-    # return
 
-    # this tells us the overall size of the header in bytes
-    chunk_length = meta_chunk.read(4)
+def iter_wav_meta(wav_files, workers=None, processes=False, progress=None):
+    """Read the metadata of many wav files in parallel.
 
-    # converts byte data to an integer we can work with
-    chunk_length = int.from_bytes(chunk_length, byteorder="little")
+    Args:
+        wav_files (iterable): paths of wav files
+        workers (int): number of files read at the same time, defaults to the
+            number of cores
+        processes (bool): use a process pool instead of threads, for when
+            parsing rather than reading the card is the bottleneck
+        progress (callable): called with (files done, total files) after each
+            file, total is None if wav_files has no length
 
-    chunk_dict["WAVELIST"] = chunk_length
+    Yields:
+        tuple: (wav file, metadata dict or None), in the order they finish
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-    f.close()
+    try:
+        total = len(wav_files)
+    except TypeError:
+        total = None
+
+    pool_class = cf.ProcessPoolExecutor if processes else cf.ThreadPoolExecutor
+    wav_files = iter(wav_files)
+    done_count = 0
+
+    with pool_class(max_workers=workers) as pool:
+        # only keep a couple of files per worker queued, so memory use doesn't
+        # grow with the size of the card
+        running = {}
+        for wav_file in wav_files:
+            running[pool.submit(_wav_meta_or_none, wav_file)] = wav_file
+            if len(running) >= workers * 2:
+                break
 
-    return chunk_dict
+        while running:
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+
+            for future in finished:
+                wav_file = running.pop(future)
+                done_count += 1
+                if progress is not None:
+                    progress(done_count, total)
+
+                yield wav_file, future.result()
+
+                next_file = next(wav_files, None)
+                if next_file is not None:
+                    running[pool.submit(_wav_meta_or_none, next_file)] = next_file
 
 
 def get_string_at_offset(start, length, directory):
@@ -380,133 +912,292 @@ def get_string_at_offset(start, length, directory):
         length (int): number of bytes of data to retreive
 
     Returns:
-        (str): UTF-8 decoded string from bytes
+        (str): UTF-8 decoded string from bytes, see hex_dump_string()
 
     Notes:
         Here's what I've figured out so far:
 
-        Apparently the WAV header is in little endian byte order. I don't
-        know if it is algined every 2 bytes, which is one of the default
-        arguments in the `chunk` module.
+        Apparently the WAV header is in little endian byte order. It is
+        aligned every 2 bytes.
 
         the first 8 bytes tell you the chunk name, then the following 4 bytes
         is a little endian hex representation of the chunk size in bytes.
 
     """
-    f_path = Path(directory)
-    f = open(f_path, "rb")
+    with open(directory, "rb") as f:
+        f.seek(start)
+        data = f.read(length)
 
-    # chunk will allow us to parse the byte data in the wav file
-    meta_chunk = chunk.Chunk(f, align=False, bigendian=False, inclheader=True)
+    return hex_dump_string(data, start)
 
-    # seek ignores first 8 bytes of file that hex editor sees.
-    seek_start_position = start - 8
 
-    # seek to starting byte (seek(0) is actually byte 8 of file)
-    meta_chunk.seek(seek_start_position)
+# metadata the recordings are grouped by, the INAM (title) tag
+GROUP_AUDIO_TAG = "Channel:Name:1"
 
-    decoded_string = ""
 
-    # read byte by byte to avoid non-ascii characters
-    while length > 0:
-        chunk_string = meta_chunk.read(1)
-        # weird character codes that show up in the string, converted so I
-        # can read them in the string output as utf8 text
-        chunk_string = chunk_string.replace(b"\x00", b"|")  # NUL
-        chunk_string = chunk_string.replace(b"\x01", b"\\x01")  # SOH
-        chunk_string = chunk_string.replace(b"\x02", b"\\x02")  # STX
-        chunk_string = chunk_string.replace(b"\x03", b"\\x03")  # ETX
-        chunk_string = chunk_string.replace(b"\x04", b"\\x04")  # EOT
-        chunk_string = chunk_string.replace(b"\x08", b"\\x08")  # BS
+def department_dir_name(department):
+    """Directory name for a department, without characters that are illegal in
+    an href string."""
 
-        current_pos = meta_chunk.tell()
+    department = department.replace("/", "_")  # no forward slashes
+    department = department.replace(" ", "_")  # no spaces
+    department = department.replace(".", "_")  # no periods
+    department = department.replace("(", "-")
+    department = department.replace(")", "-")
 
-        try:
-            decoded_string += chunk_string.decode()
-        except UnicodeDecodeError:
-            print(f"shittle sticks at {current_pos} hex: {chunk_string}")
-            # label undecodable spots with position and raw hex
-            decoded_string += f"«{current_pos} {chunk_string}»"
-        finally:
-            length -= 1
+    return department
+
+
+def plan_audio_by_department(source_dir, save_dir, index=None, workers=None):
+    """Work out where group_audio_by_department() will move each recording.
+
+    Nothing is moved, so the plan can be checked first. Recordings that were
+    moved already are no longer in source_dir, so planning again after an
+    interruption only covers the files that are left.
+
+    Args:
+        source_dir (str): source directory containing scanner audio files
+        save_dir (str): directory the department directories are created in
+        index (RecordingIndex): read metadata from the index, only new or
+            changed files are read from the card
+        workers (int): number of files read at the same time
+
+    Returns:
+        list: (wav file, destination path) tuples
+    """
+
+    basepath = Path(source_dir).expanduser()
+    savepath = Path(save_dir)
+
+    # wav files directly in source_dir and one directory down
+    wav_files = list(basepath.glob("*.wav"))
+    for folder in basepath.iterdir():
+        if folder.is_dir():
+            wav_files.extend(folder.glob("*.wav"))
+
+    if index is not None:
+        index.update(wav_files, workers)
+        metadata = ((wav_file, index.get_meta(wav_file)) for wav_file in wav_files)
+    else:
+        metadata = iter_wav_meta(wav_files, workers)
+
+    # same order as the files on the card
+    metadata = sorted(metadata, key=lambda item: item[0])
+
+    plan = []
+    planned = set()
+    for wav_file, meta in metadata:
+        department = (meta or {}).get(GROUP_AUDIO_TAG)
+        if not department:
+            suf_logger.warning(f"{wav_file} has no department tag, not moved.")
+            continue
+
+        destination = savepath / department_dir_name(department) / wav_file.name
+        if destination in planned:
+            # recordings in different card folders can have the same name
+            destination = destination.with_name(
+                f"{wav_file.stem}_{wav_file.parent.name}{wav_file.suffix}"
+            )
+        if destination in planned:
+            suf_logger.error(f"{wav_file} has the same name as another, not moved.")
+            continue
 
-    # replace null character with nothing
-    # chunk_string = chunk_string.replace("\x00", "")
+        planned.add(destination)
+        plan.append((wav_file, destination))
 
-    f.close()
+    return plan
 
-    return decoded_string
+
+# errors of os.link() on another file system or one without hard links (FAT)
+NO_LINK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK)
+
+
+def _link_no_clobber(source, destination):
+    """Hard link source to destination, which must not exist yet.
+
+    Returns:
+        bool: False if the file system can't link them
+
+    Raises:
+        FileExistsError: if destination exists, it is left as it is
+    """
+
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        raise
+    except OSError as err:
+        if err.errno not in NO_LINK_ERRNOS:
+            raise
+        return False
+
+    return True
+
+
+def _copy_to_partial(source, destination):
+    """Copy source next to destination under a temporary name.
+
+    A .part file left by an interrupted copy is overwritten.
+
+    Returns:
+        Path: the complete copy
+    """
+
+    partial = destination.with_name(destination.name + ".part")
+    with open(source, "rb") as src, open(partial, "wb") as dst:
+        shutil.copyfileobj(src, dst, WAV_COPY_BUFFER_SIZE)
+    shutil.copystat(source, partial)
+
+    return partial
+
+
+def _place_no_clobber(source, destination):
+    """Put a copy of source at destination, which must not exist yet.
+
+    The destination only ever appears complete: if it can't be a hard link of
+    source, the copy is made under a temporary name and linked in place.
+
+    Raises:
+        FileExistsError: if destination exists, it is left as it is
+    """
+
+    if _link_no_clobber(source, destination):
+        return
+
+    partial = _copy_to_partial(source, destination)
+    try:
+        if not _link_no_clobber(partial, destination):
+            # no hard links at all (FAT archives), the plan never has two
+            # recordings with the same destination
+            if destination.exists():
+                raise FileExistsError(errno.EEXIST, "exists", str(destination))
+            os.replace(partial, destination)
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+def _is_start_of(short_file, long_file):
+    """True if short_file is shorter than long_file and matches its start."""
+
+    length = short_file.stat().st_size
+    if length >= long_file.stat().st_size:
+        return False
+
+    with open(short_file, "rb") as short, open(long_file, "rb") as long:
+        while length > 0:
+            block = short.read(min(WAV_COPY_BUFFER_SIZE, length))
+            if not block or block != long.read(len(block)):
+                return False
+            length -= len(block)
+
+    return True
+
+
+def _move_recording(source, destination):
+    """Move one recording, safe to repeat after an interruption.
+
+    An existing destination is never overwritten, unless it is a copy that
+    was cut short (it matches the start of the recording). It only counts as
+    the moved recording if it has the same contents, otherwise the recording
+    is left where it is.
+
+    Returns:
+        str: "moved", "done" (it had been moved already) or "conflict"
+    """
+
+    if not source.exists():
+        if destination.exists():
+            return "done"
+        raise FileNotFoundError(errno.ENOENT, "recording disappeared", str(source))
+
+    try:
+        _place_no_clobber(source, destination)
+    except FileExistsError:
+        if filecmp.cmp(source, destination, shallow=False):
+            # copied before the interruption, only the original was left
+            source.unlink()
+            return "done"
+        if not _is_start_of(destination, source):
+            suf_logger.error(f"{destination} exists and differs from {source}.")
+            return "conflict"
+        # copied straight to the destination before it was cut short
+        suf_logger.info(f"replacing the incomplete copy {destination}.")
+        os.replace(_copy_to_partial(source, destination), destination)
+
+    source.unlink()
+
+    return "moved"
+
+
+def execute_audio_plan(plan, workers=8):
+    """Move the recordings of a plan_audio_by_department() plan.
+
+    Args:
+        plan (list): (wav file, destination path) tuples
+        workers (int): number of files moved at the same time
+
+    Returns:
+        dict: number of files "moved", "done", "conflict" and "failed"
+    """
+
+    for folder in sorted({destination.parent for _, destination in plan}):
+        if not folder.exists():
+            folder.mkdir(parents=True, exist_ok=True)
+            suf_logger.info(f"New folder created for {folder.name}.")
+
+    outcomes = dict.fromkeys(("moved", "done", "conflict", "failed"), 0)
+
+    with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+        moves = {
+            pool.submit(_move_recording, source, destination): source
+            for source, destination in plan
+        }
+        for future in cf.as_completed(moves):
+            try:
+                outcomes[future.result()] += 1
+            except OSError as err:
+                suf_logger.error(f"{moves[future]} not moved: {err}")
+                outcomes["failed"] += 1
+
+    suf_logger.info(f"recordings grouped: {outcomes}")
+
+    return outcomes
 
 
 def group_audio_by_department(
     source_dir="/Volumes/SDS100/BCDx36HP/audio/user_rec/",
     save_dir="/Volumes/iMac HDD/scanner_audio/",
+    workers=8,
+    index=None,
 ):
     """Function takes directories as exported from scanner and groups the
     audio recordings into new directories based on department name.
 
+    The moves are planned first (plan_audio_by_department()) and then carried
+    out in parallel (execute_audio_plan()). Running it again after an
+    interruption finishes the job without moving anything twice.
+
     Args:
         source_dir (str): source directory containing scanner audio files
         save_dir (str): directory where newly organized directory tree will
             saved.
+        workers (int): number of files read and moved at the same time
+        index (RecordingIndex): optional index to read the metadata from
 
     Returns:
-        None
+        dict: see execute_audio_plan()
     """
 
     # Path object for the root of our folder tree
     basepath = Path(source_dir).expanduser()
 
-    # source_dir where the grouped files will end up
-    savepath = Path(save_dir)
-
-    # parent_dir = None
-
-    for file_or_folder in basepath.iterdir():
-        # if you find a wav file, use its parent directory
-        if file_or_folder.suffix == ".wav":
-            parent_dir = file_or_folder.parent
-        # code is not smart enough to deal with files nested more than 2
-        # directories deep
-        elif file_or_folder.is_dir():
-            parent_dir = file_or_folder
-        else:
-            continue
-
-        # the .glob ensures that we only get audio files, no hidden files
-        for file in parent_dir.glob("*.wav"):
-            # create tinytag object that contains metadata
-            ttag = TinyTag.get(file)
-            # get the department name, which is stored under title
-            department = ttag.title
-
-            # get rid of formatting that is illegal in href string
-            try:
-                department = department.replace("/", "_")  # no forward slashes
-                department = department.replace(" ", "_")  # no spaces
-                department = department.replace(".", "_")  # no periods
-                department = department.replace("(", "-")
-                department = department.replace(")", "-")
-            except AttributeError:
-                logging.error("Encountered file without department tag.")
-                break
-
-            # create new folders for each department
-            # if it doesn't already exist
-            p = Path(savepath, department)
-            if not p.exists():
-                p.mkdir(exist_ok=True)  # wont overwrite existing wav_source
-                logging.info("New folder created for {}.".format(str(department)))
-
-            # move individual .wav files to their respective dept folders
-            try:
-                shutil.move(str(file), str(p))
-            except:
-                #                 print("{} already exists".format(str(p)))
-                pass
+    plan = plan_audio_by_department(basepath, save_dir, index, workers)
+    outcomes = execute_audio_plan(plan, workers)
 
     # remove the directories that are now empty
     for file_or_folder in basepath.iterdir():
+        if not file_or_folder.is_dir():
+            continue
         try:
             file_or_folder.rmdir()
             logging.info("{} deleted".format(str(file_or_folder)))
@@ -519,14 +1210,7 @@ def group_audio_by_department(
             )
             pass
 
-    # also remove parent directory
-    # try:
-    #     parent_dir.rmdir()
-    #     logging.info(f"{parent_dir} deleted.")
-    # except FileExistsError:
-    #     pass
-
-    return
+    return outcomes
 
 
 # todo: add test functions
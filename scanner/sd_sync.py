@@ -0,0 +1,271 @@
+"""Mirror the recordings on the scanner SD card into a local archive.
+
+Only recordings that are new or changed are copied. A recording is unchanged
+if the archive copy has the same size and modification time, or the same
+size and the same header hash (card mount times shift with the time zone on
+FAT cards). Unchanged recordings are only stat()ed, so re-syncing a nearly
+full card takes seconds.
+
+Copies are written to a .part file next to the destination. An interrupted
+copy carries on where it stopped, if all of the .part file matches the start
+of the recording. Every copy is read back in full and checked against the
+hash of the recording read from the card before it replaces the destination.
+A RecordingIndex can be updated with the new copies as the sync goes.
+
+Example:
+    with RecordingIndex("databases/recordings.sqlite") as index:
+        sync_recordings("/Volumes/SDS100", "/Volumes/iMac HDD/archive", index)
+
+Usage:
+    python -m scanner.sd_sync ARCHIVE_DIR [--card CARD_ROOT] [--index DB_PATH]
+"""
+
+import argparse
+import concurrent.futures as cf
+import hashlib
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import scanner.scanner_utility_functions as suf
+from scanner.recording_index import RecordingIndex
+
+logger = logging.getLogger("uniden_api.sd_sync")
+
+# bytes hashed to tell recordings of the same size apart
+SYNC_HEADER_SIZE = 4096
+
+# bytes copied at a time, per worker
+SYNC_BLOCK_SIZE = 1 << 20
+
+# copied files handed to the index at a time
+SYNC_INDEX_BATCH = 200
+
+
+def header_hash(path, size=SYNC_HEADER_SIZE):
+    """blake2b digest of the first size bytes of a file."""
+
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(size)).digest()
+
+
+def _prefix_hash(path, length=None, block_size=SYNC_BLOCK_SIZE):
+    """blake2b hash object of the first length bytes (or all) of a file."""
+
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while length is None or length > 0:
+            block = f.read(block_size if length is None else min(block_size, length))
+            if not block:
+                break
+            digest.update(block)
+            if length is not None:
+                length -= len(block)
+
+    return digest
+
+
+def recording_state(source, destination):
+    """How the archive copy of a recording compares to the recording.
+
+    Returns:
+        str: "new", "unchanged", "retimed" (same size and header, only the
+            modification time differs) or "changed"
+    """
+
+    try:
+        destination_stat = os.stat(destination)
+    except FileNotFoundError:
+        return "new"
+
+    source_stat = os.stat(source)
+    if destination_stat.st_size != source_stat.st_size:
+        return "changed"
+    if destination_stat.st_mtime_ns == source_stat.st_mtime_ns:
+        return "unchanged"
+    if header_hash(source) == header_hash(destination):
+        return "retimed"
+
+    return "changed"
+
+
+def copy_verified(source, destination, block_size=SYNC_BLOCK_SIZE):
+    """Copy a recording, resuming an interrupted copy, and verify it.
+
+    Args:
+        source (str or Path): recording on the card
+        destination (str or Path): archive copy, replaced once verified
+        block_size (int): bytes read from the card at a time
+
+    Returns:
+        int: bytes copied from the card
+
+    Raises:
+        OSError: if the copy doesn't match what was read from the card
+    """
+
+    destination = Path(destination)
+    partial = destination.with_name(destination.name + ".part")
+    size = os.stat(source).st_size
+
+    # carry on with an interrupted copy of the same recording, all of what was
+    # copied already is compared, copied is the hash of the card's data
+    offset = 0
+    copied = hashlib.blake2b()
+    if partial.exists():
+        offset = partial.stat().st_size
+        if offset <= size:
+            copied = _prefix_hash(source, offset, block_size)
+        if offset > size or copied.digest() != _prefix_hash(partial).digest():
+            offset = 0
+            copied = hashlib.blake2b()
+    if offset:
+        logger.info(f"resuming {destination.name} at {offset} bytes")
+
+    with open(source, "rb") as src, open(partial, "r+b" if offset else "wb") as dst:
+        src.seek(offset)
+        dst.seek(offset)
+        dst.truncate()
+        while True:
+            block = src.read(block_size)
+            if not block:
+                break
+            copied.update(block)
+            dst.write(block)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    # read all of the copy back
+    written = _prefix_hash(partial, block_size=block_size)
+    if written.digest() != copied.digest() or partial.stat().st_size != size:
+        partial.unlink()
+        raise OSError(f"copy of {source} doesn't match the card")
+
+    shutil.copystat(source, partial)
+    os.replace(partial, destination)
+
+    return size - offset
+
+
+def card_recordings_path(card_root):
+    """Directory holding the recordings, the card root itself if it doesn't
+    have the scanner's user_rec directory."""
+
+    audio_path = Path(card_root, suf.SCANNER_AUDIO_PATH)
+    if audio_path.is_dir():
+        return audio_path
+
+    return Path(card_root)
+
+
+def sync_recordings(card_root, archive_root, index=None, workers=2, progress=None):
+    """Mirror new and changed recordings from the card into archive_root.
+
+    Args:
+        card_root (str or Path): SD card root (or a directory of recordings)
+        archive_root (str or Path): local archive, the card's directory
+            layout is kept
+        index (RecordingIndex): updated with the copies as they finish
+        workers (int): files copied at the same time, SD cards are slowest
+            with many readers
+        progress (callable): called with (files done, files to copy)
+
+    Returns:
+        dict: number of files "copied", "unchanged", "retimed" and "failed",
+            and "bytes" copied from the card
+    """
+
+    source_root = card_recordings_path(card_root)
+    archive_root = Path(archive_root)
+
+    outcomes = dict.fromkeys(("copied", "unchanged", "retimed", "failed", "bytes"), 0)
+    to_copy = []
+    archived = []
+    for source in sorted(source_root.rglob("*.wav")):
+        destination = archive_root / source.relative_to(source_root)
+        state = recording_state(source, destination)
+        if state == "unchanged":
+            outcomes["unchanged"] += 1
+            archived.append(destination)
+        elif state == "retimed":
+            # same recording, keep the card's time so the next sync is quicker
+            shutil.copystat(source, destination)
+            outcomes["retimed"] += 1
+            archived.append(destination)
+        else:
+            to_copy.append((source, destination))
+
+    logger.info(f"{len(to_copy)} to copy, {outcomes['unchanged']} unchanged")
+
+    if index is not None:
+        # only reads the copies the index doesn't know about yet
+        index.update(archived)
+
+    for folder in sorted({destination.parent for _, destination in to_copy}):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    copied = []
+    with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+        copies = {
+            pool.submit(copy_verified, source, destination): destination
+            for source, destination in to_copy
+        }
+        for done_count, copy in enumerate(cf.as_completed(copies), 1):
+            destination = copies[copy]
+            try:
+                outcomes["bytes"] += copy.result()
+                outcomes["copied"] += 1
+                copied.append(destination)
+            except OSError as err:
+                logger.error(f"{destination} not copied: {err}")
+                outcomes["failed"] += 1
+
+            if index is not None and len(copied) >= SYNC_INDEX_BATCH:
+                index.update(copied)
+                copied = []
+            if progress is not None:
+                progress(done_count, len(to_copy))
+
+    if index is not None:
+        index.update(copied)
+
+    logger.info(f"sync finished: {outcomes}")
+
+    return outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy new scanner recordings.")
+    parser.add_argument("archive_dir", type=str)
+    parser.add_argument(
+        "--card", type=str, default=None, help="SD card root, found if not given"
+    )
+    parser.add_argument("--index", type=str, default=None, help="RecordingIndex db")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    card = args.card or suf.find_scanner_volume()
+    if card is None:
+        print("No scanner SD card found, use --card.")
+        return 1
+
+    index = None if args.index is None else RecordingIndex(args.index)
+    try:
+        outcomes = sync_recordings(card, args.archive_dir, index, args.workers)
+    finally:
+        if index is not None:
+            index.close()
+
+    print(
+        f"{outcomes['copied']} copied ({outcomes['bytes'] // 1000} KB), "
+        f"{outcomes['unchanged'] + outcomes['retimed']} unchanged, "
+        f"{outcomes['failed']} failed."
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
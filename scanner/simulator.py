@@ -0,0 +1,905 @@
+"""
+Software stand-in for an SDS-100 connected over USB serial.
+
+The SimulatedSerial class quacks like the parts of serial.Serial that
+UnidenScanner uses, replays canned (or recorded) scanner replies and paces the
+reply bytes at the configured baud rate. It lets you run UnidenScanner, the
+System/Group tree walkers and anything built on top of them on a plain Linux
+box without a radio plugged in.
+
+Example:
+    Open a scanner connection against the simulator::
+
+        sim = SimulatedSerial(baudrate=115200, latency=0.002, jitter=0.001)
+        s = UnidenScanner(serial_port=sim)
+        s.update_scanner_state()
+
+"""
+
+import json
+import logging
+import random
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import serial
+
+# create logger
+sim_logger = logging.getLogger("uniden_api.SimulatedSerial")
+
+# every reply line from the scanner ends with a carriage return
+EOL = "\r"
+
+XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>'
+
+# branches of a typical GSI reply while the scanner is receiving a P25 call
+# {xml tag: {attribute: value}}
+SAMPLE_SCANNER_INFO = {
+    "ScannerInfo": {"Mode": "Trunk Scan", "V_Screen": "trunk_scan"},
+    "MonitorList": {
+        "Name": "Houston",
+        "Index": "0",
+        "ListType": "FL",
+        "Q_Key": "0",
+        "N_Tag": "None",
+        "DB_Counter": "3",
+    },
+    "System": {
+        "Name": "Houston TxWARN",
+        "Index": "28",
+        "Avoid": "Off",
+        "SystemType": "P25 Trunk",
+        "Q_Key": "None",
+        "N_Tag": "None",
+        "Hold": "Off",
+    },
+    "Department": {
+        "Name": "Houston Police",
+        "Index": "31",
+        "Avoid": "Off",
+        "Q_Key": "1",
+        "Hold": "Off",
+    },
+    "TGID": {
+        "Name": "01 HPD-N",
+        "Index": "40",
+        "Avoid": "Off",
+        "TGID": "TGID:12501",
+        "SetSlot": "Any",
+        "RecSlot": "Any",
+        "N_Tag": "None",
+        "Hold": "Off",
+        "SvcType": "Law Dispatch",
+        "P_Ch": "Off",
+        "LVL": "0",
+    },
+    "UnitID": {"Name": "", "U_Id": "UID:1204417"},
+    "Site": {
+        "Name": "98 HOU PubSafety NW Simulcast",
+        "Index": "35",
+        "Avoid": "Off",
+        "Q_Key": "None",
+        "Hold": "Off",
+        "Mod": "NFM",
+    },
+    "SiteFrequency": {"Freq": " 770.3562MHz", "IFX": "Off", "SAS": "All", "SAD": "None"},
+    "DualWatch": {"PRI": "Off", "CC": "Off", "WX": "Off"},
+    "Property": {
+        "F": "Off",
+        "VOL": "1",
+        "SQL": "5",
+        "Sig": "4",
+        "Att": "Off",
+        "Rec": "Off",
+        "KeyLock": "Off",
+        "P25Status": "P25",
+        "Mute": "Unmute",
+        "Backlight": "100",
+        "A_Led": "Off",
+        "Dir": "Down",
+        "Rssi": "-78",
+    },
+    "ViewDescription": {
+        "InfoArea1": {"Text": "F0:0123456789"},
+        "InfoArea2": {"Text": "S0:-----6----"},
+    },
+}
+
+# typical top level menu reply to the MSI command
+SAMPLE_MSI_ITEMS = (
+    "Program System",
+    "Manage Favorites",
+    "Search for...",
+    "Search Options",
+    "WX Operation",
+    "Tone-Out",
+    "Settings",
+)
+
+
+def _xml_attributes(attributes):
+    """Format a dict as xml attribute text."""
+
+    return " ".join(f'{key}="{value}"' for key, value in attributes.items())
+
+
+def scanner_info_reply(cmd="GSI", branches=None):
+    """Build a GSI/PSI style reply from a dict of xml branches.
+
+    Args:
+        cmd (str): "GSI" or "PSI"
+        branches (dict): {xml tag: {attribute: value}} as in SAMPLE_SCANNER_INFO,
+            the "ScannerInfo" key holds the attributes of the root tag and a
+            dict value nested one level deeper becomes a child element.
+
+    Returns:
+        str: complete reply including the "GSI,<XML>," prefix line
+    """
+    if branches is None:
+        branches = SAMPLE_SCANNER_INFO
+
+    root_attribs = branches.get("ScannerInfo", {})
+
+    lines = [f"{cmd},<XML>,", XML_HEADER, f"<ScannerInfo {_xml_attributes(root_attribs)}>"]
+
+    for tag, attributes in branches.items():
+        if tag == "ScannerInfo":
+            continue
+
+        # children are stored as dicts of dicts, e.g. ViewDescription
+        children = {k: v for k, v in attributes.items() if isinstance(v, dict)}
+        attributes = {k: v for k, v in attributes.items() if not isinstance(v, dict)}
+
+        if not children:
+            lines.append(f"<{tag} {_xml_attributes(attributes)} />")
+            continue
+
+        lines.append(f"<{tag} {_xml_attributes(attributes)}>".replace(" >", ">"))
+        for child_tag, child_attributes in children.items():
+            lines.append(f"<{child_tag} {_xml_attributes(child_attributes)} />")
+        lines.append(f"</{tag}>")
+
+    lines.append("</ScannerInfo>")
+
+    return EOL.join(lines) + EOL
+
+
+def list_reply(cmd, root_tag, item_tag, items, block_size=0, root_attribs=None):
+    """Build an MSI/GLT style reply, optionally split in several transmission
+    blocks the way the scanner splits long lists.
+
+    Args:
+        cmd (str): three letter command the reply belongs to
+        root_tag (str): xml root tag, "GLT" or "MSI"
+        item_tag (str): tag used for each list item, e.g. "FL" or "MenuItem"
+        items (list): list of attribute dicts, one per list item
+        block_size (int): number of items per block, 0 keeps everything in one
+        root_attribs (dict): optional attributes for the root tag
+
+    Returns:
+        str: complete reply including the "<cmd>,<XML>," prefix lines
+    """
+    if block_size <= 0:
+        block_size = max(len(items), 1)
+
+    blocks = [items[i : i + block_size] for i in range(0, len(items), block_size)]
+    if not blocks:
+        blocks = [[]]
+
+    root_open = f"<{root_tag}>"
+    if root_attribs:
+        root_open = f"<{root_tag} {_xml_attributes(root_attribs)}>"
+
+    lines = []
+    for block_no, block in enumerate(blocks, start=1):
+        eot = "1" if block_no == len(blocks) else "0"
+        lines += [f"{cmd},<XML>,", XML_HEADER, root_open]
+        lines += [f"<{item_tag} {_xml_attributes(item)} />" for item in block]
+        lines += [f'<Footer No="{block_no}" EOT="{eot}" />', f"</{root_tag}>"]
+
+    return EOL.join(lines) + EOL
+
+
+def favorites_list_items(count):
+    """Generate GLT,FL items for testing long list replies."""
+
+    return [
+        {
+            "Index": str(i),
+            "Name": f"Favorites {i:04d}",
+            "Monitor": "On",
+            "Q_Key": str(i % 100),
+            "N_Tag": "None",
+        }
+        for i in range(count)
+    ]
+
+
+# canned replies keyed by full command string or by the 3 letter command
+# str: fixed reply, list: replies handed out in turn, callable: reply = f(cmd)
+DEFAULT_RESPONSES = {
+    "MDL": "MDL,SDS100",
+    "VER": "VER,Version 1.23.00",
+    "KEY": "KEY,OK",
+    "GSI": scanner_info_reply("GSI"),
+    "MSI": list_reply(
+        "MSI",
+        "MSI",
+        "MenuItem",
+        [{"Name": name, "Index": str(i)} for i, name in enumerate(SAMPLE_MSI_ITEMS)],
+        root_attribs={
+            "Name": "Menu",
+            "Index": "1",
+            "MenuType": "TypeSelect",
+            "Value": "",
+            "Selected": "",
+        },
+    ),
+    "GLT": list_reply("GLT", "GLT", "FL", favorites_list_items(3)),
+    "FQK": "FQK," + ",".join(["2", "1"] + ["0"] * 98),
+    "SQK": "SQK," + ",".join(["2"] + ["0"] * 99),
+    "DQK": "DQK," + ",".join(["2", "2", "1"] + ["0"] * 97),
+    "SQL": "SQL,5",
+    "VOL": "VOL,OK",
+    "JNT": "JNT,OK",
+    "MNU": "MNU,OK",
+    "MSV": "MSV,OK",
+    "MSB": "MSB,OK",
+    "HLD": "HLD,OK",
+    "AVD": "AVD,OK",
+    "PRG": "PRG,OK",
+    "EPG": "EPG,OK",
+    "RMB": "RMB,24000",
+    "MEM": "MEM,10,3,5,250,0",
+    "PSI,0": "PSI,OK",
+}
+
+
+class SimulatedProgramMemory:
+    """Generates program mode replies (SIH, SIN, GIN, CIN, TIN, SIF, TFQ, ...)
+    for a made up set of systems so the System/Group/Site tree walkers have a
+    linked list to follow.
+
+    Notes:
+        - conventional systems hold channel groups (GIN/CIN)
+        - any other system type holds sites (SIF/TFQ/MCP/ABP) plus TGID groups
+            (TRN/GIN/TIN)
+    """
+
+    def __init__(
+        self,
+        systems=2,
+        groups=4,
+        channels=25,
+        sys_type="CNV",
+        sites=1,
+        site_frequencies=4,
+        lockout_tgids=(),
+    ):
+        """Build the replies.
+
+        Args:
+            systems (int): number of systems in the scan list
+            groups (int): number of groups per system
+            channels (int): number of channels (or TGIDs) per group
+            sys_type (str): scanner system type, "CNV", "P25S", "MOT", ...
+            sites (int): number of sites per trunked system
+            site_frequencies (int): number of trunk frequencies per site
+            lockout_tgids (tuple): locked out TGIDs returned by GLI/SLI
+        """
+        self.responses = {}
+        self._next_index = 100
+
+        system_indices = self._indices(systems)
+        for pos, sys_index in enumerate(system_indices):
+            self._add_system(
+                sys_index,
+                system_indices,
+                pos,
+                sys_type,
+                groups,
+                channels,
+                sites,
+                site_frequencies,
+                lockout_tgids,
+            )
+
+        head = system_indices[0] if system_indices else "-1"
+        tail = system_indices[-1] if system_indices else "-1"
+        self.responses["SIH"] = f"SIH,{head}"
+        self.responses["SIT"] = f"SIT,{tail}"
+        self.responses["QSL"] = "QSL," + ",".join(["1111111111"] * 10)
+
+    def _indices(self, count):
+        """Reserve `count` unique memory indices."""
+
+        indices = [str(i) for i in range(self._next_index, self._next_index + count)]
+        self._next_index += count
+        return indices
+
+    @staticmethod
+    def _links(indices, pos):
+        """Reverse and forward index of a linked list node."""
+
+        rev_index = indices[pos - 1] if pos > 0 else "-1"
+        fwd_index = indices[pos + 1] if pos < len(indices) - 1 else "-1"
+        return rev_index, fwd_index
+
+    def _add_system(
+        self,
+        sys_index,
+        system_indices,
+        pos,
+        sys_type,
+        groups,
+        channels,
+        sites,
+        site_frequencies,
+        lockout_tgids,
+    ):
+        rev_index, fwd_index = self._links(system_indices, pos)
+
+        group_indices = self._indices(groups)
+
+        if sys_type == "CNV":
+            head_tail = group_indices
+        else:
+            head_tail = self._indices(sites)
+
+        head = head_tail[0] if head_tail else "-1"
+        tail = head_tail[-1] if head_tail else "-1"
+
+        # fmt: off
+        self.responses[f"SIN,{sys_index}"] = ",".join([
+            "SIN", sys_type, f"System {sys_index}", ".", "0", "0", "0",
+            "", "", "", "", "",
+            rev_index, fwd_index, head, tail, str(pos + 1), ".",
+            "", "", "", "", "",
+            "NONE", "0", "0", "200", "0", "",
+        ])
+        # fmt: on
+
+        self.responses[f"QGL,{sys_index}"] = "QGL,0000000000"
+        self.responses[f"GLI,{sys_index}"] = [f"GLI,{t}" for t in lockout_tgids] + [
+            "GLI,-1"
+        ]
+        self.responses[f"SLI,{sys_index}"] = ["SLI,-1"]
+
+        if sys_type == "CNV":
+            grp_type = "C"
+        else:
+            grp_type = "T"
+            for site_pos, sit_index in enumerate(head_tail):
+                self._add_site(sit_index, head_tail, site_pos, sys_index, site_frequencies)
+
+            g_head = group_indices[0] if group_indices else "-1"
+            g_tail = group_indices[-1] if group_indices else "-1"
+
+            # fmt: off
+            self.responses[f"TRN,{sys_index}"] = ",".join([
+                "TRN", "0", "0", "0", "0", "", "", "0", "0", "0", "",
+                "", "", "", "", "", "", "", "", "", "",
+                g_head, g_tail, "-1", "-1", "0", "OFF", "0", "SRCH", "0",
+            ])
+            # fmt: on
+
+        for grp_pos, grp_index in enumerate(group_indices):
+            self._add_group(
+                grp_index, group_indices, grp_pos, sys_index, grp_type, channels
+            )
+
+    def _add_group(self, grp_index, group_indices, pos, sys_index, grp_type, channels):
+        rev_index, fwd_index = self._links(group_indices, pos)
+
+        chn_indices = self._indices(channels)
+        head = chn_indices[0] if chn_indices else "-1"
+        tail = chn_indices[-1] if chn_indices else "-1"
+
+        # fmt: off
+        self.responses[f"GIN,{grp_index}"] = ",".join([
+            "GIN", grp_type, f"Group {grp_index}", ".", "0", rev_index, fwd_index,
+            sys_index, head, tail, str(pos + 1), "0", "0", "0", "0",
+        ])
+        # fmt: on
+
+        for chn_pos, chn_index in enumerate(chn_indices):
+            rev_index, fwd_index = self._links(chn_indices, chn_pos)
+
+            # fmt: off
+            if grp_type == "C":
+                self.responses[f"CIN,{chn_index}"] = ",".join([
+                    "CIN", f"Channel {chn_index}", f"{4600000 + int(chn_index)}",
+                    "NFM", "0", "0", "0", "0", "0", "0", "0",
+                    rev_index, fwd_index, sys_index, grp_index, "",
+                    "0", "SRCH", "NONE", "OFF", "0", "0",
+                ])
+            else:
+                self.responses[f"TIN,{chn_index}"] = ",".join([
+                    "TIN", f"TGID {chn_index}", chn_index,
+                    "0", "0", "0", "0",
+                    rev_index, fwd_index, sys_index, grp_index, "",
+                    "0", "NONE", "OFF", "0", "0",
+                ])
+            # fmt: on
+
+    def _add_site(self, sit_index, site_indices, pos, sys_index, site_frequencies):
+        rev_index, fwd_index = self._links(site_indices, pos)
+
+        frq_indices = self._indices(site_frequencies)
+        head = frq_indices[0] if frq_indices else "-1"
+        tail = frq_indices[-1] if frq_indices else "-1"
+
+        # fmt: off
+        self.responses[f"SIF,{sit_index}"] = ",".join([
+            "SIF", "", f"Site {sit_index}", ".", "0", "0", "AUTO", "0", "1", "", "",
+            rev_index, fwd_index, sys_index, head, tail, str(pos + 1), ".",
+            "0", "0", "1", "0", "", "STD", "WIDE", "200", "",
+        ])
+        self.responses[f"MCP,{sit_index}"] = ",".join(["MCP"] + [""] * 24)
+        self.responses[f"ABP,{sit_index}"] = ",".join(["ABP"] + [""] * 32)
+        # fmt: on
+
+        for frq_pos, frq_index in enumerate(frq_indices):
+            rev_index, fwd_index = self._links(frq_indices, frq_pos)
+
+            # fmt: off
+            self.responses[f"TFQ,{frq_index}"] = ",".join([
+                "TFQ", f"{7700000 + int(frq_index)}", "0", "0",
+                rev_index, fwd_index, sys_index, sit_index, "", "NONE", "0", "",
+            ])
+            # fmt: on
+
+
+class SimulatedSerial:
+    """In-process replacement for serial.Serial that answers like an SDS-100.
+
+    Commands written to the port are answered from a table of canned replies.
+    Reply bytes become readable one character time (10 bits at the configured
+    baud rate) after each other, after a fixed processing latency plus an
+    optional random jitter, so blocking reads cost roughly what they cost on
+    the real radio.
+
+    Notes:
+        - unknown commands are answered with "ERR" like the scanner does
+        - "PSI,<ms>" starts pushing ScannerInfo documents every <ms>
+            milliseconds until "PSI,0" is received
+        - with timeout=None a read that can never be satisfied returns instead
+            of blocking forever
+        - like a real port, one thread can block in read() while another
+            thread writes
+    """
+
+    def __init__(
+        self,
+        responses=None,
+        baudrate=115200,
+        timeout=3.1,
+        latency=0.0,
+        jitter=0.0,
+        seed=None,
+        port="SIMULATED",
+    ):
+        """Initialization
+
+        Args:
+            responses (dict): replies added on top of DEFAULT_RESPONSES
+            baudrate (int): speed used to pace reply bytes, 0 or None delivers
+                each reply in one go
+            timeout (float): read timeout in seconds, same meaning as pyserial
+            latency (float): seconds between receiving a command and the first
+                reply byte
+            jitter (float): maximum random extra latency per reply in seconds
+            seed (int): seed for the jitter random number generator
+            port (str): name reported as the port device
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.latency = latency
+        self.jitter = jitter
+        self.is_open = True
+
+        self.responses = dict(DEFAULT_RESPONSES)
+        if responses is not None:
+            self.responses.update(responses)
+
+        # reply used for commands not in the response table
+        self.unknown_reply = "ERR"
+
+        # every command received, in order (useful for assertions)
+        self.commands_received = []
+
+        self._random = random.Random(seed)
+        self._sequences = {}
+        self._tx = bytearray()
+        self._rx = bytearray()
+        # [start time, reply bytes, bytes already delivered]
+        self._pending = deque()
+        self._line_free_at = 0.0
+        self._push_interval = 0.0
+        self._next_push = None
+        # guards the buffers, wakes blocked readers when a command arrives
+        self._lock = threading.Condition()
+
+    # ---- configuration ---- #
+
+    @property
+    def byte_time(self):
+        """Seconds it takes to transfer one byte (8N1 framing)."""
+
+        if not self.baudrate:
+            return 0.0
+        return 10.0 / float(self.baudrate)
+
+    def load_responses(self, path):
+        """Add recorded replies from a JSON file.
+
+        Args:
+            path (str or Path): JSON object mapping command to reply string or
+                list of reply strings
+        """
+        with open(Path(path), "r") as f:
+            self.responses.update(json.load(f))
+
+    def add_program_memory(self, memory):
+        """Add program mode replies from a SimulatedProgramMemory instance."""
+
+        self.responses.update(memory.responses)
+
+    # ---- pyserial interface ---- #
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        with self._lock:
+            self.is_open = False
+            self._lock.notify_all()
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._pump(time.perf_counter())
+            return len(self._rx)
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._pump(time.perf_counter())
+            self._rx.clear()
+
+    def write(self, data):
+        """Receive command bytes; every \r terminated command gets answered."""
+
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+
+        with self._lock:
+            self._tx.extend(data)
+
+            while True:
+                end = self._tx.find(b"\r")
+                if end == -1:
+                    break
+                cmd = self._tx[:end].decode()
+                del self._tx[: end + 1]
+                self._handle_command(cmd)
+
+            self._lock.notify_all()
+
+        return len(data)
+
+    def read(self, size=1):
+        """Read up to size bytes, waiting at most timeout seconds."""
+
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+
+        with self._lock:
+            self._wait(lambda: max(size - len(self._rx), 0), self._deadline())
+
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+
+        return data
+
+    def read_until(self, expected=b"\n", size=None):
+        """Read until expected is found, size is reached or timeout expires."""
+
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+
+        expected = bytes(expected)
+
+        def bytes_needed():
+            if self._rx.find(expected) != -1:
+                return 0
+            if size is not None and len(self._rx) >= size:
+                return 0
+            # look for the terminator in the bytes still on the wire
+            overlap = bytes(self._rx[-(len(expected) - 1) :]) if len(expected) > 1 else b""
+            on_wire = b"".join(data[sent:] for start, data, sent in self._pending)
+            pos = (overlap + on_wire).find(expected)
+            if pos == -1:
+                return None
+            return pos + len(expected) - len(overlap)
+
+        with self._lock:
+            self._wait(bytes_needed, self._deadline())
+
+            end = self._rx.find(expected)
+            if end != -1:
+                end += len(expected)
+            else:
+                end = len(self._rx)
+            if size is not None:
+                end = min(end, size)
+
+            data = bytes(self._rx[:end])
+            del self._rx[:end]
+
+        return data
+
+    def readall(self):
+        """Read until a read times out without data, like io.RawIOBase."""
+
+        data = bytearray()
+        while True:
+            chunk = self.read(4096)
+            if not chunk:
+                break
+            data.extend(chunk)
+
+        return bytes(data)
+
+    # ---- internals ---- #
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.perf_counter() + self.timeout
+
+    def _lookup(self, cmd):
+        """Find the reply for a command string."""
+
+        key = cmd if cmd in self.responses else cmd.split(",")[0]
+        reply = self.responses.get(key, self.unknown_reply)
+
+        if callable(reply):
+            return reply(cmd)
+
+        if isinstance(reply, (list, tuple)):
+            # hand out list replies in turn, starting over at the end
+            position = self._sequences.get(key, 0)
+            self._sequences[key] = (position + 1) % len(reply)
+            return reply[position]
+
+        return reply
+
+    def _handle_command(self, cmd):
+        sim_logger.debug(f"simulator received: {cmd}")
+        self.commands_received.append(cmd)
+
+        now = time.perf_counter()
+        cmd_name = cmd.split(",")[0].upper()
+
+        if cmd_name == "PSI" and "," in cmd:
+            interval = cmd.split(",")[1]
+            self._push_interval = int(interval or 0) / 1000.0
+            if self._push_interval > 0:
+                self._next_push = now + self.latency
+                return
+            self._next_push = None
+
+        reply = self._lookup(cmd)
+        if reply is None:
+            return
+
+        self._schedule(reply, now + self.latency + self._random.uniform(0, self.jitter))
+
+    def _push_reply(self):
+        """ScannerInfo document pushed while PSI mode is active."""
+
+        gsi = self._lookup("GSI")
+        if isinstance(gsi, bytes):
+            gsi = gsi.decode()
+        return "PSI" + gsi[3:]
+
+    def _schedule(self, reply, earliest):
+        """Queue reply bytes, they arrive back to back after `earliest`."""
+
+        if isinstance(reply, str):
+            reply = reply.encode()
+        if not reply.endswith(b"\r"):
+            reply += b"\r"
+
+        start = max(earliest, self._line_free_at)
+        self._line_free_at = start + len(reply) * self.byte_time
+        self._pending.append([start, reply, 0])
+
+    def _pump(self, now):
+        """Move bytes that have 'arrived' by now into the receive buffer."""
+
+        while self._next_push is not None and self._next_push <= now:
+            self._schedule(self._push_reply(), self._next_push)
+            self._next_push += self._push_interval
+
+        byte_time = self.byte_time
+
+        while self._pending:
+            segment = self._pending[0]
+            start, data, sent = segment
+
+            if now < start:
+                break
+
+            if byte_time:
+                arrived = min(len(data), int((now - start) / byte_time))
+            else:
+                arrived = len(data)
+
+            self._rx.extend(data[sent:arrived])
+            segment[2] = arrived
+
+            if arrived < len(data):
+                break
+
+            self._pending.popleft()
+
+    def _time_for(self, count):
+        """Time at which `count` more bytes will have arrived, None if they
+        aren't on the wire yet."""
+
+        for start, data, sent in self._pending:
+            remaining = len(data) - sent
+            if count <= remaining:
+                return start + (sent + count) * self.byte_time
+            count -= remaining
+
+        return None
+
+    def _wait(self, bytes_needed, deadline):
+        """Sleep until bytes_needed() returns 0 or the deadline passes. Must
+        be called with the lock held; a write from another thread wakes it.
+
+        Args:
+            bytes_needed (callable): returns the number of additional bytes
+                required, 0 when satisfied or None if unknown
+            deadline (float): perf_counter deadline, None waits indefinitely
+
+        Returns:
+            bool: True if satisfied
+        """
+        while True:
+            if not self.is_open:
+                raise serial.PortNotOpenError()
+
+            now = time.perf_counter()
+            self._pump(now)
+
+            needed = bytes_needed()
+            if needed == 0:
+                return True
+
+            wake = None
+            if needed is not None:
+                wake = self._time_for(needed)
+            if self._next_push is not None:
+                wake = self._next_push if wake is None else min(wake, self._next_push)
+
+            if wake is None:
+                # nothing more will arrive on its own
+                if deadline is None:
+                    return False
+                wake = deadline
+
+            if deadline is not None and wake >= deadline:
+                if self._lock.wait(max(deadline - now, 0)):
+                    # woken by a write, see if it was enough
+                    continue
+                self._pump(time.perf_counter())
+                return bytes_needed() == 0
+
+            self._lock.wait(max(wake - now, 0))
+
+
+# ---- SD card recordings ---- #
+
+# LIST/INFO chunks of a recording made while receiving SAMPLE_SCANNER_INFO
+SAMPLE_WAV_INFO = {
+    "ICRD": "20190806151241",
+    "ISBJ": "Houston",
+    "IART": "Houston TxWARN",
+    "IGNR": "Houston Police",
+    "INAM": "01 HPD-N",
+    "ICMT": "TGID:12501",
+    "ITCH": "UID:1204417",
+    "ISRC": "P25",
+    "IPRD": "1",
+    "IKEY": "2\x003\x00",
+    "ICOP": "",
+}
+
+# unid chunk lines: favorites list, system, department, channel, site, unit id
+# and conventional fields, see the UNID_*_DATA lists in constants
+SAMPLE_UNID_LINES = (
+    ("Houston", "f_000001.hpd", "Off", "On", "0", "Off"),
+    ("Houston TxWARN", "Off", "", "P25Standard", "Off", "Off", "0"),
+    ("Houston Police", "Off", "29.760427", "-95.369803", "20.0", "Circle", "1"),
+    ("01 HPD-N", "Off", "12501", "ALL", "2", "Off", "0"),
+    ("98 HOU PubSafety NW Simulcast", "Off", "29.86", "-95.53", "15.0", "AUTO"),
+    ("UnitIds", "", "", "1204417"),
+    ("Conventional", "0", "0"),
+)
+
+
+def _riff_chunk(chunk_id, data):
+    """Chunk id, little endian size and data. Data of odd length is followed by
+    a null pad byte that the size doesn't count, as in the RIFF spec."""
+
+    return chunk_id + struct.pack("<I", len(data)) + data + b"\x00" * (len(data) & 1)
+
+
+def write_simulated_recording(
+    path, info=None, unid_lines=None, samples=None, sample_rate=8000
+):
+    """Write a WAV file laid out like the user recordings on the SD card.
+
+    The file has a LIST/INFO chunk, the proprietary unid chunk (64 byte, null
+    delimited lines followed by binary data), a fmt chunk and 16 bit mono PCM
+    audio.
+
+    Args:
+        path (str): file name, the recordings use the start time, e.g.
+            "2019-08-06_15-12-35.wav"
+        info (dict): {INFO chunk id: text}, defaults to SAMPLE_WAV_INFO
+        unid_lines (list): field tuples, defaults to SAMPLE_UNID_LINES
+        samples (list): 16 bit sample values, defaults to one second of silence
+        sample_rate (int): samples per second
+
+    Returns:
+        Path: path of the written file
+    """
+    if info is None:
+        info = SAMPLE_WAV_INFO
+    if unid_lines is None:
+        unid_lines = SAMPLE_UNID_LINES
+    if samples is None:
+        samples = [0] * sample_rate
+
+    info_chunks = b"".join(
+        _riff_chunk(chunk_id.encode(), text.encode() + b"\x00")
+        for chunk_id, text in info.items()
+    )
+
+    unid = b"".join(
+        "\x00".join(fields).encode()[:64].ljust(64, b"\x00") + b"\x00"
+        for fields in unid_lines
+    )
+    # the scanner follows the text lines with binary data
+    unid += bytes(range(128, 256)) * 4
+
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    audio = struct.pack(f"<{len(samples)}h", *samples)
+
+    riff = b"WAVE" + b"".join(
+        (
+            _riff_chunk(b"LIST", b"INFO" + info_chunks),
+            _riff_chunk(b"unid", unid),
+            _riff_chunk(b"fmt ", fmt),
+            _riff_chunk(b"data", audio),
+        )
+    )
+
+    path = Path(path)
+    path.write_bytes(_riff_chunk(b"RIFF", riff))
+
+    return path
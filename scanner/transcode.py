@@ -0,0 +1,213 @@
+"""Compress scanner recordings (WAV) to Opus or MP3 with ffmpeg.
+
+Each recording is encoded by its own ffmpeg process, at most `workers` at a
+time. Outputs that are newer than their recording are skipped, and every
+output is written under a temporary name first, so an interrupted run never
+leaves a truncated file behind. The scanner metadata (get_wav_meta()) is kept
+in the output tags: the INFO fields as the usual title/artist/album tags, and
+everything else as JSON in a "uniden" tag.
+
+Example:
+    outputs = transcode_recordings(wav_files, "/Volumes/iMac HDD/opus/")
+
+Notes:
+    - needs ffmpeg (with libopus and libmp3lame) on the PATH
+"""
+
+import concurrent.futures as cf
+import json
+import logging
+import os
+import subprocess as sb
+from pathlib import Path
+
+from scanner.scanner_utility_functions import get_wav_meta, np, trim_silence as trim
+
+logger = logging.getLogger("uniden_api.transcode")
+
+# {format: (file suffix, ffmpeg codec options, mime type)}
+TRANSCODE_FORMATS = {
+    "opus": (
+        ".opus",
+        ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"],
+        "audio/ogg",
+    ),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k"], "audio/mpeg"),
+}
+
+# {get_wav_meta() key: output tag}
+TRANSCODE_TAGS = {
+    "TGID:Name": "title",
+    "System:Name:1": "artist",
+    "Department:Name:1": "album",
+    "MonitorList:Name:1": "genre",
+    "TransmissionStart": "date",
+}
+
+
+def transcoded_path(wav_file, output_dir, fmt="opus"):
+    """Path of the compressed version of a recording in output_dir."""
+
+    return Path(output_dir, Path(wav_file).stem + TRANSCODE_FORMATS[fmt][0])
+
+
+def is_up_to_date(wav_file, output):
+    """True if output exists and isn't older than wav_file."""
+
+    try:
+        return os.stat(output).st_mtime_ns >= os.stat(wav_file).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def transcode_tags(meta):
+    """Output tags for the scanner metadata of a recording.
+
+    Returns:
+        dict: {tag: text}
+    """
+
+    tags = {tag: meta[key] for key, tag in TRANSCODE_TAGS.items() if meta.get(key)}
+
+    # the raw unid lines are only kept for debugging in get_wav_meta()
+    uniden = {key: meta[key] for key in meta if not key.startswith("line ")}
+    tags["uniden"] = json.dumps(uniden)
+
+    return tags
+
+
+def transcode_command(wav_file, output, fmt="opus", meta=None, ffmpeg="ffmpeg"):
+    """ffmpeg arguments that encode wav_file to output.
+
+    Args:
+        wav_file (str or Path): the recording
+        output (str or Path): file to write, fmt decides the format
+        fmt (str): key of TRANSCODE_FORMATS
+        meta (dict): get_wav_meta() result to store in the tags
+        ffmpeg (str): ffmpeg executable
+
+    Returns:
+        list: command line
+    """
+
+    _, codec_options, _ = TRANSCODE_FORMATS[fmt]
+    command = [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", str(wav_file)]
+    command += ["-map_metadata", "-1", *codec_options]
+    for tag, text in transcode_tags(meta or {}).items():
+        command += ["-metadata", f"{tag}={text}"]
+    command += ["-f", "ogg" if fmt == "opus" else fmt, str(output)]
+
+    return command
+
+
+def transcode_recording(
+    wav_file, output, fmt="opus", ffmpeg="ffmpeg", trim_silence=False
+):
+    """Encode one recording, keeping its scanner metadata.
+
+    Args:
+        trim_silence (bool): leave out the squelch tails and dead air, see
+            scanner_utility_functions.trim_silence()
+
+    Returns:
+        Path: output
+
+    Raises:
+        OSError: if ffmpeg is missing or fails
+    """
+
+    output = Path(output)
+    partial = output.with_name(output.name + ".part")
+    meta = get_wav_meta(wav_file)
+
+    source = wav_file
+    if trim_silence:
+        source = output.with_name(output.name + ".trimmed.wav")
+
+    try:
+        if trim_silence:
+            trim(wav_file, source)
+        result = sb.run(
+            transcode_command(source, partial, fmt, meta, ffmpeg),
+            capture_output=True,
+        )
+    finally:
+        if trim_silence:
+            source.unlink(missing_ok=True)
+    if result.returncode != 0:
+        partial.unlink(missing_ok=True)
+        error = result.stderr.decode(errors="replace").strip()
+        raise OSError(f"ffmpeg failed on {wav_file}: {error}")
+
+    os.replace(partial, output)
+
+    return output
+
+
+def transcode_recordings(
+    wav_files,
+    output_dir,
+    fmt="opus",
+    workers=None,
+    progress=None,
+    ffmpeg="ffmpeg",
+    trim_silence=False,
+):
+    """Encode recordings in parallel, skipping the ones already up to date.
+
+    Args:
+        wav_files (iterable): paths of the recordings
+        output_dir (str or Path): directory for the compressed files
+        fmt (str): key of TRANSCODE_FORMATS
+        workers (int): ffmpeg processes at a time, defaults to the number of
+            cores
+        progress (callable): called with (files done, files to encode)
+        ffmpeg (str): ffmpeg executable
+        trim_silence (bool): leave out the silence of each recording
+
+    Returns:
+        dict: {wav file: compressed file} for every recording that has an up
+            to date compressed version, failures are logged and left out
+
+    Raises:
+        ImportError: if trim_silence is set and NumPy isn't installed
+    """
+
+    if trim_silence and np is None:
+        raise ImportError("trim_silence needs numpy")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    outputs = {}
+    stale = []
+    for wav_file in wav_files:
+        output = transcoded_path(wav_file, output_dir, fmt)
+        if is_up_to_date(wav_file, output):
+            outputs[wav_file] = output
+        else:
+            stale.append((wav_file, output))
+
+    logger.info(f"{len(stale)} recordings to encode, {len(outputs)} up to date")
+
+    # every worker thread waits on its own ffmpeg process
+    with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = {
+            pool.submit(
+                transcode_recording, wav_file, output, fmt, ffmpeg, trim_silence
+            ): wav_file
+            for wav_file, output in stale
+        }
+        for done_count, job in enumerate(cf.as_completed(jobs), 1):
+            wav_file = jobs[job]
+            try:
+                outputs[wav_file] = job.result()
+            except (OSError, ValueError) as err:
+                logger.error(f"{wav_file} not encoded: {err}")
+            if progress is not None:
+                progress(done_count, len(stale))
+
+    return outputs
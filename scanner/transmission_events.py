@@ -0,0 +1,200 @@
+"""Turns the stream of scanner states into one record per transmission.
+
+A transmission starts when the squelch opens (Property Mute is "Unmute") or a
+new TGID or unit ID shows up, and ends when the squelch closes. States in
+between only update the peak signal readings, so an idle scanner produces no
+records at all.
+
+Example:
+    detector = TransmissionDetector(callback=print)
+    detector.watch(scanner)  # every state change is fed to the detector
+"""
+
+import logging
+from datetime import datetime
+
+# values the scanner uses for "nothing here"
+EMPTY_VALUES = ("", "---", None)
+
+# keys of a transmission record, in the order they are stored
+TRANSMISSION_FIELDS = (
+    "start",
+    "end",
+    "system",
+    "department",
+    "site",
+    "channel",
+    "frequency",
+    "tgid",
+    "unit_id",
+    "unit_id_name",
+    "peak_rssi",
+    "peak_sig",
+    "updates",
+)
+
+
+def _number(value):
+    """Signal reading as a number, None if it isn't one."""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _present(value):
+    return value not in EMPTY_VALUES
+
+
+class TransmissionDetector:
+    """Finds transmissions in successive update_scanner_state() results."""
+
+    def __init__(self, callback=None):
+        """Initialization
+
+        Args:
+            callback (callable): called with each finished transmission record
+                (dict with TRANSMISSION_FIELDS keys)
+        """
+
+        self.logger = logging.getLogger("uniden_api.TransmissionDetector")
+
+        self.callback = callback
+        # record of the transmission in progress
+        self.current = None
+        self._last_talker = (None, None)
+
+    def update(self, state, timestamp=None):
+        """Feed the next scanner state to the detector.
+
+        Args:
+            state (dict): scanner state, follows GSI_OUTPUT format
+            timestamp (str): time of the state, defaults to now (isoformat)
+
+        Returns:
+            list: transmission records that ended with this state
+        """
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+
+        info = state.get("ScannerInfo", {})
+        prop = info.get("Property", {})
+        tgid = info.get("TGID", {}).get("TGID")
+        unit_id = info.get("UnitID", {}).get("U_Id")
+
+        squelch_open = prop.get("Mute") == "Unmute"
+        talker = (
+            tgid if _present(tgid) else None,
+            unit_id if _present(unit_id) else None,
+        )
+        new_talker = talker != self._last_talker and any(talker)
+        self._last_talker = talker
+
+        finished = []
+
+        if self.current is not None:
+            # a different TGID or unit ID without the squelch closing in between
+            other_tgid = (
+                talker[0] is not None
+                and self.current["tgid"] is not None
+                and talker[0] != self.current["tgid"]
+            )
+            other_unit = (
+                talker[1] is not None
+                and self.current["unit_id"] is not None
+                and talker[1] != self.current["unit_id"]
+            )
+            if not squelch_open or other_tgid or other_unit:
+                finished.append(self._finish(timestamp))
+
+        if self.current is None and (squelch_open or new_talker):
+            self.current = self._start(timestamp)
+
+        if self.current is not None:
+            self._update(info, prop, talker, timestamp)
+
+            # squelch already closed again, e.g. the hit fell between polls
+            if not squelch_open:
+                finished.append(self._finish(timestamp))
+
+        for record in finished:
+            if self.callback is not None:
+                self.callback(record)
+
+        return finished
+
+    def flush(self, timestamp=None):
+        """End the transmission in progress, e.g. before closing the port.
+
+        Returns:
+            list: the ended transmission record, if there was one
+        """
+        if self.current is None:
+            return []
+
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
+
+        record = self._finish(timestamp)
+        if self.callback is not None:
+            self.callback(record)
+
+        return [record]
+
+    def watch(self, scanner):
+        """Feed every state change of a UnidenScanner to the detector.
+
+        Returns:
+            tuple: subscription, see UnidenScanner.unsubscribe()
+        """
+
+        return scanner.subscribe("", lambda changes: self.update(scanner.scan_state))
+
+    def _start(self, timestamp):
+        record = dict.fromkeys(TRANSMISSION_FIELDS)
+        record["start"] = timestamp
+        record["updates"] = 0
+
+        return record
+
+    def _update(self, info, prop, talker, timestamp):
+        """Fill in anything that wasn't known yet and track the peaks."""
+
+        record = self.current
+        record["end"] = timestamp
+        record["updates"] += 1
+
+        names = {
+            "system": info.get("System", {}).get("Name"),
+            "department": info.get("Department", {}).get("Name"),
+            "site": info.get("Site", {}).get("Name"),
+            "channel": info.get("TGID", {}).get("Name")
+            or info.get("ConvFrequency", {}).get("Name"),
+            "frequency": info.get("SiteFrequency", {}).get("Freq")
+            or info.get("ConvFrequency", {}).get("Freq"),
+            "tgid": talker[0],
+            "unit_id": talker[1],
+            "unit_id_name": info.get("UnitID", {}).get("Name"),
+        }
+        for field, value in names.items():
+            if record[field] is None and _present(value):
+                record[field] = value
+
+        peaks = (("peak_rssi", prop.get("Rssi")), ("peak_sig", prop.get("Sig")))
+        for field, value in peaks:
+            value = _number(value)
+            if value is None:
+                continue
+            if record[field] is None or value > record[field]:
+                record[field] = value
+
+    def _finish(self, timestamp):
+        record = self.current
+        self.current = None
+        if record["end"] is None:
+            record["end"] = timestamp
+
+        self.logger.debug(f"transmission: {record}")
+
+        return record
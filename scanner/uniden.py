@@ -21,6 +21,8 @@ if not, write to the Free Software Foundation, Inc.,
 """
 
 import time
+import queue
+import threading
 import serial
 import serial.tools.list_ports as stlp
 from pathlib import Path
@@ -30,12 +32,15 @@ import xml.etree.ElementTree as ET
 
 from scanner.constants import *
 import scanner.scanner_utility_functions as suf
+import scanner.transcode as transcode
+import scanner.sd_sync as sd_sync
 from collections import OrderedDict
 from datetime import datetime
 from pprint import pprint
-from copy import deepcopy
 
 import sqlite3
+import scanner.uniden_db as udb
+from scanner.uniden_db import SCAN_HITS_INSERT, scan_state_to_row
 
 # create logger
 module_logger = logging.getLogger("uniden_api")
@@ -86,18 +91,397 @@ def frq_from_scanner(f):
     return ".".join([l, r])
 
 
+def split_xml_blocks(data, root_tag):
+    """Splits the xml portion of a response (everything after the "CMD,<XML>,"
+    line) into blocks that can be fed to an xml parser.
+
+    Long lists (GLT, MSI) are sent as several blocks, each closing the root
+    tag and ending with a Footer where EOT="0". The closing root tag is
+    dropped from those blocks and the next block's prefix line and xml header
+    are dropped, so the parser sees the blocks nested inside the first root
+    element.
+
+    Args:
+        data (bytes): xml data as read from the port
+        root_tag (str): root xml tag for the command, see XML_TAG_HANDLER
+
+    Returns:
+        list: byte strings ready to be fed to an xml parser
+    """
+    root_end = f"</{root_tag}>\r".encode()
+    blocks = []
+    start = 0
+
+    while True:
+        end = data.find(root_end, start)
+        end = len(data) if end == -1 else end + len(root_end)
+        block = data[start:end]
+        start = end
+
+        header_start = block.find(XML_HEADER_LINE)
+        if header_start == -1:
+            module_logger.error(f"{block[:80]} is not a valid xml block.")
+        else:
+            block = block[header_start + len(XML_HEADER_LINE) :]
+
+        if not block.endswith(root_end) or XML_MORE_BLOCKS not in block:
+            blocks.append(block)
+            return blocks
+
+        blocks.append(block[: -len(root_end)])
+
+
+def response_length(data):
+    """Finds the end of the first complete response in data.
+
+    Simple responses end at the first \r. Responses whose first line is
+    "CMD,<XML>," continue until the root tag is closed by the last block.
+
+    Args:
+        data (bytes): data read from the port
+
+    Returns:
+        int: length of the first response, None if it hasn't all arrived
+    """
+    line_end = data.find(b"\r")
+    if line_end == -1:
+        return None
+    if not data[: line_end + 1].endswith(b",<XML>,\r"):
+        return line_end + 1
+
+    # xml header, then the root element's opening tag
+    header_end = data.find(b"\r", line_end + 1)
+    root_line_end = data.find(b"\r", header_end + 1) if header_end != -1 else -1
+    if root_line_end == -1:
+        return None
+
+    root_line = data[header_end + 1 : root_line_end + 1]
+    if not root_line.startswith(b"<") or root_line.endswith(b"/>\r"):
+        return root_line_end + 1
+
+    root_tag = root_line[1:].split(b">", 1)[0].split(b" ", 1)[0]
+    root_end = b"</" + root_tag + b">\r"
+    start = root_line_end + 1
+
+    while True:
+        end = data.find(root_end, start)
+        if end == -1:
+            return None
+        end += len(root_end)
+        if XML_MORE_BLOCKS not in data[start:end]:
+            return end
+        start = end
+
+
+def parse_response(res):
+    """Function turns a complete response into the data returned by
+    UnidenScanner.get_response().
+
+    Args:
+        res (bytes): complete response, see response_length()
+
+    Returns:
+        err_res (str): if scanner throws an error
+        xml_dict (dict): if scanner responds with xml data
+        res_dict (dict): dict of simple response if no xml data provided by scanner
+    """
+    first_line, xml_data = res.split(b"\r", 1) if b"\r" in res else (res, b"")
+    res_list = first_line.decode().split(",")
+
+    # 3 letter command or 3 letter error code
+    cmd = res_list[0]
+
+    if len(res_list) == 1:
+        if cmd in UnidenScanner.err_list:
+            module_logger.error(f"scanner replied with error code:\n{cmd}")
+        return cmd
+
+    if res_list[1] != "<XML>":
+        return {"cmd": res_list.pop(0), "data": res_list}
+
+    root_tag = XML_TAG_HANDLER[cmd][HUMAN_TAG_HANDLER["root_tag"]]
+    blocks = split_xml_blocks(xml_data, root_tag)
+
+    if cmd in ("GSI", "PSI", "MSI", "GLT"):
+        xml_dict = parse_gsi_blocks(blocks)
+    else:
+        xml_dict = parse_xml_blocks(blocks, cmd)
+    xml_dict["cmd"] = cmd
+
+    return xml_dict
+
+
+def _tag_paths(template, path=()):
+    """Maps every path in a GSI_OUTPUT style template to the type of value it
+    holds, e.g. ("ScannerInfo", "ViewDescription", "PlainText"): list."""
+
+    paths = {}
+    for key, value in template.items():
+        key_path = path + (key,)
+        paths[key_path] = type(value)
+        if isinstance(value, dict):
+            paths.update(_tag_paths(value, key_path))
+
+    return paths
+
+
+# branch types for every tag path the GSI, PSI, MSI and GLT parser knows about
+GSI_TAG_PATHS = _tag_paths(GSI_OUTPUT)
+
+
+def new_scan_state():
+    """Fresh scanner state based on GSI_OUTPUT.
+
+    Only the top level branches are copied, because merge_scan_state() only
+    replaces the branches below them. Deeper branches are shared with
+    GSI_OUTPUT, so replace them instead of editing them in place.
+
+    Returns:
+        dict: scanner state with template values
+    """
+
+    return {
+        key: dict(value) if isinstance(value, dict) else value
+        for key, value in GSI_OUTPUT.items()
+    }
+
+
+def state_paths(state):
+    """Flattens a scanner state to {dotted path: value}.
+
+    Branches below ScannerInfo are listed without the "ScannerInfo." prefix,
+    e.g. "System.Name", "UnitID.U_Id" or "Property.Sig". Lists, like
+    "ViewDescription.PlainText", are values of their own.
+
+    Args:
+        state (dict): scanner state, see update_scanner_state()
+
+    Returns:
+        dict: leaf values by dotted path
+    """
+
+    def flatten(branch, prefix):
+        for key, value in branch.items():
+            if isinstance(value, dict):
+                flatten(value, f"{prefix}{key}.")
+            else:
+                paths[f"{prefix}{key}"] = value
+
+    paths = {}
+    flatten({k: v for k, v in state.items() if k != "ScannerInfo"}, "")
+    flatten(state.get("ScannerInfo", {}), "")
+
+    return paths
+
+
+def diff_state_paths(old_paths, new_paths):
+    """Changes between two state_paths() results.
+
+    Returns:
+        dict: new value for every path that changed, None for removed paths
+    """
+
+    changes = {
+        path: value
+        for path, value in new_paths.items()
+        if path not in old_paths or old_paths[path] != value
+    }
+    for path in old_paths.keys() - new_paths.keys():
+        changes[path] = None
+
+    return changes
+
+
+def parse_gsi_blocks(blocks):
+    """Function converts xml scanner data from gsi command to json style dict
+
+    Each element is placed using GSI_TAG_PATHS and a stack of open branches,
+    so the work per element only depends on its depth. Tags that GSI_OUTPUT
+    lists as lists (PlainText, Button, MenuItem, GLT items...) are stored as a
+    list of attribute dicts.
+
+    Args:
+        blocks (list): xml byte strings, see split_xml_blocks()
+
+    Returns:
+        clean_xml_dict (dict): branches found in the xml data
+
+    Notes:
+        - [ ] currently fails if Mode is "Menu tree" and yes/no selection view
+    """
+    # only branches found in the xml data
+    clean_xml_dict = {}
+
+    # root tag for this command
+    root_tag = None
+
+    # initialize parser. events occur at start or end tags
+    parser = ET.XMLPullParser(events=("start", "end"))
+
+    # (tag path, branch) for every open element
+    open_branches = []
+
+    for block in blocks:
+
+        # whole block of data from serial port we will feed the parser
+        parser.feed(block)
+
+        for event_trigger, element in parser.read_events():
+            current_tag = element.tag
+
+            # set the root_tag variable if it's empty
+            if root_tag is None:
+                root_tag = current_tag
+
+            if current_tag == "Footer":
+                # case: footer reached and next transm block waiting
+                if event_trigger == "end" and element.attrib.get("EOT") == "0":
+                    # next block was already joined by split_xml_blocks()
+                    open_branches = []
+                continue
+
+            if event_trigger == "end":
+                # the root stays open for blocks that follow
+                if current_tag != root_tag:
+                    open_branches.pop()
+                continue
+
+            if open_branches:
+                parent_path, parent = open_branches[-1]
+                tag_path = parent_path + (current_tag,)
+            else:
+                parent = clean_xml_dict
+                tag_path = (current_tag,)
+
+            branch_type = GSI_TAG_PATHS.get(tag_path)
+
+            if branch_type is list:
+                # attributes with identical keys are stored as a list of dicts
+                branch = dict(element.attrib)
+                parent.setdefault(current_tag, []).append(branch)
+            else:
+                branch = parent.get(current_tag)
+                if branch is None:
+                    # initialize branch if it doesn't exist
+                    branch = parent[current_tag] = {}
+                if branch_type is None:
+                    module_logger.debug(f"{tag_path} is not in GSI_OUTPUT")
+                if branch_type is not str:
+                    branch.update(element.attrib)
+
+            open_branches.append((tag_path, branch))
+
+    return clean_xml_dict
+
+
+def parse_xml_blocks(blocks, cmd):
+    """Function to parse xml serial data block by block and
+    return a formatted dict with information returned by the scanner.
+
+    Notes:
+        - only tested against GSI and PSI style data
+            - these types of data mostly use unique xml tags
+            - some tag attributes don't use unique names, like PlainText
+            and Button
+        - MSI data does not use unique tags, so multiple data points can have
+            the same tag.
+        - GLT data does not use unique tags either
+
+    Args:
+        blocks (list): xml byte strings, see split_xml_blocks()
+        cmd (str): three letter string scanner command.
+
+    Returns:
+        xml_dict (dict): colon-separated dict keys with associated
+            scanner values.
+
+    """
+    # ----- Initializations ----- #
+
+    xml_dict = {}  # initialize data storage
+
+    # initialize parser
+    parser = ET.XMLPullParser()  # only returns if event is 'end'
+
+    # get handler to determine how to process xml data
+    handler = XML_TAG_HANDLER[cmd]
+    root_tag = handler[HUMAN_TAG_HANDLER["root_tag"]]
+    unique_tag_names = handler[HUMAN_TAG_HANDLER["unique_tag_names"]]
+
+    # ---- parse xml using non-blocking parser ---- #
+
+    for block in blocks:
+
+        # data we will feed the parser
+        parser.feed(block)
+
+        # parser is a generator and events are popped internally
+        for event in parser.read_events():
+            element = event[1]
+            current_tag = element.tag
+            sub_dict = {}
+
+            # checking to see if we're at end of transmission or just end of block
+            if current_tag == "Footer" and element.attrib["EOT"] == "1":
+                continue
+            elif current_tag == "Footer" and element.attrib["EOT"] == "0":
+                # next block was already joined by split_xml_blocks()
+                continue
+            elif current_tag == root_tag:
+                # root attributes are stored like any other tag
+                pass
+            elif current_tag == "MenuErrorMsg":
+                # this skips the extra code that is required to process menu items
+                unique_tag_names = True
+            elif current_tag == "Button":
+                module_logger.debug("'Button' tag is not unique")
+            elif current_tag == "PlainText":
+                module_logger.debug("'PlainText' tag is not unique")
+
+            for item in element.attrib.items():
+                sub_dict[item[0]] = item[1]
+
+            # some commands return non-unique tag names, use name attribute instead
+            if not unique_tag_names:
+                # current_tag will be repeated, this is first entry
+                if not current_tag in xml_dict:
+                    try:
+                        xml_dict[current_tag] = {sub_dict["Name"]: sub_dict}
+                    except KeyError:
+                        module_logger.exception("xml parse key error.")
+                        continue
+                # add sub dicts under the repeated current tag
+                else:
+                    xml_dict[current_tag][sub_dict["Name"]] = sub_dict
+                # try:
+                #     xml_dict[sub_dict["Name"]] = sub_dict
+                #     # xml_dict[current_tag][sub_dict["Name"]] = sub_dict
+                # except KeyError:
+                #     module_logger.exception(
+                #         "Key error building non-unique tag names."
+                #     )
+                continue
+
+            xml_dict[current_tag] = sub_dict
+
+    return xml_dict
+
+
 class UnidenScanner:
     """Initiates communication with the scanner when an instance is created and
     provides a series of methods to get and set scanner settings."""
 
     err_list = ("NG", "ORER", "FER", "ERR", "")
 
-    def __init__(self, model="SDS100", speed="115200"):
+    def __init__(self, model="SDS100", speed="115200", serial_port=None):
         """Initialization
 
         Args:
             model (str): Model name of scanner used to open port.
             speed (int): Port connection speed.
+            serial_port (serial.Serial): optional already opened serial port (or
+                a stand-in such as simulator.SimulatedSerial) used instead of
+                searching the system ports for the scanner.
         """
 
         self.logger = logging.getLogger("uniden_api.UnidenScanner")
@@ -105,6 +489,21 @@ class UnidenScanner:
 
         # serial port connection
         self.serial = None
+        self.serial_port = serial_port
+        # bytes read from the port that haven't been handed out yet
+        self._rx_buffer = bytearray()
+        # PSI push reader thread, see start_push_updates()
+        self._push_thread = None
+        self._push_stop = threading.Event()
+        self._push_replies = queue.Queue()
+        self._push_callbacks = []
+        self._push_cond = threading.Condition()
+        self._push_latest = None
+        self._push_new = False
+        # state change tracking, see subscribe()
+        self.state_changes = {}
+        self._state_paths = {}
+        self._subscriptions = []
         self.port = ""
         self.speed = speed
         self.model = model
@@ -139,6 +538,15 @@ class UnidenScanner:
 
         # description = f"{self.model} Serial Port "
 
+        # use the port instance passed in at initialization if there is one
+        if self.serial_port is not None:
+            self.serial = self.serial_port
+            self.port = getattr(self.serial, "port", "")
+            if not self.serial.isOpen():
+                self.serial.open()
+            self.logger.info(f"using supplied serial port: {self.port}")
+            return True
+
         # check currently available ports for our model
         for port in stlp.comports():
             if port.description.find(self.model) != -1:
@@ -169,8 +577,11 @@ class UnidenScanner:
         """
 
         if self.serial.isOpen():
+            # the push reader must be done with the port before it is closed
+            self._stop_push_reader()
             self.serial.close()
         else:
+            self._stop_push_reader()
             self.logger.info("Serial port was already closed.")
             return False
 
@@ -202,14 +613,117 @@ class UnidenScanner:
             self.logger.error("Cannot read line, port is closed.")
             return
 
-        res_line = self.serial.read_until(b"\r").decode()
+        res_line = self._read_frame(b"\r").decode()
         # self.logger.debug(f"parser feed data: {res_line}")
 
         res_line = res_line.replace("\r", "\n")
-        self.logger.debug(f"read_and_decode_line: {res_line}")
+        self.logger.debug("read_and_decode_line: %s", res_line)
 
         return res_line
 
+    def _read_frame(self, terminator=b"\r"):
+        """helper method, reads the port until terminator is found.
+
+        Everything waiting on the port is pulled into the receive buffer in
+        one read, so a long reply costs one call per chunk rather than one
+        per line. Bytes after the terminator stay buffered for the next read.
+
+        Args:
+            terminator (bytes): marks the end of the frame
+
+        Returns:
+            bytes: frame including terminator, or whatever arrived before the
+                port timed out
+        """
+        buffer = self._rx_buffer
+        search_start = 0
+
+        while True:
+            end = buffer.find(terminator, search_start)
+            if end != -1:
+                end += len(terminator)
+                frame = bytes(buffer[:end])
+                del buffer[:end]
+                return frame
+
+            # terminator could straddle the old and new data
+            search_start = max(len(buffer) - len(terminator) + 1, 0)
+
+            # block for a single byte if nothing is waiting yet
+            chunk = self.serial.read(self.serial.in_waiting or 1)
+            if not chunk:
+                if buffer:
+                    self.logger.error(f"timed out waiting for {terminator}")
+                frame = bytes(buffer)
+                buffer.clear()
+                return frame
+
+            buffer.extend(chunk)
+
+    def _read_response_frame(self):
+        """helper method, reads one complete response without waiting for the
+        port to time out.
+
+        Simple responses end at the first \r. Responses whose first line is
+        "CMD,<XML>," continue until the root tag is closed by the last block.
+        While push updates are streaming, the push reader thread owns the port
+        and hands command responses over through a queue.
+
+        Returns:
+            bytes: raw response, including \r characters
+        """
+        if self._push_thread is not None:
+            try:
+                return self._push_replies.get(timeout=self.serial.timeout)
+            except queue.Empty:
+                return b""
+
+        return self._read_port_response()
+
+    def _read_port_response(self):
+        """helper method, reads one complete response from the port, see
+        _read_response_frame()."""
+
+        frame = self._read_frame(b"\r")
+        if not frame.endswith(b",<XML>,\r"):
+            return frame
+
+        # xml header, then the root element's opening tag
+        frame += self._read_frame(b"\r")
+        root_line = self._read_frame(b"\r")
+        frame += root_line
+        if not root_line.startswith(b"<") or root_line.endswith(b"/>\r"):
+            return frame
+
+        root_tag = root_line[1:].split(b">", 1)[0].split(b" ", 1)[0]
+        root_end = b"</" + root_tag + b">\r"
+
+        while True:
+            block = self._read_frame(root_end)
+            frame += block
+            if not block.endswith(root_end) or XML_MORE_BLOCKS not in block:
+                return frame
+
+    def _read_xml_blocks(self, root_tag):
+        """helper method, reads the xml portion of a response after the
+        "CMD,<XML>," line has been read.
+
+        Args:
+            root_tag (str): root xml tag for the command, see XML_TAG_HANDLER
+
+        Returns:
+            list: byte strings ready to be fed to an xml parser
+        """
+        root_end = f"</{root_tag}>\r".encode()
+        data = b""
+
+        while True:
+            block = self._read_frame(root_end)
+            data += block
+            if not block.endswith(root_end) or XML_MORE_BLOCKS not in block:
+                # last block, or timed out and we hand over what we have
+                return split_xml_blocks(data, root_tag)
+
     def send_command(self, cmd):
         """Method sends command to scanner and checks response returned
         before returning data.
@@ -253,297 +767,37 @@ class UnidenScanner:
             xml_dict (dict): if scanner responds with xml data
             res_dict (dict): dict of simple response if no xml data provided by scanner
         """
+        # double check that the port is open
+        if not self.port_is_open():
+            self.logger.error("Cannot read response, port is closed.")
+            return
 
-        # first response line contains command and data or format note
-        res_line = self._read_and_decode_line()
-        res_line = res_line.rstrip("\n")
-        res_list = res_line.split(",")
-
-        # the number of response items allows us to triage data
-        num_res_items = len(res_list)
-        self.logger.debug(
-            f"get_response(): {num_res_items} items in first response line."
-        )
-
-        # 3 letter command or 3 letter error code
-        cmd = res_list[0]
-
-        if num_res_items > 1:
-            # first response item
-            res_1 = res_list[1]
-        else:
-            err_res = cmd
-            if cmd in self.err_list:
-                self.logger.exception(f"scanner replied with error code:\n{err_res}")
-
-            return err_res
-
-        if cmd == "GSI" or cmd == "MSI" or cmd == "GLT":
-            self.logger.debug(f"returned GSI, PSI, MSI, or GLT data.")
-
-            # parse xml using the GSI specific parser
-            xml_dict = self.get_gsi_response(cmd)
-            xml_dict["cmd"] = cmd
-
-            return xml_dict
-        # use the general xml response method for other commands
-        elif res_1 == "<XML>":
-            self.logger.debug(f"found xml data.")
-
-            # xml parsing is handled by separate method
-            xml_dict = self.get_xml_response(cmd)
-            xml_dict["cmd"] = cmd  # not sure about this
-
-            return xml_dict
-        else:
-            res_dict = {"cmd": res_list.pop(0), "data": res_list}
-            self.logger.debug(f"cmd: {res_dict['cmd']}")
-            self.logger.debug(f"data list: {res_dict['data']}")
+        res = self._read_response_frame()
+        self.logger.debug("get_response(): %s", res[:80])
 
-        return res_dict
+        return parse_response(res)
 
     def get_gsi_response(self, cmd="GSI"):
-        """Method converts xml scanner data from gsi command to json style dict
+        """Method reads the xml part of a GSI, PSI, MSI or GLT response and
+        converts it to json style dict, see parse_gsi_blocks().
 
-        Notes:
-            - [ ] currently fails if Mode is "Menu tree" and yes/no selection view
+        Args:
+            cmd (str): three letter string scanner command.
         """
-        # get a clean copy of template xml file
-        xml_dict = deepcopy(GSI_OUTPUT)
-
-        # version of xml dict that doesn't contain content from constant
-        clean_xml_dict = {}
-
-        # root tag for this command
-        root_tag = ""
-
-        # initialize flag to signal end of xml parsing
-        at_xml_end = False
-
-        # initialize parser. events occur at start or end tags
-        parser = ET.XMLPullParser(events=["start", "end"])
-
-        # read the xml header line (essentially useless except for check)
-        header_line = self._read_and_decode_line()
-        self.logger.debug(f"xml header line: {header_line}")
-
-        if header_line != '<?xml version="1.0" encoding="utf-8"?>\n':
-            self.logger.error(f"{header_line} is not a valid xml line.")
-
-        # ---- parse xml using non-blocking parser ---- #
-
-        # depth in xml tree
-        depth = 0
-        # list of elements in order of occurence
-        element_tree = []
-        # placeholder for current level of xml dict we're working with
-        # cur_lev_xml_dict = {}
-
-        while not at_xml_end:
-
-            # line of data from serial port we will feed the parser
-            read_line = self._read_and_decode_line()
-            parser.feed(read_line)
-
-            # skip read_events() if none are enqueued
-            if type(parser.read_events()) is None:
-                continue
-
-            # parser is a generator and events are popped internally
-            # so you have to deal with info as it arrives
-            for event in parser.read_events():
-                # tiggers are either "start" or "end"
-                event_trigger = event[0]
-
-                # xml element, tag, and attribs
-                element = event[1]
-                current_tag = element.tag
-                current_attribs = element.attrib
-
-                # set the root_tag variable if it's empty
-                if root_tag == "":
-                    root_tag = current_tag
-
-                # checking to see if we're at end of transmission or just end of block
-                if current_tag == "Footer":
-                    # case: end of transmission, all tags closed
-                    if current_attribs["EOT"] == "1" and event_trigger == "end":
-                        continue
-                    # case: footer reached and next transm block waiting
-                    elif current_attribs["EOT"] == "0" and event_trigger == "end":
-                        # eat up bytes until you get to start of next block of data
-                        self.serial.read_until(
-                            b'<?xml version="1.0" encoding="utf-8"?>\r'
-                        )
-                        # reset the element tree
-                        element_tree = []
-                        continue
-                    else:
-                        continue
-                elif current_tag == root_tag and event_trigger == "end":
-                    # once you encounter the root tag again you're done
-                    at_xml_end = True
-                elif event_trigger == "start":
-                    depth += 1
-
-                    # breadcrumb trail for position on tree
-                    element_tree.append(current_tag)
-
-                    # dict tells us type of data to expect from scanner
-                    cur_lev_xml_dict = xml_dict
-
-                    # reset current clean branch to root
-                    cur_clean_xml_dict = clean_xml_dict
-
-                    # drill down to current branch
-                    for tag in element_tree:
-                        cur_lev_xml_dict = cur_lev_xml_dict[tag]
-
-                        # if isinstance(cur_lev_xml_dict, list):
-                        #     continue
-                        # clean dict might not have existing branch
-                        if cur_clean_xml_dict.get(tag) is None:
-                            if isinstance(cur_lev_xml_dict, list):
-                                cur_clean_xml_dict[tag] = []
-                            else:
-                                # initialize branch if it doesn't exist
-                                cur_clean_xml_dict[tag] = {}
-
-                        cur_clean_xml_dict = cur_clean_xml_dict[tag]
-
-                    # attributes with identical keys are stored as a list of dicts
-                    if isinstance(cur_lev_xml_dict, list):
-                        attrib_dict = {}
-
-                        # delete first item (dict) if it's just empty placeholder
-                        first_item = cur_lev_xml_dict[0]
-                        if first_item.get("Name") == "" or first_item.get("Text") == "":
-                            cur_lev_xml_dict.pop(0)
-
-                        for attrib, value in current_attribs.items():
-                            attrib_dict[attrib] = value
-                        cur_lev_xml_dict.append(attrib_dict)
-                        cur_clean_xml_dict.append(attrib_dict)
-                    else:
-                        for attrib, value in current_attribs.items():
-                            try:
-                                cur_lev_xml_dict[attrib] = value
-                                cur_clean_xml_dict[attrib] = value
-                            except TypeError:
-                                self.logger.debug(f"{cur_lev_xml_dict} is a string")
+        root_tag = XML_TAG_HANDLER[cmd][HUMAN_TAG_HANDLER["root_tag"]]
 
-                # special checks when parser encounters closing tag
-                elif event_trigger == "end":
-                    depth -= 1
-                    element_tree.pop(-1)
-
-        # return xml_dict
-        return clean_xml_dict
+        return parse_gsi_blocks(self._read_xml_blocks(root_tag))
 
     def get_xml_response(self, cmd):
-        """Method to parse xml serial data line-by line and
-        return a formatted dict with information returned by the scanner.
-
-        Notes:
-            - only tested against GSI and PSI style data
-                - these types of data mostly use unique xml tags
-                - some tag attributes don't use unique names, like PlainText
-                and Button
-            - MSI data does not use unique tags, so multiple data points can have
-                the same tag.
-            - GLT data does not use unique tags either
+        """Method reads the xml part of a response and returns a formatted
+        dict, see parse_xml_blocks().
 
         Args:
             cmd (str): three letter string scanner command.
-
-        Returns:
-            xml_dict (dict): colon-separated dict keys with associated
-                scanner values.
-
         """
-        # ----- Initializations ----- #
-
-        xml_dict = {}  # initialize data storage
-        at_xml_end = False  # initialize end of xml flag
-
-        # initialize parser
-        parser = ET.XMLPullParser()  # only returns if event is 'end'
-
-        # get handler to determine how to process xml data
-        handler = XML_TAG_HANDLER[cmd]
-        root_tag = handler[HUMAN_TAG_HANDLER["root_tag"]]
-        unique_tag_names = handler[HUMAN_TAG_HANDLER["unique_tag_names"]]
-
-        # read the xml header line (essentially useless except for check)
-        header_line = self._read_and_decode_line()
-        self.logger.debug(f"xml header line: {header_line}")
+        root_tag = XML_TAG_HANDLER[cmd][HUMAN_TAG_HANDLER["root_tag"]]
 
-        if header_line != '<?xml version="1.0" encoding="utf-8"?>\n':
-            self.logger.error(f"{header_line} is not a valid xml line.")
-
-        # ---- parse xml using non-blocking parser ---- #
-
-        while not at_xml_end:
-
-            # data we will feed the parser
-            read_line = self._read_and_decode_line()
-            parser.feed(read_line)
-
-            # skip read_events() if none are enqueued
-            if type(parser.read_events()) is None:
-                continue
-
-            # parser is a generator and events are popped internally
-            for event in parser.read_events():
-                element = event[1]
-                current_tag = element.tag
-                sub_dict = {}
-
-                # checking to see if we're at end of transmission or just end of block
-                if current_tag == "Footer" and element.attrib["EOT"] == "1":
-                    continue
-                elif current_tag == "Footer" and element.attrib["EOT"] == "0":
-                    # eat up bytes until you get to start of next block of data
-                    self.serial.read_until(b'<?xml version="1.0" encoding="utf-8"?>\r')
-                    continue
-                elif current_tag == root_tag:
-                    # once you encounter the root tag again you're done
-                    at_xml_end = True
-                elif current_tag == "MenuErrorMsg":
-                    # this skips the extra code that is required to process menu items
-                    unique_tag_names = True
-                elif current_tag == "Button":
-                    self.logger.debug("'Button' tag is not unique")
-                elif current_tag == "PlainText":
-                    self.logger.debug("'PlainText' tag is not unique")
-
-                for item in element.attrib.items():
-                    sub_dict[item[0]] = item[1]
-
-                # some commands return non-unique tag names, use name attribute instead
-                if not unique_tag_names:
-                    # current_tag will be repeated, this is first entry
-                    if not current_tag in xml_dict:
-                        try:
-                            xml_dict[current_tag] = {sub_dict["Name"]: sub_dict}
-                        except KeyError:
-                            self.logger.exception("xml parse key error.")
-                            continue
-                    # add sub dicts under the repeated current tag
-                    else:
-                        xml_dict[current_tag][sub_dict["Name"]] = sub_dict
-                    # try:
-                    #     xml_dict[sub_dict["Name"]] = sub_dict
-                    #     # xml_dict[current_tag][sub_dict["Name"]] = sub_dict
-                    # except KeyError:
-                    #     self.logger.exception(
-                    #         "Key error building non-unique tag names."
-                    #     )
-                    continue
-
-                xml_dict[current_tag] = sub_dict
-
-        return xml_dict
+        return parse_xml_blocks(self._read_xml_blocks(root_tag), cmd)
 
     def reset_port(self):
         """Method resets the port to ensure no data is waiting on the scanner
@@ -556,6 +810,14 @@ class UnidenScanner:
         if not self.port_is_open():
             return False
 
+        if self._push_thread is not None:
+            # the push reader owns the port, forget what it handed over
+            self._drain_push_replies()
+            return True
+
+        # forget anything left over from a previous read
+        self._rx_buffer.clear()
+
         if self.serial.in_waiting > 0:
             # get read all data on the port to zero it out
             self.serial.readall()
@@ -575,14 +837,32 @@ class UnidenScanner:
             fresh_state: passes the updated scanner state dict
             False: if there is an error communicating with scanner
 
-        """
-        # get a copy of the empty state, so scanner refreshes properly.
-        self.scan_state = deepcopy(GSI_OUTPUT)  # updated
+        Notes:
+            - "push" starts push updates if needed and returns the most recent
+                pushed state. No command is sent, and if nothing new has been
+                pushed since the last call the current state is returned as is.
 
+        """
         if not self.port_is_open():
             self.logger.error("Serial port is closed.")
             return False
 
+        if mode == "push":
+            if self._push_thread is None:
+                self.start_push_updates()
+
+            state_dict = self._get_pushed_state()
+            if state_dict is None:
+                # nothing new since last time
+                self.state_changes = {}
+                return self.scan_state
+
+            self.scan_state = new_scan_state()
+            return self.merge_scan_state(state_dict)
+
+        # get a copy of the empty state, so scanner refreshes properly.
+        self.scan_state = new_scan_state()
+
         if mode == "pull":
             try:
                 # get xml data from scanner, convert to unicode
@@ -599,15 +879,6 @@ class UnidenScanner:
             except CommandError:
                 self.logger.error("get_scanner_information() failed.")
                 return False
-        # elif mode == "push":
-        #     # separate command response from returned state data
-        #     # first line is response, remaining text is xml formatted state
-        #     try:
-        #         response, state_xml = self.get_serial_buffer().split("\n", 1)
-        #         self.logger.debug(f"Serial port response: {response}")
-        #     except ValueError:
-        #         self.logger.exception("No data in buffer.", exc_info=False)
-        #         return False
         else:
             self.logger.error("For some reason this is neither push nor pull")
             return False
@@ -624,6 +895,19 @@ class UnidenScanner:
             self.logger.error(f"state_dict string: {state_dict}")
             return False
 
+        return self.merge_scan_state(state_dict)
+
+    def merge_scan_state(self, state_dict):
+        """Copy the branches of a parsed scanner response into the scanner
+        state object variable.
+
+        Args:
+            state_dict (dict): parsed GSI/PSI response
+
+        Returns:
+            dict: the updated scanner state
+        """
+
         # save new states to dict
         for key_parent, value_parent in state_dict.items():
             if len(value_parent) == 0:
@@ -639,26 +923,102 @@ class UnidenScanner:
             else:
                 self.scan_state[key_parent] = value_parent
 
+        self._publish_state_changes()
+
         return self.scan_state
 
-    def start_push_updates(self, interval=1000):
-        """Method to set scanner 'push scanner information' (PSI) mode
+    def _publish_state_changes(self):
+        """Compare scan_state with the previous one, store the changed paths in
+        state_changes and call the subscribers whose paths changed."""
+
+        new_paths = state_paths(self.scan_state)
+        self.state_changes = diff_state_paths(self._state_paths, new_paths)
+        self._state_paths = new_paths
+
+        if not self.state_changes:
+            return
+
+        for path, callback in list(self._subscriptions):
+            if path == "":
+                changes = self.state_changes
+            else:
+                changes = {
+                    changed: value
+                    for changed, value in self.state_changes.items()
+                    if changed == path or changed.startswith(path + ".")
+                }
+            if not changes:
+                continue
+
+            try:
+                callback(changes)
+            except Exception:
+                self.logger.exception(f"state change callback for {path} failed.")
+
+    def subscribe(self, path, callback):
+        """Call callback whenever part of the scanner state changes.
+
+        Args:
+            path (str): dotted path, see state_paths(). A branch such as
+                "System" matches every path below it, "" matches everything.
+            callback (callable): called with {dotted path: new value} for the
+                changed paths, from the thread that updates the state
+
+        Returns:
+            tuple: subscription to pass to unsubscribe()
+        """
+        subscription = (path, callback)
+        self._subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription made with subscribe()."""
+
+        try:
+            self._subscriptions.remove(subscription)
+        except ValueError:
+            self.logger.debug(f"{subscription} was not subscribed.")
+
+    def start_push_updates(self, interval=1000, callback=None):
+        """Method to set scanner 'push scanner information' (PSI) mode and
+        start a background thread that reads the pushed states.
 
         Args:
             interval (int): number of milliseconds scanner should wait before
                 pushing data to serial bus.
+            callback (callable): called from the reader thread with each parsed
+                PSI response (dict), and with None when push updates stop
 
         Returns:
             True: when method successfully ends
+            False: if the port is closed
 
+        Notes:
+            - while the reader runs, get_response(), raw() and pipeline() get
+                their responses from it, so other commands keep working
+            - see also update_scanner_state("push") and push_states()
         """
-        # todo: add error checking logic
+        if not self.port_is_open():
+            self.logger.error("Port is closed, cannot start push updates.")
+            return False
+
+        if callback is not None:
+            self._push_callbacks.append(callback)
+
         self.send_command(f"PSI,{interval}")
 
+        if self._push_thread is None:
+            self._push_stop.clear()
+            self._push_thread = threading.Thread(
+                target=self._push_loop, name="PSI reader", daemon=True
+            )
+            self._push_thread.start()
+
         return True
 
     def stop_push_updates(self):
-        """Method turns off scanner push updates.
+        """Method turns off scanner push updates and stops the reader thread.
 
         Returns:
             True: when stop push update command is sent
@@ -669,11 +1029,124 @@ class UnidenScanner:
         if self.port_is_open():
             res = self.send_command("PSI,0")
             self.logger.info(f"PSI,0 response: {res}")
+
+            if self._push_thread is not None:
+                # the reader hands over the PSI,OK acknowledgement
+                self.get_response()
+                self._stop_push_reader()
+
             return True
         else:
             self.logger.debug("Port is closed, cannot send PSI,0 command.")
+            self._stop_push_reader()
             return False
 
+    def push_states(self, timeout=None):
+        """Generator that yields each parsed PSI response as it is pushed.
+
+        Args:
+            timeout (float): stop if nothing is pushed for this many seconds
+
+        Yields:
+            dict: parsed PSI response, see get_response()
+
+        Notes:
+            - ends when push updates are stopped, call start_push_updates()
+                first or it waits for timeout
+        """
+        states = queue.Queue()
+        self._push_callbacks.append(states.put)
+
+        try:
+            while True:
+                try:
+                    state_dict = states.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                if state_dict is None:
+                    return
+                yield state_dict
+        finally:
+            self._push_callbacks.remove(states.put)
+
+    def _push_loop(self):
+        """Push reader thread. Parses every pushed ScannerInfo document as it
+        arrives and passes any other response on to _read_response_frame()."""
+
+        try:
+            # _stop_push_reader() sets _push_stop before the port is closed
+            while not self._push_stop.is_set():
+                try:
+                    res = self._read_port_response()
+                except (serial.SerialException, OSError):
+                    self.logger.error("push reader stopped, port closed.")
+                    break
+
+                if not res:
+                    continue
+
+                if not res.startswith(b"PSI,<XML>,"):
+                    self._push_replies.put(res)
+                    continue
+
+                state_dict = parse_response(res)
+
+                with self._push_cond:
+                    self._push_latest = state_dict
+                    self._push_new = True
+                    self._push_cond.notify_all()
+
+                for callback in list(self._push_callbacks):
+                    try:
+                        callback(state_dict)
+                    except Exception:
+                        self.logger.exception("push update callback failed.")
+        finally:
+            for callback in list(self._push_callbacks):
+                callback(None)
+
+    def _stop_push_reader(self):
+        """Stop the push reader thread, waits for its current read to end
+        (at most the port timeout)."""
+
+        if self._push_thread is None:
+            return
+
+        self._push_stop.set()
+        if self._push_thread is not threading.current_thread():
+            # ends a blocked read right away where pyserial supports it
+            cancel_read = getattr(self.serial, "cancel_read", None)
+            if cancel_read is not None and self.serial.isOpen():
+                cancel_read()
+            self._push_thread.join()
+        self._push_thread = None
+
+        with self._push_cond:
+            self._push_latest = None
+            self._push_new = False
+
+        # the reader may have handed over responses nobody read
+        self._drain_push_replies()
+
+    def _drain_push_replies(self):
+        """Drop the responses the push reader handed over."""
+
+        while not self._push_replies.empty():
+            self._push_replies.get_nowait()
+
+    def _get_pushed_state(self):
+        """Most recent pushed state not yet returned, waits for the first
+        one. None if there is nothing new."""
+
+        with self._push_cond:
+            if self._push_latest is None:
+                self._push_cond.wait(self.serial.timeout)
+            if not self._push_new:
+                return None
+            self._push_new = False
+
+            return self._push_latest
+
     def get_serial_buffer(self):
         """Get serial port buffer. Assume it only works for GSI or PSI right
         now.
@@ -684,7 +1157,7 @@ class UnidenScanner:
             return "Port is closed"
 
         # self.serial is the serial port connection
-        serial_buffer = self.serial.read_until(b"</ScannerInfo>\r").decode()
+        serial_buffer = self._read_frame(b"</ScannerInfo>\r").decode()
 
         serial_buffer = serial_buffer.replace("\r", "\n")
 
@@ -712,7 +1185,7 @@ class UnidenScanner:
     def push_key(self, mode, key):
         """push_key method is used to push keys on the scanner
 
-        Notes: see dicts below
+        Notes: see PUSH_KEY_CODES and PUSH_KEY_MODES in constants
 
             Modes:
              P : press
@@ -720,45 +1193,8 @@ class UnidenScanner:
              H : hold (Press and Hold until Release receive)
              R : release (Cancel Hold state)"""
 
-        keys = {
-            "menu": "M",
-            "func": "F",
-            "avoid": "L",
-            "1": "1",
-            "2": "2",
-            "3": "3",
-            "4": "4",
-            "5": "5",
-            "6": "6",
-            "7": "7",
-            "8": "8",
-            "9": "9",
-            "0": "0",
-            "dot": ".",
-            "no": ".",
-            "pri": ".",
-            "E": "E",
-            "yes": "E",
-            "vright": ">",
-            "vleft": "<",
-            "vpush": "^",
-            "backlight": "V",
-            "sq": "Q",  # acts like 0
-            "replay": "Y",
-            "system": "A",
-            "dept": "B",
-            "chan": "C",
-            "zip": "Z",
-            "srev": "T",  # acts like 0
-            "rang": "R",  # acts like 0
-            "light": "P",
-            "pwr": "P",
-        }
-
-        modes = {"press": "P", "long": "L", "hold": "H", "release": "R"}
-
         try:
-            cmd = ",".join(["KEY", keys[key], modes[mode]])
+            cmd = ",".join(["KEY", PUSH_KEY_CODES[key], PUSH_KEY_MODES[mode]])
         except KeyError:
             self.logger.error("Wrong key %(key)s or mode %(mode)s" % locals())
             return 0
@@ -1373,7 +1809,7 @@ class UnidenScanner:
 
         return 1
 
-    def raw(self, cmd):
+    def raw(self, cmd, framed=True):
         """Accepts scanner commands as UTF-8 strings and handles all the
         encoding and decoding required to communicate with the scanner.
         Scanner response is returned as UTF-8 string.
@@ -1382,6 +1818,8 @@ class UnidenScanner:
             cmd (str): Scanner command as UTF-8 string (see scanner
             documentation). Actual command will be converted to byte string
             before being sent to scanner.
+            framed (bool): return as soon as a complete response has arrived.
+                If False, read until the port times out (the old behavior).
 
         Returns:
             res (str): Scanner response as UTF-8 string.
@@ -1396,12 +1834,40 @@ class UnidenScanner:
             )
             return "Port Closed"
 
-        # todo: update so this isn't blocking
-        # this function blocks for entire duration of timeout
-        # decode byte string to native UTF-8 string
-        res = self.serial.readall().decode()
+        if framed:
+            res = self._read_response_frame()
+        elif self._push_thread is not None:
+            # the push reader owns the port, take what it hands over until it
+            # goes quiet for the port timeout
+            replies = []
+            while True:
+                try:
+                    replies.append(self._push_replies.get(timeout=self.serial.timeout))
+                except queue.Empty:
+                    break
+            res = b"".join(replies)
+        else:
+            # this blocks for entire duration of timeout
+            res = bytes(self._rx_buffer) + self.serial.readall()
+            self._rx_buffer.clear()
+
+        return self._decode_response(res)
+
+    def _decode_response(self, res):
+        """helper method, turns a raw response into the string returned by
+        raw() and pipeline().
+
+        Args:
+            res (bytes): response as read from the port
+
+        Returns:
+            res (str): Scanner response as UTF-8 string.
 
-        res = res.strip("\r")
+        Raises:
+            CommandError: if the scanner replied with an error code
+        """
+        # decode byte string to native UTF-8 string
+        res = res.decode().strip("\r")
 
         # the \r character is causing me problems, so lets replace with \n
         res = res.replace("\r", "\n")
@@ -1420,6 +1886,57 @@ class UnidenScanner:
         else:
             return res
 
+    def pipeline(self, cmds, depth=4):
+        """Sends a series of independent commands, keeping up to depth of
+        them in flight instead of waiting for each reply before sending the
+        next command.
+
+        Only use this for commands that don't depend on each other's replies,
+        e.g. CIN for channel indices that are already known.
+
+        Args:
+            cmds (list): scanner commands as UTF-8 strings
+            depth (int): maximum number of commands waiting for a reply
+
+        Returns:
+            list: responses as UTF-8 strings, in the same order as cmds
+
+        Raises:
+            CommandError: if the port is closed or any command returned an
+                error. All replies are read before raising so the port stays
+                in sync.
+        """
+        cmds = list(cmds)
+        replies = []
+        failed = []
+        sent = 0
+
+        while len(replies) < len(cmds):
+            # top up the commands in flight
+            while sent < len(cmds) and sent - len(replies) < max(depth, 1):
+                self.logger.debug("pipeline(): cmd %s" % cmds[sent])
+                try:
+                    self.serial.write(str.encode("".join([cmds[sent], "\r"])))
+                except serial.serialutil.SerialException:
+                    self.logger.error(
+                        f"{cmds[sent]} cannot be executed by pipeline, "
+                        f"port is not open."
+                    )
+                    raise CommandError
+                sent += 1
+
+            try:
+                replies.append(self._decode_response(self._read_response_frame()))
+            except CommandError:
+                failed.append(cmds[len(replies)])
+                replies.append(None)
+
+        if failed:
+            self.logger.error(f"pipeline(): failed commands {failed}")
+            raise CommandError
+
+        return replies
+
     def get_model(self):
         """Get scanner model information, saving to internal state as well as
         returning the value.
@@ -1716,6 +2233,22 @@ class UnidenScanner:
 
         return 1
 
+    def exit_program_mode(self):
+
+        """The scanner exits from Program Mode.
+        Then the scanner goes to Scan Hold Mode."""
+
+        try:
+            self.raw("EPG")
+
+        except CommandError:
+            self.logger.error("exit_program_mode()")
+            return 0
+
+        self.isProgramMode = False
+
+        return 1
+
     def get_free_memory_blocks(self):
 
         """Returns the number of idle(free) memory block.
@@ -1810,11 +2343,13 @@ class UnidenScanner:
             self.enter_program_mode()
 
         try:
-            sih = self.raw("SIH")
-            sit = self.raw("SIT")
+            sih, sit, res = self.pipeline(["SIH", "SIT", "QSL"])
 
         except CommandError:
-            self.logger.error("get_scan_settings(): failed to get head/tail.")
+            self.logger.error(
+                "get_scan_settings(): failed to get head/tail or quick system "
+                "lockout list."
+            )
             return 0
 
         (sih, self.system_index_head) = sih.split(",")
@@ -1822,21 +2357,17 @@ class UnidenScanner:
 
         sys_index = self.system_index_head
 
+        # systems from a previous read are reused so their groups can
+        # fetch already known channel indices in one pipeline
+        known_systems = self.systems
+        self.systems = {}
+
         while int(sys_index) != -1:
-            s = System(self, sys_index)
+            s = known_systems.get(sys_index) or System(self, sys_index)
             s.get_data()
             self.systems[sys_index] = s
             sys_index = s.fwd_index
 
-        try:
-            res = self.raw("QSL")
-
-        except CommandError:
-            self.logger.error(
-                "get_scan_settings(): failed to get quick system lockout list."
-            )
-            return 0
-
         (qsl, p0, p1, p2, p3, p4, p5, p6, p7, p8, p9) = res.split(",")
 
         l = [
@@ -2073,12 +2604,13 @@ class UnidenMassStorage:
         """This class processes data stored on the scanner SD card.
 
         Args:
-            directory (str): path to SD card root
+            directory (str): path to SD card root, "scanner" looks for the
+                mounted card (see find_scanner_volume())
         """
         self.logger = logging.getLogger("uniden_api.UnidenScanner")
         self.logger.info("Beginning processing SD card data.")
         if directory == "scanner":
-            self.d_root = Path("/Volumes/SDS100")
+            self.d_root = suf.find_scanner_volume() or Path("/Volumes/SDS100")
         else:
             self.d_root = Path(directory)
         self.audio_directories = []
@@ -2093,7 +2625,7 @@ class UnidenMassStorage:
             list: list of audio directories found in user folder
         """
 
-        audio_path = Path("BCDx36HP/audio/user_rec/")
+        audio_path = Path(suf.SCANNER_AUDIO_PATH)
         full_path = Path.joinpath(self.d_root, audio_path)
 
         # todo: need to pass exception if returns None
@@ -2126,15 +2658,101 @@ class UnidenMassStorage:
 
         return self.wav_files
 
-    def get_wav_files_meta(self):
-        """You should have run get_wav_files first."""
+    def get_wav_files_meta(
+        self, workers=None, processes=False, progress=None, index=None
+    ):
+        """You should have run get_wav_files first.
 
-        for wav_file in self.wav_files:
+        Files are read in parallel, see iter_wav_files_meta(). wav_files_meta
+        keeps the order of wav_files.
 
-            wav_file_meta = suf.get_wav_meta(wav_file)
-            self.wav_files_meta.append(wav_file_meta)
+        Args:
+            index (RecordingIndex): only read the files that are new or changed
+                since they were indexed, everything else comes from the index
 
-        return
+        Returns:
+            list: metadata dict (None if unreadable) for each wav file
+        """
+
+        if index is not None:
+            if progress is None:
+                progress = self._log_meta_progress
+            index.update(self.wav_files, workers, processes, progress)
+            self.wav_files_meta.extend(
+                index.get_meta(wav_file) for wav_file in self.wav_files
+            )
+
+            return self.wav_files_meta
+
+        meta = dict(self.iter_wav_files_meta(workers, processes, progress))
+        self.wav_files_meta.extend(meta[wav_file] for wav_file in self.wav_files)
+
+        return self.wav_files_meta
+
+    def iter_wav_files_meta(self, workers=None, processes=False, progress=None):
+        """Stream the metadata of wav_files as each file is read.
+
+        Args:
+            workers (int): number of files read at the same time, defaults to
+                the number of cores
+            processes (bool): use worker processes instead of threads
+            progress (callable): called with (files done, total files)
+
+        Returns:
+            iterator: (wav file, metadata dict or None) in completion order
+        """
+
+        if progress is None:
+            progress = self._log_meta_progress
+
+        return suf.iter_wav_meta(self.wav_files, workers, processes, progress)
+
+    def _log_meta_progress(self, done, total):
+        if done == total or done % 500 == 0:
+            self.logger.info(f"read metadata of {done}/{total} wav files")
+
+    def transcode_wav_files(self, output_dir, fmt="opus", workers=None):
+        """Compress wav_files into output_dir, see transcode.transcode_recordings().
+
+        Recordings whose compressed version is up to date are skipped.
+
+        Args:
+            output_dir (str or Path): directory for the compressed files
+            fmt (str): "opus" or "mp3"
+            workers (int): ffmpeg processes at a time
+
+        Returns:
+            dict: {wav file: compressed file}
+        """
+
+        return transcode.transcode_recordings(
+            self.wav_files, output_dir, fmt, workers, self._log_transcode_progress
+        )
+
+    def _log_transcode_progress(self, done, total):
+        if done == total or done % 100 == 0:
+            self.logger.info(f"encoded {done}/{total} wav files")
+
+    def sync_to(self, archive_dir, index=None, workers=2):
+        """Copy the new and changed recordings into a local archive, see
+        sd_sync.sync_recordings().
+
+        Args:
+            archive_dir (str or Path): local archive directory
+            index (RecordingIndex): updated with the copies
+            workers (int): files copied at the same time
+
+        Returns:
+            dict: number of files copied, unchanged, ...
+        """
+
+        return sd_sync.sync_recordings(
+            self.d_root, archive_dir, index, workers, self._log_sync_progress
+        )
+
+    def _log_sync_progress(self, done, total):
+        if done == total or done % 100 == 0:
+            self.logger.info(f"copied {done}/{total} wav files")
 
 
 class UnidenLocalDatabase:
@@ -2145,14 +2763,22 @@ class UnidenLocalDatabase:
             and related file stored by the Uniden PC app.
     """
 
-    def __init__(self, db_path="uniden.sqlite"):
+    def __init__(self, db_path="uniden.sqlite", unit_id_cache_size=1024):
         """Establish connection to DB
 
         Args:
             db_path (str): relative path to sqlite database
+            unit_id_cache_size (int): number of unit id names kept in memory,
+                0 turns the cache off
         """
         self.conn = sqlite3.connect(db_path)
 
+        # unit id -> name, least recently used first
+        self._unit_id_cache = OrderedDict()
+        self.unit_id_cache_size = unit_id_cache_size
+        self.unit_id_cache_hits = 0
+        self.unit_id_cache_misses = 0
+
     def get_unit_id_name(self, unit_id):
         """Method for looking up unit id name, given a unit id number if it exists.
 
@@ -2163,7 +2789,30 @@ class UnidenLocalDatabase:
             result (str): current name assigned to unit id number or empty string if
                 no name has been assigned
             result (str): "-" if no unit id number has been recorded
+
+        Notes:
+            - names (and "-") are cached, call clear_unit_id_cache() if another
+                connection changed the UnitID table.
         """
+        key = str(unit_id)
+
+        try:
+            result = self._unit_id_cache[key]
+        except KeyError:
+            self.unit_id_cache_misses += 1
+        else:
+            self.unit_id_cache_hits += 1
+            self._unit_id_cache.move_to_end(key)
+            return result
+
+        result = self._select_unit_id_name(key)
+        self._cache_unit_id_name(key, result)
+
+        return result
+
+    def _select_unit_id_name(self, unit_id):
+        """Look up the unit id name in the database, see get_unit_id_name()."""
+
         # create cursor instance for passing messages to DB
         cur = self.conn.cursor()
 
@@ -2193,7 +2842,8 @@ class UnidenLocalDatabase:
         """
         cur = self.conn.cursor()
 
-        if self.get_unit_id_name(unit_id=unit_id) == "-":
+        # ask the database, not the cache, whether the unit id is already stored
+        if self._select_unit_id_name(unit_id) == "-":
             cur.execute(
                 'INSERT INTO UnitID (U_id, "Name") VALUES (?, ?)',
                 (str(unit_id), unit_id_name),
@@ -2205,8 +2855,121 @@ class UnidenLocalDatabase:
 
         self.conn.commit()
 
+        # keep the cache in step with the database
+        self._cache_unit_id_name(str(unit_id), unit_id_name)
+
         return True
 
+    def import_unit_id_names(self, aliases):
+        """Store many unit id names at once, in a single transaction.
+
+        Args:
+            aliases (iterable or str): (unit id, name) pairs, or path to a
+                .csv or .json alias file (see uniden_db.read_unit_id_aliases)
+
+        Returns:
+            int: number of aliases stored
+        """
+
+        if isinstance(aliases, (str, Path)):
+            aliases = udb.read_unit_id_aliases(aliases)
+
+        count = udb.upsert_unit_id_names(self.conn, aliases)
+        self.clear_unit_id_cache()
+
+        return count
+
+    def export_unit_id_names(self, path=None):
+        """Stream all unit id names, or write them to a .csv or .json file.
+
+        Args:
+            path (str): alias file to write, optional
+
+        Returns:
+            iterator: (unit id, name) pairs if no path is given
+            int: number of aliases written to path
+        """
+
+        aliases = udb.iter_unit_id_names(self.conn)
+        if path is None:
+            return aliases
+
+        return udb.write_unit_id_aliases(path, aliases)
+
+    def _cache_unit_id_name(self, unit_id, unit_id_name):
+        """Store a name in the unit id cache, dropping the least recently used
+        entry when the cache is full."""
+
+        if self.unit_id_cache_size <= 0:
+            return
+
+        self._unit_id_cache[unit_id] = unit_id_name
+        self._unit_id_cache.move_to_end(unit_id)
+
+        while len(self._unit_id_cache) > self.unit_id_cache_size:
+            self._unit_id_cache.popitem(last=False)
+
+    def clear_unit_id_cache(self):
+        """Forget all cached unit id names."""
+
+        self._unit_id_cache.clear()
+
+    def unit_id_cache_info(self):
+        """Unit id cache statistics.
+
+        Returns:
+            dict: hits, misses, size and max_size of the cache
+        """
+
+        return {
+            "hits": self.unit_id_cache_hits,
+            "misses": self.unit_id_cache_misses,
+            "size": len(self._unit_id_cache),
+            "max_size": self.unit_id_cache_size,
+        }
+
+    def create_indexes(self):
+        """Create the scan_hits indexes used by the query methods, only needed
+        for databases that no ScanStateRecorder has written to yet."""
+
+        udb.create_hit_indexes(self.conn)
+        self.conn.commit()
+
+    def iter_hits(self, start=None, end=None, columns=None, **filters):
+        """Iterate over recorded hits, e.g. all hits for a TGID in the last day:
+
+            db.iter_hits(start=datetime.now() - timedelta(days=1), tgid="TGID:12501")
+
+        Args:
+            start (datetime or str): first date_code to include
+            end (datetime or str): first date_code to leave out
+            columns (list): scan_hits columns to return, defaults to all
+            **filters: tgid, unit_id, system or department value to match
+
+        Returns:
+            iterator: dict per hit, oldest first
+        """
+
+        return udb.iter_hits(self.conn, start, end, columns, **filters)
+
+    def busiest_talkgroups(self, start=None, end=None, limit=10, per_hour=True):
+        """TGIDs with the most hits, per hour by default.
+
+        Returns:
+            iterator: dicts with "hour", "tgid", "name" and "hits"
+        """
+
+        return udb.iter_top_hits(self.conn, "tgid", start, end, limit, per_hour)
+
+    def most_active_unit_ids(self, start=None, end=None, limit=10, per_hour=False):
+        """Unit IDs with the most hits.
+
+        Returns:
+            iterator: dicts with "unit_id", "name" and "hits"
+        """
+
+        return udb.iter_top_hits(self.conn, "unit_id", start, end, limit, per_hour)
+
     # def pass_sql_to_db(self, sql_message):
     #     """Method handles communication with database.
     #
@@ -2725,9 +3488,10 @@ class System:
         2 Off (Displayed as “*” on the scanner.)"""
 
         cmd = ",".join(["SIN", self.sys_index])
+        qgl_cmd = ",".join(["QGL", self.sys_index])
 
         try:
-            res = self.scanner.raw(cmd)
+            res, qgl_res = self.scanner.pipeline([cmd, qgl_cmd])
 
         except CommandError:
             self.logger.error("get_data(): cmd %s" % cmd)
@@ -2767,10 +3531,17 @@ class System:
 
         grp_index = self.chn_grp_head
 
+        # groups from a previous read keep their known channel indices
+        known_groups = self.groups
+        self.groups = {}
+        self.sites = {}
+
         while int(grp_index) != -1:
 
             if self.sys_type == "CNV":
-                g = Group(self.scanner, grp_index, self.sys_type)
+                g = known_groups.get(grp_index) or Group(
+                    self.scanner, grp_index, self.sys_type
+                )
                 g.get_data()
                 self.groups[grp_index] = g
                 grp_index = g.fwd_index
@@ -2827,21 +3598,14 @@ class System:
             tgid_grp_index = self.tgid_grp_head
 
             while int(tgid_grp_index) != -1:
-                g = Group(self.scanner, tgid_grp_index, self.sys_type)
+                g = known_groups.get(tgid_grp_index) or Group(
+                    self.scanner, tgid_grp_index, self.sys_type
+                )
                 g.get_data()
                 self.groups[tgid_grp_index] = g
                 tgid_grp_index = g.fwd_index
 
-        cmd = ",".join(["QGL", self.sys_index])
-
-        try:
-            res = self.scanner.raw(cmd)
-
-        except CommandError:
-            self.logger.error("get_data(): cmd %s" % cmd)
-            return 0
-
-        (qgl, s) = res.split(",")
+        (qgl, s) = qgl_res.split(",")
         self.quick_lockout = zero_to_head(tuple(s))
 
         self.get_lockout_tgids()
@@ -3279,41 +4043,39 @@ class System:
 
     def get_lockout_tgids(self):
 
-        """Returns tuple of locked out TGIDs and SRCH TGIDs."""
-
-        cmd = ",".join(["GLI", self.sys_index])
+        """Returns tuple of locked out TGIDs and SRCH TGIDs.
 
-        tgid = 0
-        l = []
-
-        try:
-            while int(tgid) != -1:
-                res = self.scanner.raw(cmd)
-                (gli, tgid) = res.split(",")
-                l.append(tgid)
-
-        except CommandError:
-            self.logger.error("get_lockout_tgids(): cmd %s" % cmd)
-            return 0
+        GLI and SLI each step through their own list on the scanner, so one
+        of each is sent together until both lists reach -1. Neither is sent
+        again after its list ends, which would restart it.
+        """
 
-        self.lout_tgids = tuple(l)
+        lists = {"GLI": [], "SLI": []}
+        tgids = {"GLI": 0, "SLI": 0}
 
-        cmd = ",".join(["SLI", self.sys_index])
+        while True:
+            cmds = [
+                ",".join([name, self.sys_index])
+                for name, tgid in tgids.items()
+                if int(tgid) != -1
+            ]
+            if not cmds:
+                break
 
-        tgid = 0
-        l = []
+            try:
+                replies = self.scanner.pipeline(cmds)
 
-        try:
-            while int(tgid) != -1:
-                res = self.scanner.raw(cmd)
-                (sli, tgid) = res.split(",")
-                l.append(tgid)
+            except CommandError:
+                self.logger.error("get_lockout_tgids(): cmd %s" % cmds)
+                return 0
 
-        except CommandError:
-            self.logger.error("get_lockout_tgids(): cmd %s" % cmd)
-            return 0
+            for res in replies:
+                (name, tgid) = res.split(",")
+                tgids[name] = tgid
+                lists[name].append(tgid)
 
-        self.srch_lout_tgids = tuple(l)
+        self.lout_tgids = tuple(lists["GLI"])
+        self.srch_lout_tgids = tuple(lists["SLI"])
 
         return 1
 
@@ -3435,6 +4197,33 @@ class Group:
 
         chn_index = self.chn_head
 
+        if self.sys_type == "CNV":
+            members, member_class, member_cmd = self.channels, Channel, "CIN"
+        else:
+            members, member_class, member_cmd = self.tgids, TalkGroupID, "TIN"
+
+        # indices known from a previous read are fetched in one pipeline. The
+        # walk below carries on from wherever the linked list has changed.
+        known = list(members)
+        members.clear()
+
+        if known and known[0] == chn_index:
+            try:
+                replies = self.scanner.pipeline(
+                    [",".join([member_cmd, index]) for index in known]
+                )
+            except CommandError:
+                self.logger.error("get_data(): pipelined %s failed" % member_cmd)
+                replies = []
+
+            for index, res in zip(known, replies):
+                if index != chn_index or int(chn_index) == -1:
+                    break
+                m = member_class(self.scanner, index)
+                m.get_data(res)
+                members[index] = m
+                chn_index = m.fwd_index
+
         while int(chn_index) != -1:
 
             if self.sys_type == "CNV":
@@ -3750,9 +4539,11 @@ class Site:
         P25WAITING		P25 Waiting time (0,100,200,300, .... , 900,1000)"""
 
         cmd = ",".join(["SIF", self.sit_index])
+        mcp_cmd = ",".join(["MCP", self.sit_index])
+        abp_cmd = ",".join(["ABP", self.sit_index])
 
         try:
-            res = self.scanner.raw(cmd)
+            res, mcp_res, abp_res = self.scanner.pipeline([cmd, mcp_cmd, abp_cmd])
 
         except CommandError:
             self.logger.error("get_data(): %s" % cmd)
@@ -3796,15 +4587,6 @@ class Site:
             self.trunk_frqs[chn_index] = t
             chn_index = t.fwd_index
 
-        cmd = ",".join(["MCP", self.sit_index])
-
-        try:
-            res = self.scanner.raw(cmd)
-
-        except CommandError:
-            self.logger.error("get_data(): %s" % cmd)
-            return 0
-
         (
             mcp,
             lower1,
@@ -3831,7 +4613,7 @@ class Site:
             upper6,
             step6,
             offset6,
-        ) = res.split(",")
+        ) = mcp_res.split(",")
 
         self.motorola_custom_band_plan = {
             "lower": (0, lower1, lower2, lower3, lower4, lower5, lower6),
@@ -3840,15 +4622,6 @@ class Site:
             "offset": (0, offset1, offset2, offset3, offset4, offset5, offset6),
         }
 
-        cmd = ",".join(["ABP", self.sit_index])
-
-        try:
-            res = self.scanner.raw(cmd)
-
-        except CommandError:
-            self.logger.error("get_data(): %s" % cmd)
-            return 0
-
         (
             abp,
             bf_0,
@@ -3883,7 +4656,7 @@ class Site:
             sf_E,
             bf_F,
             sf_F,
-        ) = res.split(",")
+        ) = abp_res.split(",")
 
         self.p25_band_plan = {
             "base_freq": [
@@ -4188,7 +4961,7 @@ class Channel:
         self.alt_pattern = "0"
         self.vol_offset = "0"
 
-    def get_data(self):
+    def get_data(self, res=None):
 
         """Get Channel Information.
         In set command, only "," parameters are not changed.
@@ -4218,12 +4991,17 @@ class Channel:
         NUMBER_TAG 		Number tag (0-999 / NONE)
         ALT_COLOR 		Alert Light color (OFF,BLUE,RED,MAGENTA,GREEN,CYAN,YELLOW,WHITE)
         ALT_PATTERN		Alert Light Pattern(0:ON / 1:SLow / 2:Fast)
-        VOL_OFFSET		Volume Offset (-3 - +3)"""
+        VOL_OFFSET		Volume Offset (-3 - +3)
+
+        Args:
+            res (str): CIN response that was already read, e.g. by
+                UnidenScanner.pipeline(). Fetched from the scanner if None."""
 
         cmd = ",".join(["CIN", self.chn_index])
 
         try:
-            res = self.scanner.raw(cmd)
+            if res is None:
+                res = self.scanner.raw(cmd)
 
         except CommandError:
             self.logger.error("get_data(): %s" % cmd)
@@ -4600,7 +5378,7 @@ class TalkGroupID:
         self.alt_pattern = "0"
         self.vol_offset = "0"
 
-    def get_data(self):
+    def get_data(self, res=None):
 
         """Get TGID Information
         In set command, only "," parameters are not changed.
@@ -4624,12 +5402,17 @@ class TalkGroupID:
         NUMBER_TAG 	Number tag (0-999 / NONE)
         ALT_COLOR 	Alert Light color (OFF,BLUE,RED,MAGENTA,GREEN,CYAN,YELLOW,WHITE)
         ALT_PATTERN	Alert Light Pattern(0:ON / 1:SLow / 2:Fast)
-        VOL_OFFSET	Volume Offset (-3 - +3)"""
+        VOL_OFFSET	Volume Offset (-3 - +3)
+
+        Args:
+            res (str): TIN response that was already read, e.g. by
+                UnidenScanner.pipeline(). Fetched from the scanner if None."""
 
         cmd = ",".join(["TIN", self.chn_index])
 
         try:
-            res = self.scanner.raw(cmd)
+            if res is None:
+                res = self.scanner.raw(cmd)
 
         except CommandError:
             self.logger.error("get_data(): %s" % cmd)
@@ -6064,6 +6847,10 @@ def save_state_to_db(formatted_state, db_path="uniden.sqlite"):
         formatted_state (OrderedDict): scanner state that matches the field
             order and naming strategy used in database.
         db_path (str): path to SQLite database
+
+    Notes:
+        - opens a connection per call, use uniden_db.ScanStateRecorder to log
+            a stream of states.
     """
     logger = logging.getLogger("uniden_api.save_state_to_db")
 
@@ -6078,93 +6865,13 @@ def save_state_to_db(formatted_state, db_path="uniden.sqlite"):
         logger.debug(f"No overwrite text.\n{e}")
 
     conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
 
-    date_code = formatted_state.pop("date_code")
-
-    # scanner data in same order as database fields
-    field_data = list(formatted_state.values())
-
-    # add the date_code back to end of list so it matches SQL statement order
-    field_data.append(date_code)
+    # scanner data in same order as database fields, written as one complete row
+    field_data = scan_state_to_row(formatted_state)
     logger.debug(f"The field data length is: {len(field_data)}")
 
     try:
-        cur.execute('INSERT INTO scan_hits ("date_code") VALUES (?)', (date_code,))
-        conn.commit()
-    except sqlite3.OperationalError as err:
-        print("some database thing went wrong")
-        print(err)
-
-    try:
-        # fmt: off
-        cur.execute("""
-            UPDATE scan_hits
-            SET
-                "ScannerInfo:Mode" = ?,
-                "ScannerInfo:V_Screen" = ?,
-                "MonitorList:Name" = ?,
-                "MonitorList:Index" = ?,
-                "MonitorList:ListType" = ?,
-                "MonitorList:Q_Key" = ?,
-                "MonitorList:N_Tag" = ?,
-                "MonitorList:DB_Counter" = ?,
-                "System:Name" = ?,
-                "System:Index" = ?,
-                "System:Avoid" = ?,
-                "System:SystemType" = ?,
-                "System:Q_Key" = ?,
-                "System:N_Tag" = ?,
-                "System:Hold" = ?,
-                "Department:Name" = ?,
-                "Department:Index" = ?,
-                "Department:Avoid" = ?,
-                "Department:Q_Key" = ?,
-                "Department:Hold" = ?,
-                "TGID:Name" = ?,
-                "TGID:Index" = ?,
-                "TGID:Avoid" = ?,
-                "TGID:TGID" = ?,
-                "TGID:SetSlot" = ?,
-                "TGID:RecSlot" = ?,
-                "TGID:N_Tag" = ?,
-                "TGID:Hold" = ?,
-                "TGID:SvcType" = ?,
-                "TGID:P_Ch" = ?,
-                "TGID:LVL" = ?,
-                "UnitID:Name" = ?,
-                "UnitID:U_Id" = ?,
-                "Site:Name" = ?,
-                "Site:Index" = ?,
-                "Site:Avoid" = ?,
-                "Site:Q_Key" = ?,
-                "Site:Hold" = ?,
-                "Site:Mod" = ?,
-                "SiteFrequency:Freq" = ?,
-                "SiteFrequency:IFX" = ?,
-                "SiteFrequency:SAS" = ?,
-                "SiteFrequency:SAD" = ?,
-                "DualWatch:PRI" = ?,
-                "DualWatch:CC" = ?,
-                "DualWatch:WX" = ?,
-                "Property:F" = ?,
-                "Property:VOL" = ?,
-                "Property:SQL" = ?,
-                "Property:Sig" = ?,
-                "Property:Att" = ?,
-                "Property:Rec" = ?,
-                "Property:KeyLock" = ?,
-                "Property:P25Status" = ?,
-                "Property:Mute" = ?,
-                "Property:Backlight" = ?,
-                "Property:A_Led" = ?,
-                "Property:Dir" = ?,
-                "Property:Rssi" = ?,
-                "ViewDescription:" = ?
-            WHERE
-                date_code = ?;
-        """, field_data)
-        # fmt: on
+        conn.execute(SCAN_HITS_INSERT, field_data)
     except sqlite3.OperationalError as err:
         print("some database thing went wrong")
         print(err)
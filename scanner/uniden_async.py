@@ -0,0 +1,390 @@
+"""asyncio client for Uniden scanners.
+
+AsyncUnidenScanner talks to the scanner without blocking the event loop, so
+the GUI, a PSI listener and a database writer can share one serial port. A
+single reader task frames everything the scanner sends and hands each reply to
+the coroutine waiting for it, in the order the commands were sent. Anything
+nobody asked for (e.g. PSI pushes) goes to the `unsolicited` queue.
+
+Example:
+    async with AsyncUnidenScanner() as s:
+        model, state = await asyncio.gather(
+            s.command("MDL"), s.update_scanner_state()
+        )
+
+Notes:
+    - uses pyserial-asyncio if it is installed. When a port instance is passed
+        in (e.g. simulator.SimulatedSerial), or pyserial-asyncio is missing,
+        blocking reads run in the default executor instead.
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+import serial
+import serial.tools.list_ports as stlp
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+from scanner.constants import *
+from scanner.uniden import (
+    CommandError,
+    UnidenScanner,
+    new_scan_state,
+    parse_response,
+    response_length,
+)
+
+
+class AsyncUnidenScanner:
+    """asyncio version of the UnidenScanner connection and state methods."""
+
+    err_list = UnidenScanner.err_list
+
+    # only use self.scan_state, self.logger and the state change attributes
+    merge_scan_state = UnidenScanner.merge_scan_state
+    _publish_state_changes = UnidenScanner._publish_state_changes
+    subscribe = UnidenScanner.subscribe
+    unsubscribe = UnidenScanner.unsubscribe
+
+    def __init__(self, model="SDS100", speed="115200", serial_port=None, timeout=3.1):
+        """Initialization, call open() (or use async with) to connect.
+
+        Args:
+            model (str): Model name of scanner used to find the port.
+            speed (int): Port connection speed.
+            serial_port (serial.Serial): optional already opened serial port (or
+                a stand-in such as simulator.SimulatedSerial)
+            timeout (float): seconds to wait for a reply
+        """
+
+        self.logger = logging.getLogger("uniden_api.AsyncUnidenScanner")
+
+        self.serial_port = serial_port
+        self.port = ""
+        self.speed = speed
+        self.model = model
+        self.timeout = timeout
+        self.scan_state = new_scan_state()
+
+        # state change tracking, see subscribe()
+        self.state_changes = {}
+        self._state_paths = {}
+        self._subscriptions = []
+
+        # complete responses that no command was waiting for
+        self.unsolicited = asyncio.Queue()
+
+        self._stream_reader = None
+        self._stream_writer = None
+        self._reader_task = None
+        self._rx_buffer = bytearray()
+        # (command name, future) for each command still waiting for a reply
+        self._waiting = deque()
+        # futures handed out by send_command(), collected by get_response()
+        self._responses = deque()
+
+    async def __aenter__(self):
+        if not await self.open():
+            raise CommandError("no scanner port")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """Open the port and start the reader task.
+
+        Returns:
+            False: if no scanner is found or the port can't be opened
+        """
+
+        if self.serial_port is not None:
+            self.port = getattr(self.serial_port, "port", "")
+            if not self.serial_port.isOpen():
+                self.serial_port.open()
+            self.logger.info(f"using supplied serial port: {self.port}")
+        else:
+            if serial_asyncio is None:
+                self.logger.error(
+                    "pyserial-asyncio is not installed, pass in serial_port instead."
+                )
+                return False
+
+            # check currently available ports for our model
+            for port in stlp.comports():
+                if port.description.find(self.model) != -1:
+                    self.port = port.device
+                    self.logger.info(f"the {self.model} port is: {self.port}")
+                    break
+
+            if self.port == "":
+                self.logger.error("No scanner port found, port was NOT opened.")
+                return False
+
+            try:
+                (
+                    self._stream_reader,
+                    self._stream_writer,
+                ) = await serial_asyncio.open_serial_connection(
+                    url=self.port, baudrate=int(self.speed)
+                )
+            except serial.SerialException:
+                self.logger.error("Error opening serial port %s!" % self.port)
+                return False
+
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+        return True
+
+    async def close(self):
+        """Stop the reader task and close the port."""
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+        if self._stream_writer is not None:
+            self._stream_writer.close()
+            self._stream_writer = None
+        elif self.serial_port is not None and self.serial_port.isOpen():
+            self.serial_port.close()
+
+        self._fail_waiting()
+
+    def port_is_open(self):
+        """Returns True if the reader task is running."""
+
+        return self._reader_task is not None and not self._reader_task.done()
+
+    # ---- reader task ---- #
+
+    async def _read_chunk(self):
+        """Next chunk of bytes from the port, may be empty."""
+
+        if self._stream_reader is not None:
+            return await self._stream_reader.read(4096)
+
+        port = self.serial_port
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: port.read(port.in_waiting or 1)
+        )
+
+    async def _read_loop(self):
+        """Reader task, frames responses and routes them to whoever is
+        waiting for them."""
+
+        try:
+            while True:
+                try:
+                    chunk = await self._read_chunk()
+                except (serial.SerialException, OSError):
+                    self.logger.error("port closed, reader stopped.")
+                    break
+
+                if not chunk:
+                    # a stream reader keeps returning b"" once the port is gone
+                    if self._stream_reader is not None and self._stream_reader.at_eof():
+                        self.logger.error("port closed, reader stopped.")
+                        break
+                    continue
+
+                self._rx_buffer.extend(chunk)
+
+                while True:
+                    length = response_length(self._rx_buffer)
+                    if length is None:
+                        break
+                    res = bytes(self._rx_buffer[:length])
+                    del self._rx_buffer[:length]
+                    self._route(res)
+        finally:
+            self._fail_waiting()
+
+    def _route(self, res):
+        """Hand a complete response to the oldest waiting command if it is the
+        reply to that command, otherwise queue it as unsolicited."""
+
+        name = res.split(b"\r", 1)[0].split(b",", 1)[0].decode()
+
+        if self._waiting:
+            cmd_name, future = self._waiting[0]
+            if name == cmd_name or name in self.err_list:
+                self._waiting.popleft()
+                # the caller may have given up waiting
+                if not future.done():
+                    future.set_result(res)
+                return
+
+        self.logger.debug(f"unsolicited response: {name}")
+        self.unsolicited.put_nowait(res)
+
+    def _fail_waiting(self):
+        """Fail every command still waiting, the port is gone."""
+
+        while self._waiting:
+            cmd_name, future = self._waiting.popleft()
+            if not future.done():
+                future.set_exception(CommandError(f"{cmd_name}: port closed"))
+
+    # ---- commands ---- #
+
+    def _write(self, cmd):
+        """Write cmd and return the future its reply will be delivered to.
+
+        Nothing is awaited between queueing the future and writing, so replies
+        are always matched to commands in the order they were sent.
+        """
+
+        # allow user to input lowercase commands
+        cmd = cmd.upper()
+        if not self.port_is_open():
+            raise CommandError(f"{cmd} not executed, port was not open.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((cmd.split(",", 1)[0], future))
+
+        cmd_str = str.encode("".join([cmd, "\r"]))
+        try:
+            if self._stream_writer is not None:
+                self._stream_writer.write(cmd_str)
+            else:
+                self.serial_port.write(cmd_str)
+        except serial.SerialException:
+            self._waiting.pop()
+            raise CommandError(f"{cmd} not executed, port was not open.")
+
+        return future
+
+    async def _wait_for(self, future, cmd=""):
+        """Wait for a reply and parse it, None if it didn't arrive in time."""
+
+        try:
+            res = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(f"no response to {cmd} in {self.timeout} s.")
+            # otherwise the next reply with this name would be routed to it
+            for entry in self._waiting:
+                if entry[1] is future:
+                    self._waiting.remove(entry)
+                    break
+            return None
+
+        return parse_response(res)
+
+    async def send_command(self, cmd):
+        """Send a command, collect the reply with get_response().
+
+        Args:
+            cmd (str): 3 letter uniden command string
+
+        Returns:
+            write_ack (int): number of bytes written, "Port Closed" on error
+        """
+        self.logger.debug(f"Command sent: {cmd}")
+
+        try:
+            self._responses.append(self._write(cmd))
+        except CommandError:
+            self.logger.error(f"{cmd} not executed, port was not open.")
+            return "Port Closed"
+
+        if self._stream_writer is not None:
+            await self._stream_writer.drain()
+
+        return len(cmd) + 1
+
+    async def get_response(self):
+        """Reply to the oldest send_command() whose reply hasn't been
+        collected yet. Use command() when several tasks share the scanner.
+
+        Returns:
+            err_res (str): if scanner throws an error
+            xml_dict (dict): if scanner responds with xml data
+            res_dict (dict): dict of simple response if no xml data provided by scanner
+            None: if nothing was sent or no reply arrived in time
+        """
+
+        if not self._responses:
+            self.logger.error("get_response() called without send_command().")
+            return None
+
+        return await self._wait_for(self._responses.popleft())
+
+    async def command(self, cmd):
+        """Send a command and wait for its reply, safe to call from several
+        tasks at once.
+
+        Returns:
+            see get_response()
+        """
+
+        try:
+            future = self._write(cmd)
+        except CommandError:
+            self.logger.error(f"{cmd} not executed, port was not open.")
+            return None
+
+        if self._stream_writer is not None:
+            await self._stream_writer.drain()
+
+        return await self._wait_for(future, cmd)
+
+    async def update_scanner_state(self, mode="pull"):
+        """Gets scanner status with a GSI command and updates the scanner
+        state object variable.
+
+        Args:
+            mode (str): only "pull" is supported
+
+        Returns:
+            fresh_state: passes the updated scanner state dict
+            False: if there is an error communicating with scanner
+        """
+
+        if mode != "pull":
+            self.logger.error(f"update_scanner_state(): unsupported mode {mode}")
+            return False
+
+        state_dict = await self.command("GSI")
+
+        if state_dict is None or isinstance(state_dict, str):
+            self.logger.error(f"state_dict: {state_dict}")
+            return False
+
+        # get a copy of the empty state, so scanner refreshes properly.
+        self.scan_state = new_scan_state()
+
+        return self.merge_scan_state(state_dict)
+
+    async def push_key(self, mode, key):
+        """push_key method is used to push keys on the scanner
+
+        Notes: see PUSH_KEY_CODES and PUSH_KEY_MODES in constants
+
+        Returns:
+            res: parsed KEY response, 0 on error
+        """
+
+        try:
+            cmd = ",".join(["KEY", PUSH_KEY_CODES[key], PUSH_KEY_MODES[mode]])
+        except KeyError:
+            self.logger.error("Wrong key %(key)s or mode %(mode)s" % locals())
+            return 0
+
+        res = await self.command(cmd)
+        self.logger.debug(f"button response: {res}")
+
+        if res is None:
+            self.logger.error("push_key(): %s" % cmd)
+            return 0
+
+        return res
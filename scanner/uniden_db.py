@@ -0,0 +1,974 @@
+"""Recording scanner states to the local SQLite database.
+
+ScanStateRecorder keeps one connection open in a writer thread and stores
+every state it is handed as one complete scan_hits row. Rows are written with
+executemany() in batches, one transaction per batch, and the database runs in
+WAL mode, so logging every PSI update from several scanners doesn't turn into
+a commit (and fsync) per poll.
+
+In normalized storage the names (system, department, TGID, ...) are stored
+once in lookup tables and each hit only keeps their ids, plus an id for the
+combination of settings columns that rarely change. scan_hits becomes a view
+with the original columns that also accepts inserts, so readers and writers
+of the wide table keep working.
+
+Example:
+    recorder = ScanStateRecorder("databases/uniden.sqlite")
+    recorder.watch(scanner)  # every state change becomes a row
+    ...
+    recorder.close()
+
+Usage:
+    Convert an existing database to normalized storage::
+
+        python -m scanner.uniden_db migrate databases/uniden.sqlite
+
+    Load or save unit id names in bulk (.csv or .json)::
+
+        python -m scanner.uniden_db import-aliases databases/uniden.sqlite ids.csv
+        python -m scanner.uniden_db export-aliases databases/uniden.sqlite ids.json
+"""
+
+import argparse
+import csv
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# scan_hits columns, in table order
+SCAN_HITS_FIELDS = (
+    "date_code",
+    "ScannerInfo:Mode",
+    "ScannerInfo:V_Screen",
+    "MonitorList:Name",
+    "MonitorList:Index",
+    "MonitorList:ListType",
+    "MonitorList:Q_Key",
+    "MonitorList:N_Tag",
+    "MonitorList:DB_Counter",
+    "System:Name",
+    "System:Index",
+    "System:Avoid",
+    "System:SystemType",
+    "System:Q_Key",
+    "System:N_Tag",
+    "System:Hold",
+    "Department:Name",
+    "Department:Index",
+    "Department:Avoid",
+    "Department:Q_Key",
+    "Department:Hold",
+    "TGID:Name",
+    "TGID:Index",
+    "TGID:Avoid",
+    "TGID:TGID",
+    "TGID:SetSlot",
+    "TGID:RecSlot",
+    "TGID:N_Tag",
+    "TGID:Hold",
+    "TGID:SvcType",
+    "TGID:P_Ch",
+    "TGID:LVL",
+    "UnitID:Name",
+    "UnitID:U_Id",
+    "Site:Name",
+    "Site:Index",
+    "Site:Avoid",
+    "Site:Q_Key",
+    "Site:Hold",
+    "Site:Mod",
+    "SiteFrequency:Freq",
+    "SiteFrequency:IFX",
+    "SiteFrequency:SAS",
+    "SiteFrequency:SAD",
+    "DualWatch:PRI",
+    "DualWatch:CC",
+    "DualWatch:WX",
+    "Property:F",
+    "Property:VOL",
+    "Property:SQL",
+    "Property:Sig",
+    "Property:Att",
+    "Property:Rec",
+    "Property:KeyLock",
+    "Property:P25Status",
+    "Property:Mute",
+    "Property:Backlight",
+    "Property:A_Led",
+    "Property:Dir",
+    "Property:Rssi",
+    "ViewDescription:",
+)
+
+_columns = ", ".join(f'"{field}"' for field in SCAN_HITS_FIELDS)
+
+SCAN_HITS_CREATE = (
+    "CREATE TABLE IF NOT EXISTS scan_hits ("
+    + '"date_code" TEXT NOT NULL UNIQUE, '
+    + ", ".join(f'"{field}" TEXT' for field in SCAN_HITS_FIELDS[1:])
+    + ', PRIMARY KEY("date_code"))'
+)
+
+# a state with a date_code that is already stored is skipped, not an error
+SCAN_HITS_INSERT = (
+    f"INSERT OR IGNORE INTO scan_hits ({_columns}) "
+    f"VALUES ({', '.join('?' * len(SCAN_HITS_FIELDS))})"
+)
+
+
+# ---- normalized storage ---- #
+
+# scan_hits columns stored as ids into a lookup table instead of text
+# {scan_hits column: (lookup table, lookup column, hits column)}
+INTERNED_FIELDS = {
+    "ScannerInfo:Mode": ("Mode", "Attribute Name", "mode_id"),
+    "ScannerInfo:V_Screen": ("V_Screen", "Attribute Name", "v_screen_id"),
+    "MonitorList:Name": ("MonitorList", "Name", "monitor_list_id"),
+    "System:Name": ("System", "Name", "system_id"),
+    "Department:Name": ("Department", "Name", "department_id"),
+    "TGID:Name": ("TGID", "Name", "tgid_id"),
+    "UnitID:U_Id": ("HitUnitID", "U_Id", "unit_id"),
+    "Site:Name": ("Site", "Name", "site_id"),
+    "ViewDescription:": ("ViewDescription", "Text", "view_description_id"),
+}
+
+UNIT_ID_CREATE = """CREATE TABLE IF NOT EXISTS "UnitID" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT,
+        "U_Id" TEXT UNIQUE,
+        "time_stamp" TEXT
+    )"""
+
+# lookup tables, the first five match the tables already in uniden.sqlite
+LOOKUP_TABLES = (
+    """CREATE TABLE IF NOT EXISTS "Mode" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Attribute Name" TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "V_Screen" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Attribute Name" TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "MonitorList" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT UNIQUE,
+        "Index" INTEGER,
+        "ListType" TEXT,
+        "Q_Key" INTEGER,
+        "N_Tag" INTEGER,
+        "DB_Counter" INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS "System" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT UNIQUE,
+        "Index" INTEGER UNIQUE,
+        "Avoid" INTEGER,
+        "SystemType" TEXT,
+        "Q_Key" INTEGER,
+        "N_Tag" INTEGER,
+        "Hold" TEXT
+    )""",
+    UNIT_ID_CREATE,
+    # raw "UID:..." values of the hits, UnitID holds the aliases by bare unit id
+    """CREATE TABLE IF NOT EXISTS "HitUnitID" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "U_Id" TEXT UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "Department" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "TGID" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "Site" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Name" TEXT UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS "ViewDescription" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        "Text" TEXT UNIQUE
+    )""",
+)
+
+# columns that change from one hit to the next, stored in hits itself
+HIT_FIELDS = (
+    "TGID:TGID",
+    "UnitID:Name",
+    "SiteFrequency:Freq",
+    "Property:Sig",
+    "Property:Mute",
+    "Property:Rssi",
+)
+
+# everything else (list, system and scanner settings) only changes now and then,
+# each distinct combination is stored once in HitSettings
+SETTINGS_FIELDS = tuple(
+    field
+    for field in SCAN_HITS_FIELDS[1:]
+    if field not in INTERNED_FIELDS and field not in HIT_FIELDS
+)
+
+_settings_columns = ", ".join(f'"{field}"' for field in SETTINGS_FIELDS)
+
+HIT_SETTINGS_CREATE = (
+    'CREATE TABLE IF NOT EXISTS "HitSettings" '
+    '("id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE, '
+    + ", ".join(f'"{field}" TEXT' for field in SETTINGS_FIELDS)
+    + ")"
+)
+
+HIT_SETTINGS_INDEX = (
+    'CREATE INDEX IF NOT EXISTS "HitSettings_values" '
+    f'ON "HitSettings" ({_settings_columns})'
+)
+
+HITS_CREATE = (
+    'CREATE TABLE IF NOT EXISTS hits ("date_code" TEXT NOT NULL PRIMARY KEY, '
+    + ", ".join(
+        f'"{id_column}" INTEGER REFERENCES "{table}"("id")'
+        for table, column, id_column in INTERNED_FIELDS.values()
+    )
+    + ', "settings_id" INTEGER REFERENCES "HitSettings"("id"), '
+    + ", ".join(f'"{field}" TEXT' for field in HIT_FIELDS)
+    + ") WITHOUT ROWID"
+)
+
+
+def _scan_hits_view():
+    """scan_hits as a view over hits, with the original column names."""
+
+    columns = ["h.date_code"]
+    joins = ['LEFT JOIN "HitSettings" s ON s.id = h.settings_id']
+    for field in SCAN_HITS_FIELDS[1:]:
+        if field in INTERNED_FIELDS:
+            table, column, id_column = INTERNED_FIELDS[field]
+            alias = f"t{len(joins)}"
+            columns.append(f'{alias}."{column}" AS "{field}"')
+            joins.append(f'LEFT JOIN "{table}" {alias} ON {alias}.id = h.{id_column}')
+        elif field in HIT_FIELDS:
+            columns.append(f'h."{field}"')
+        else:
+            columns.append(f's."{field}"')
+
+    return (
+        "CREATE VIEW scan_hits AS SELECT "
+        + ", ".join(columns)
+        + " FROM hits h "
+        + " ".join(joins)
+    )
+
+
+def _scan_hits_insert_trigger():
+    """Trigger that interns the strings of rows inserted into the view."""
+
+    statements = []
+    hits_columns = ["date_code"]
+    values = ["NEW.date_code"]
+
+    for field, (table, column, id_column) in INTERNED_FIELDS.items():
+        new_value = f'NEW."{field}"'
+        statements.append(
+            f'INSERT OR IGNORE INTO "{table}" ("{column}") '
+            f"SELECT {new_value} WHERE {new_value} IS NOT NULL;"
+        )
+        hits_columns.append(id_column)
+        values.append(f'(SELECT id FROM "{table}" WHERE "{column}" = {new_value})')
+
+    # "IS" so settings with missing (NULL) values are matched as well
+    same_settings = " AND ".join(
+        f'"{field}" IS NEW."{field}"' for field in SETTINGS_FIELDS
+    )
+    statements.append(
+        f'INSERT INTO "HitSettings" ({_settings_columns}) SELECT '
+        + ", ".join(f'NEW."{field}"' for field in SETTINGS_FIELDS)
+        + f' WHERE NOT EXISTS (SELECT 1 FROM "HitSettings" WHERE {same_settings});'
+    )
+    hits_columns.append("settings_id")
+    values.append(f'(SELECT id FROM "HitSettings" WHERE {same_settings})')
+
+    for field in HIT_FIELDS:
+        hits_columns.append(f'"{field}"')
+        values.append(f'NEW."{field}"')
+
+    statements.append(
+        f"INSERT OR IGNORE INTO hits ({', '.join(hits_columns)}) "
+        f"VALUES ({', '.join(values)});"
+    )
+
+    return (
+        "CREATE TRIGGER scan_hits_insert INSTEAD OF INSERT ON scan_hits BEGIN "
+        + " ".join(statements)
+        + " END"
+    )
+
+
+def scan_hits_is_normalized(conn):
+    """True if scan_hits is the view over the normalized tables."""
+
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'scan_hits'"
+    ).fetchone()
+
+    return row is not None and row[0] == "view"
+
+
+def create_normalized_schema(conn):
+    """Create the lookup tables, hits and the scan_hits view if missing.
+
+    Notes:
+        - scan_hits must not exist as a table, see migrate_to_normalized().
+    """
+
+    for statement in LOOKUP_TABLES:
+        conn.execute(statement)
+    conn.execute(HIT_SETTINGS_CREATE)
+    conn.execute(HIT_SETTINGS_INDEX)
+    conn.execute(HITS_CREATE)
+
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'scan_hits'"
+    ).fetchone() is None:
+        conn.execute(_scan_hits_view())
+        conn.execute(_scan_hits_insert_trigger())
+    elif scan_hits_is_normalized(conn):
+        _separate_hit_unit_ids(conn)
+
+
+def _separate_hit_unit_ids(conn):
+    """Move the unit ids of the hits out of the UnitID alias table.
+
+    Databases normalized before HitUnitID existed interned the raw hit values
+    into UnitID. They keep their ids in HitUnitID, so hits needs no update, and
+    the rows without an alias name are removed from UnitID.
+    """
+
+    (view,) = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'scan_hits'"
+    ).fetchone()
+    if '"HitUnitID"' in view:
+        return
+
+    conn.execute(
+        'INSERT OR IGNORE INTO "HitUnitID" ("id", "U_Id") SELECT "id", "U_Id" '
+        'FROM "UnitID" WHERE "id" IN (SELECT DISTINCT unit_id FROM hits)'
+    )
+    conn.execute(
+        'DELETE FROM "UnitID" WHERE "Name" IS NULL '
+        'AND "id" IN (SELECT "id" FROM "HitUnitID")'
+    )
+    # the trigger goes with the view
+    conn.execute("DROP VIEW scan_hits")
+    conn.execute(_scan_hits_view())
+    conn.execute(_scan_hits_insert_trigger())
+
+
+def migrate_to_normalized(db_path, vacuum=True):
+    """Move the rows of a wide scan_hits table into the normalized tables.
+
+    scan_hits is replaced by a view with the same columns that also accepts
+    inserts, so existing queries and save_state_to_db() keep working.
+
+    Args:
+        db_path (str): path to sqlite database
+        vacuum (bool): give the space of the old table back to the file system
+
+    Returns:
+        int: number of rows moved, 0 if the database was already normalized
+    """
+    logger = logging.getLogger("uniden_api.migrate_to_normalized")
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    try:
+        if scan_hits_is_normalized(conn):
+            with conn:
+                conn.execute("BEGIN")
+                create_normalized_schema(conn)
+            logger.info(f"{db_path} is already normalized.")
+            return 0
+
+        conn.execute("BEGIN")
+        try:
+            wide = conn.execute(
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'scan_hits'"
+            ).fetchone()
+            if wide:
+                conn.execute("ALTER TABLE scan_hits RENAME TO scan_hits_wide")
+
+            create_normalized_schema(conn)
+            create_hit_indexes(conn)
+
+            rows = 0
+            if wide:
+                # the view's trigger does the interning
+                conn.execute(
+                    f"INSERT INTO scan_hits ({_columns}) "
+                    f"SELECT {_columns} FROM scan_hits_wide"
+                )
+                rows = conn.execute("SELECT count(*) FROM hits").fetchone()[0]
+                conn.execute("DROP TABLE scan_hits_wide")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+        logger.info(f"moved {rows} rows to the normalized tables.")
+
+        if vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    return rows
+
+
+# ---- queries ---- #
+
+# query keywords and the scan_hits column they filter on
+QUERY_FIELDS = {
+    "tgid": "TGID:TGID",
+    "unit_id": "UnitID:U_Id",
+    "system": "System:Name",
+    "department": "Department:Name",
+}
+
+# name column reported next to the value in top-N results
+QUERY_NAME_FIELDS = {
+    "tgid": "TGID:Name",
+    "unit_id": "UnitID:Name",
+}
+
+
+def create_hit_indexes(conn):
+    """Indexes for lookups by time and by each QUERY_FIELDS column.
+
+    date_code is already the primary key, the other indexes include it so
+    "hits for X between start and end" is a single index range.
+    """
+
+    normalized = scan_hits_is_normalized(conn)
+    table = "hits" if normalized else "scan_hits"
+
+    for keyword, field in QUERY_FIELDS.items():
+        if normalized and field in INTERNED_FIELDS:
+            column = INTERNED_FIELDS[field][2]
+        else:
+            column = field
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{table}_{keyword}" '
+            f'ON {table} ("{column}", date_code)'
+        )
+
+
+def _hits_source(conn, fields):
+    """FROM clause and {field: sql expression} for reading fields.
+
+    In normalized storage only the lookup tables needed for fields are joined,
+    instead of every table in the scan_hits view.
+    """
+
+    if not scan_hits_is_normalized(conn):
+        return "scan_hits", {field: f'"{field}"' for field in fields}
+
+    expressions = {}
+    joins = []
+    settings = False
+    for field in fields:
+        if field == "date_code":
+            expressions[field] = "h.date_code"
+        elif field in INTERNED_FIELDS:
+            table, column, id_column = INTERNED_FIELDS[field]
+            alias = f"t{len(joins)}"
+            joins.append(f'LEFT JOIN "{table}" {alias} ON {alias}.id = h.{id_column}')
+            expressions[field] = f'{alias}."{column}"'
+        elif field in HIT_FIELDS:
+            expressions[field] = f'h."{field}"'
+        else:
+            settings = True
+            expressions[field] = f's."{field}"'
+
+    if settings:
+        joins.append('LEFT JOIN "HitSettings" s ON s.id = h.settings_id')
+
+    return " ".join(["hits h", *joins]), expressions
+
+
+def _time_code(value):
+    """date_code string for a datetime (or an isoformat string)."""
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+def _hits_where(expressions, start, end, filters):
+    """WHERE clause and parameters for a time range and QUERY_FIELDS filters."""
+
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{expressions['date_code']} >= ?")
+        params.append(_time_code(start))
+    if end is not None:
+        conditions.append(f"{expressions['date_code']} < ?")
+        params.append(_time_code(end))
+    for keyword, value in filters.items():
+        conditions.append(f"{expressions[QUERY_FIELDS[keyword]]} = ?")
+        params.append(value)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    return where, params
+
+
+def _stream(cursor, columns, batch_size=500):
+    """Yield cursor rows as dicts, fetching batch_size rows at a time."""
+
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        cursor.close()
+
+
+def iter_hits(conn, start=None, end=None, columns=None, **filters):
+    """Stream scan_hits rows, oldest first.
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        start (datetime or str): first date_code to include
+        end (datetime or str): first date_code to leave out
+        columns (list): scan_hits columns to return, defaults to all
+        **filters: tgid, unit_id, system or department value to match
+
+    Returns:
+        iterator: dict per row, {column: value}
+    """
+
+    unknown = set(filters) - set(QUERY_FIELDS)
+    if unknown:
+        raise ValueError(f"can't filter on {', '.join(sorted(unknown))}")
+
+    columns = list(columns or SCAN_HITS_FIELDS)
+    source, expressions = _hits_source(
+        conn, {"date_code", *columns, *(QUERY_FIELDS[key] for key in filters)}
+    )
+    where, params = _hits_where(expressions, start, end, filters)
+
+    cursor = conn.execute(
+        f"SELECT {', '.join(expressions[column] for column in columns)} "
+        f"FROM {source}{where} ORDER BY {expressions['date_code']}",
+        params,
+    )
+
+    return _stream(cursor, columns)
+
+
+def iter_top_hits(conn, field, start=None, end=None, limit=10, per_hour=False):
+    """Stream the values of field with the most hits.
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        field (str): tgid, unit_id, system or department
+        start (datetime or str): first date_code to include
+        end (datetime or str): first date_code to leave out
+        limit (int): number of values returned (per hour with per_hour)
+        per_hour (bool): separate top list for every hour
+
+    Returns:
+        iterator: dicts with "hour" (per_hour only), field, "name" and "hits"
+    """
+
+    value_field = QUERY_FIELDS[field]
+    name_field = QUERY_NAME_FIELDS.get(field, value_field)
+    source, expressions = _hits_source(conn, {"date_code", value_field, name_field})
+    where, params = _hits_where(expressions, start, end, {})
+
+    value = expressions[value_field]
+    # the scanner uses these for "nothing here"
+    present = f"{value} IS NOT NULL AND {value} NOT IN ('', '---')"
+    where = f"{where} AND {present}" if where else f" WHERE {present}"
+    name = f"max({expressions[name_field]})"
+
+    if per_hour:
+        hour = f"substr({expressions['date_code']}, 1, 13)"
+        sql = (
+            "SELECT hour, value, name, hits FROM ("
+            f"SELECT {hour} AS hour, {value} AS value, {name} AS name, "
+            "count(*) AS hits, row_number() OVER "
+            f"(PARTITION BY {hour} ORDER BY count(*) DESC, {value}) AS rank "
+            f"FROM {source}{where} GROUP BY {hour}, {value}"
+            ") WHERE rank <= ? ORDER BY hour, rank"
+        )
+        columns = ["hour", field, "name", "hits"]
+    else:
+        sql = (
+            f"SELECT {value}, {name}, count(*) AS hits FROM {source}{where} "
+            f"GROUP BY {value} ORDER BY hits DESC, {value} LIMIT ?"
+        )
+        columns = [field, "name", "hits"]
+
+    return _stream(conn.execute(sql, [*params, limit]), columns)
+
+
+# ---- unit id aliases ---- #
+
+UNIT_ID_UPSERT = (
+    'INSERT INTO "UnitID" ("U_Id", "Name") VALUES (?, ?) '
+    'ON CONFLICT ("U_Id") DO UPDATE SET "Name" = excluded."Name"'
+)
+
+
+def upsert_unit_id_names(conn, aliases):
+    """Store many unit id names in one transaction.
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        aliases (iterable): (unit id, name) pairs, e.g. from
+            read_unit_id_aliases()
+
+    Returns:
+        int: number of aliases stored
+    """
+
+    count = 0
+
+    def rows():
+        nonlocal count
+        for unit_id, name in aliases:
+            unit_id = str(unit_id).strip()
+            if not unit_id:
+                continue
+            count += 1
+            yield unit_id, name
+
+    conn.execute(UNIT_ID_CREATE)
+    with conn:
+        conn.executemany(UNIT_ID_UPSERT, rows())
+
+    return count
+
+
+def iter_unit_id_names(conn, batch_size=500):
+    """Stream (unit id, name) pairs, ordered by unit id."""
+
+    cursor = conn.execute('SELECT "U_Id", "Name" FROM "UnitID" ORDER BY "U_Id"')
+
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def _alias_pair(row):
+    """(unit id, name) from a csv row or json object."""
+
+    return row.get("U_Id", row.get("unit_id")), row.get("Name", row.get("name"))
+
+
+def read_unit_id_aliases(path):
+    """Read (unit id, name) pairs from a .csv or .json alias file.
+
+    Notes:
+        - csv files need a header with U_Id (or unit_id) and Name (or name)
+            columns, rows are read as they are needed.
+        - json files hold either {unit id: name} or a list of objects with the
+            same keys as the csv header.
+    """
+
+    path = Path(path)
+
+    if path.suffix.lower() == ".json":
+        with path.open("r", encoding="utf-8") as f:
+            aliases = json.load(f)
+        if isinstance(aliases, dict):
+            yield from aliases.items()
+        else:
+            yield from (_alias_pair(row) for row in aliases)
+        return
+
+    with path.open("r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield _alias_pair(row)
+
+
+def write_unit_id_aliases(path, aliases):
+    """Write (unit id, name) pairs to a .csv or .json alias file as they come.
+
+    Returns:
+        int: number of aliases written
+    """
+
+    path = Path(path)
+    count = 0
+
+    with path.open("w", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".json":
+            f.write("{")
+            for unit_id, name in aliases:
+                separator = "," if count else ""
+                f.write(f"{separator}\n  {json.dumps(unit_id)}: {json.dumps(name)}")
+                count += 1
+            f.write("\n}\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(["U_Id", "Name"])
+            for unit_id, name in aliases:
+                writer.writerow([unit_id, name])
+                count += 1
+
+    return count
+
+
+def scan_state_to_row(state, date_code=None):
+    """Values for one scan_hits row, in SCAN_HITS_FIELDS order.
+
+    Args:
+        state (dict): scanner state, either nested like GSI_OUTPUT (e.g. from
+            update_scanner_state()) or flattened by traverse_state()
+        date_code (str): time stamp of the state, defaults to the state's own
+            date_code or now (isoformat)
+
+    Returns:
+        tuple: row values
+    """
+
+    if isinstance(state.get("ScannerInfo"), dict):
+        info = state["ScannerInfo"]
+        row = []
+        for field in SCAN_HITS_FIELDS[1:]:
+            branch, attribute = field.split(":")
+            if branch == "ScannerInfo":
+                row.append(info.get(attribute))
+            elif attribute == "":
+                # only kept for reference, the table has no columns for it
+                value = info.get(branch)
+                row.append(json.dumps(value) if value is not None else None)
+            else:
+                row.append(info.get(branch, {}).get(attribute))
+    else:
+        row = [state.get(field) for field in SCAN_HITS_FIELDS[1:]]
+
+    if date_code is None:
+        date_code = state.get("date_code") or datetime.now().isoformat()
+
+    return (date_code, *row)
+
+
+class ScanStateRecorder:
+    """Queue-backed writer for scan_hits rows.
+
+    Notes:
+        - record() can be called from any thread, the writer thread owns the
+            sqlite connection.
+        - rows are committed once batch_size of them are waiting or
+            flush_interval seconds after the first one arrived.
+    """
+
+    def __init__(
+        self,
+        db_path="uniden.sqlite",
+        batch_size=100,
+        flush_interval=1.0,
+        normalized=False,
+    ):
+        """Open the database and start the writer thread.
+
+        Args:
+            db_path (str): path to sqlite database
+            batch_size (int): most rows written per transaction
+            flush_interval (float): longest time in seconds a row waits to be
+                written
+            normalized (bool): create a new database with normalized storage.
+                Existing databases are written in the layout they already
+                have, see migrate_to_normalized().
+        """
+
+        self.logger = logging.getLogger("uniden_api.ScanStateRecorder")
+
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.normalized = normalized
+        self.rows_written = 0
+
+        self._rows = queue.Queue()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._write_loop, name="scan_hits writer", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+        if self._error is not None:
+            raise self._error
+
+    def record(self, state, date_code=None):
+        """Queue a scanner state to be written, see scan_state_to_row().
+
+        The row is built right away, so the state can be changed afterwards.
+
+        Returns:
+            False: if the recorder was closed
+        """
+
+        if not self._thread.is_alive():
+            self.logger.error("recorder is closed, state not recorded.")
+            return False
+
+        self._rows.put(scan_state_to_row(state, date_code))
+
+        return True
+
+    def watch(self, scanner):
+        """Record the state of a UnidenScanner every time it changes.
+
+        Returns:
+            tuple: subscription, see UnidenScanner.unsubscribe()
+        """
+
+        return scanner.subscribe("", lambda changes: self.record(scanner.scan_state))
+
+    def flush(self):
+        """Wait until every queued row has been committed."""
+
+        if self._thread.is_alive():
+            self._rows.join()
+
+    def close(self):
+        """Write whatever is still queued, then close the database."""
+
+        if self._thread.is_alive():
+            self._rows.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_loop(self):
+        """Writer thread, collects rows into batches and commits them."""
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps the database consistent without an fsync per commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.normalized:
+                create_normalized_schema(conn)
+            # no-op if scan_hits already exists, as a table or the view
+            conn.execute(SCAN_HITS_CREATE)
+            create_hit_indexes(conn)
+            conn.commit()
+            if self.normalized and not scan_hits_is_normalized(conn):
+                self.logger.warning(
+                    f"{self.db_path} has a wide scan_hits table, "
+                    "run migrate_to_normalized() to convert it."
+                )
+        except sqlite3.Error as err:
+            self.logger.error(f"can't open {self.db_path}: {err}")
+            self._error = err
+            self._ready.set()
+            return
+
+        self._ready.set()
+
+        closing = False
+        while not closing:
+            batch = [self._rows.get()]
+            taken = 1
+
+            # give the batch up to flush_interval to fill up
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while len(batch) < self.batch_size and batch[-1] is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                    batch.append(self._rows.get(timeout=timeout))
+                    taken += 1
+            except queue.Empty:
+                pass
+
+            if batch[-1] is None:
+                closing = True
+                batch.pop()
+
+            try:
+                if batch:
+                    with conn:
+                        conn.executemany(SCAN_HITS_INSERT, batch)
+                    self.rows_written += len(batch)
+            except sqlite3.Error as err:
+                self.logger.error(f"{len(batch)} rows not written: {err}")
+            finally:
+                for _ in range(taken):
+                    self._rows.task_done()
+
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local scanner database tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser(
+        "migrate", help="convert scan_hits to normalized storage"
+    )
+    migrate.add_argument("db_path", type=str)
+    migrate.add_argument(
+        "--no-vacuum", action="store_true", help="don't shrink the file afterwards"
+    )
+
+    import_aliases = commands.add_parser(
+        "import-aliases", help="store unit id names from a .csv or .json file"
+    )
+    import_aliases.add_argument("db_path", type=str)
+    import_aliases.add_argument("alias_file", type=str)
+
+    export_aliases = commands.add_parser(
+        "export-aliases", help="write unit id names to a .csv or .json file"
+    )
+    export_aliases.add_argument("db_path", type=str)
+    export_aliases.add_argument("alias_file", type=str)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        rows = migrate_to_normalized(args.db_path, vacuum=not args.no_vacuum)
+        print(f"{rows} rows migrated.")
+    elif args.command == "import-aliases":
+        conn = sqlite3.connect(args.db_path)
+        count = upsert_unit_id_names(conn, read_unit_id_aliases(args.alias_file))
+        conn.close()
+        print(f"{count} aliases imported.")
+    elif args.command == "export-aliases":
+        conn = sqlite3.connect(args.db_path)
+        count = write_unit_id_aliases(args.alias_file, iter_unit_id_names(conn))
+        conn.close()
+        print(f"{count} aliases exported.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())